@@ -0,0 +1,95 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pipeline import iter_extracted
+
+# Global cap on model calls in flight across all files, prompts and providers
+MAX_CONCURRENT_CALLS = int(os.getenv('MAX_CONCURRENT_CALLS', '16'))
+
+# How many files may have calls scheduled at once
+MAX_FILES_IN_FLIGHT = int(os.getenv('MAX_FILES_IN_FLIGHT', '8'))
+
+class CallRunner:
+    """Runs blocking provider calls on a thread pool under a global concurrency cap."""
+
+    def __init__(self, max_concurrency=None):
+        self.max_concurrency = max_concurrency or MAX_CONCURRENT_CALLS
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool once a concurrency slot is free."""
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+
+    def close(self):
+        """Shut down the worker threads."""
+        self.executor.shutdown(wait=True)
+
+async def aiter_extracted(pdf_paths, **kwargs):
+    """Async view of pipeline.iter_extracted that does not block the event loop."""
+    loop = asyncio.get_running_loop()
+    iterator = iter_extracted(pdf_paths, **kwargs)
+    done = object()
+    try:
+        while True:
+            item = await loop.run_in_executor(None, next, iterator, done)
+            if item is done:
+                break
+            yield item
+    finally:
+        await loop.run_in_executor(None, iterator.close)
+
+async def map_extracted(pdf_paths, handler, max_files_in_flight=None, on_result=None):
+    """Extract every PDF and run handler(pdf_path, text) for each concurrently.
+
+    Files are started as soon as their text is ready, with at most
+    max_files_in_flight handlers running at once. Without on_result the
+    results are returned in the order of pdf_paths; with it each result is
+    handed over as it completes and not kept, so memory stays flat however
+    large the corpus.
+    """
+    pdf_paths = list(pdf_paths)
+    keep = on_result is None
+    order = {pdf_path: i for i, pdf_path in enumerate(pdf_paths)} if keep else None
+    results = [None] * len(pdf_paths) if keep else None
+    slots = asyncio.Semaphore(max_files_in_flight or MAX_FILES_IN_FLIGHT)
+
+    async def run_one(pdf_path, text):
+        try:
+            result = await handler(pdf_path, text)
+        finally:
+            slots.release()
+        if keep:
+            results[order[pdf_path]] = result
+        else:
+            on_result(result)
+
+    # Only unfinished handlers are held on to; a failed one leaves its
+    # exception behind so the run stops and re-raises it
+    pending = set()
+    failures = []
+
+    def finished(task):
+        pending.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            failures.append(task.exception())
+
+    async for pdf_path, text in aiter_extracted(pdf_paths):
+        await slots.acquire()
+        if failures:
+            slots.release()
+            break
+        task = asyncio.create_task(run_one(pdf_path, text))
+        pending.add(task)
+        task.add_done_callback(finished)
+    while pending and not failures:
+        await asyncio.wait(set(pending), return_when=asyncio.FIRST_EXCEPTION)
+    if failures:
+        for task in list(pending):
+            task.cancel()
+        if pending:
+            await asyncio.wait(set(pending))
+        raise failures[0]
+    return results
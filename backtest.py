@@ -1,108 +1,43 @@
 import os
+import argparse
 import pandas as pd
-from anthropic import Anthropic
-from openai import OpenAI
-import google.generativeai as genai
-import PyPDF2
-from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
-import json
-import re
-from prompts import ATTACHMENTS_PROMPT
-from dotenv import load_dotenv
+# Prompt, parser and models are declared in tasks.py
+import tasks
+from pdf_text import extract_text_from_pdf
+from pipeline import iter_extracted
+from dedup import find_duplicates, fan_out
+import circuit_breaker
+from circuit_breaker import backfill_models, backfill_files
+from result_log import ResultLog, latest_results, write_json_array
+import streaming
+from streaming import ANSWER_STOP
 
-# Load environment variables
-load_dotenv()
+# Stream responses and stop at </answer> (None waits for the full response)
+STREAM_STOP = ANSWER_STOP
 
-# API keys
-ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Append-only log of this run's results (see result_log.py, set in main)
+RESULT_LOG = None
+LOG_PATH = 'attachments_results.jsonl'
 
-# Initialize API clients
-anthropic = Anthropic(api_key=ANTHROPIC_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-genai.configure(api_key=GEMINI_API_KEY)
+# Models asked for attachments, in column order
+MODEL_KEYS = list(tasks.get_task('attachments')['models'])
 
-# Model configurations
-CLAUDE_MODELS = [
-    "claude-3-5-haiku-20241022"
-]
+def call_model(model_key, text):
+    """Ask one model for the attachments answer."""
+    return tasks.call_model('attachments', model_key, text, cache_prefix=False, stop_at=STREAM_STOP)
 
-GPT4_MODEL = "gpt-4o-mini-2024-07-18"
+def logged_call(file_name, model_key, text):
+    """Call one model, logging its answer as it completes (and replaying it on --resume)."""
+    if RESULT_LOG is None:
+        return call_model(model_key, text)
+    return RESULT_LOG.call_unit(file_name, 'attachments', model_key, lambda: call_model(model_key, text))
 
-GEMINI_MODELS = [
-    "gemini-2.0-flash",
-    "gemini-2.5-pro-exp-03-25"
-]
-
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file."""
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        print(f"Error reading PDF {pdf_path}: {str(e)}")
-        return ""
-
-def parse_attachments_response(response):
-    """Parse response for attachments prompt."""
-    try:
-        pattern = r'<answer>(.*?)</answer>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return "Error: No answer found"
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def call_claude_haiku(client, text):
-    """Query Claude Haiku with the given text and prompt."""
-    try:
-        message = client.messages.create(
-            model="claude-3-5-haiku-20241022",
-            max_tokens=1000,
-            messages=[
-                {"role": "user", "content": f"{ATTACHMENTS_PROMPT.format(content=text)}"}
-            ]
-        )
-        return message.content[0].text
-    except Exception as e:
-        print(f"Error querying Claude Haiku: {e}")
-        return f"Error: {str(e)}"
-
-def call_gpt4(text):
-    """Call GPT-4o-mini API and get response."""
-    try:
-        response = openai_client.chat.completions.create(
-            model=GPT4_MODEL,
-            temperature=0.3,
-            max_tokens=500,
-            messages=[
-                {"role": "user", "content": ATTACHMENTS_PROMPT.format(content=text)}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def call_gemini(text, model_name):
-    """Call Gemini API and get response."""
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(ATTACHMENTS_PROMPT.format(content=text))
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def process_file(pdf_path):
+def process_file(pdf_path, text=None):
     """Process a single PDF file with all models."""
     filename = os.path.basename(pdf_path)
-    text = extract_text_from_pdf(pdf_path)
+    if text is None:
+        text = extract_text_from_pdf(pdf_path)
     
     if not text:
         return {
@@ -120,45 +55,71 @@ def process_file(pdf_path):
     results = {'file_name': filename}
     raw_responses = {}
     
-    # Process with Claude Haiku
-    response = call_claude_haiku(anthropic, text)
-    raw_responses['claude_haiku'] = response
-    results['claude_haiku_attachments'] = parse_attachments_response(response)
-    
-    # Process with GPT-4o-mini
-    response = call_gpt4(text)
-    raw_responses['gpt4o_mini'] = response
-    results['gpt4o_mini_attachments'] = parse_attachments_response(response)
-    
-    # Process with Gemini Flash
-    response = call_gemini(text, GEMINI_MODELS[0])
-    raw_responses['gemini_flash'] = response
-    results['gemini_flash_attachments'] = parse_attachments_response(response)
+    # Process with each model
+    parse = tasks.get_task('attachments')['parser']
+    for model_key in MODEL_KEYS:
+        response = logged_call(filename, model_key, text)
+        raw_responses[model_key] = response
+        results[f'{model_key}_attachments'] = parse(response)
     
     # Add raw responses to results
     results['raw_responses'] = raw_responses
+    # Failed calls are not answers; --backfill re-runs them later
+    results['backfill'] = backfill_models(raw_responses)
     
     return results
 
+def model_answer(result, model_key):
+    """CSV value of one model's answer; models awaiting backfill have no answer yet."""
+    if model_key in result.get('backfill', []):
+        return "PENDING_BACKFILL"
+    return result[f'{model_key}_attachments']
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ask every model for the attachments answer for all files")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Re-run only the files whose model calls failed in the saved results")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its result log, skipping completed work")
+    return parser.parse_args()
+
 def main():
-    # Get list of PDF files
-    pdf_files = [os.path.join('files', f) for f in os.listdir('files') if f.endswith('.pdf')]
-    
-    results = []
+    global RESULT_LOG
+    args = parse_args()
+    # Stop before any work if the prompt is missing from prompts.py
+    tasks.prompt_of('attachments')
+    
+    # Every answer is appended to the log as it completes; the outputs below are built from it
+    RESULT_LOG = ResultLog(LOG_PATH, resume=args.resume or args.backfill)
+    if args.backfill:
+        pdf_files = [os.path.join('files', f) for f in backfill_files(RESULT_LOG.results())]
+        print(f"Backfilling {len(pdf_files)} files")
+    else:
+        # Get list of PDF files
+        pdf_files = [
+            os.path.join('files', f) for f in os.listdir('files')
+            if f.endswith('.pdf') and not (args.resume and RESULT_LOG.is_done(f))
+        ]
+    # Duplicate copies of a document are answered once and share the result
+    pdf_files, groups = find_duplicates(pdf_files)
     
     print(f"Processing {len(pdf_files)} files for attachments...")
-    for pdf_file in tqdm(pdf_files, desc="Processing files"):
-        result = process_file(pdf_file)
-        results.append(result)
+    try:
+        # PDFs are extracted in worker processes while the models are being called
+        for pdf_file, text in tqdm(iter_extracted(pdf_files), total=len(pdf_files), desc="Processing files"):
+            for result in fan_out([process_file(pdf_file, text)], groups):
+                RESULT_LOG.add_result(result)
+    finally:
+        RESULT_LOG.close()
     
     # Convert results to DataFrame for CSV (excluding raw responses)
     df_results = []
-    for result in results:
+    for result in latest_results(LOG_PATH):
         df_result = {
             'file_name': result['file_name'],
-            'claude_haiku_attachments': result['claude_haiku_attachments'],
-            'gpt4o_mini_attachments': result['gpt4o_mini_attachments'],
-            'gemini_flash_attachments': result['gemini_flash_attachments']
+            'claude_haiku_attachments': model_answer(result, 'claude_haiku'),
+            'gpt4o_mini_attachments': model_answer(result, 'gpt4o_mini'),
+            'gemini_flash_attachments': model_answer(result, 'gemini_flash')
         }
         df_results.append(df_result)
     
@@ -172,12 +133,16 @@ def main():
     df.to_csv(csv_filename, index=False)
     
     # Save complete results including raw responses to JSON
-    with open(json_filename, 'w') as f:
-        json.dump(results, f, indent=2)
+    count = write_json_array(json_filename, latest_results(LOG_PATH))
     
-    print(f"\nProcessed {len(results)} files. Results saved to:")
+    print(f"\nProcessed {count} files. Results saved to:")
     print(f"- {csv_filename} (parsed results)")
     print(f"- {json_filename} (complete results with raw responses)")
+    print(f"Streaming stats: {streaming.stats.summary()}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+    pending = backfill_files(latest_results(LOG_PATH))
+    if pending:
+        print(f"{len(pending)} files have failed model calls; re-run them with --backfill")
     print("\nResults summary:")
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', None)
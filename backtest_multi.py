@@ -1,182 +1,75 @@
 import os
 import pandas as pd
-from anthropic import Anthropic
-from openai import OpenAI
-import google.generativeai as genai
-import PyPDF2
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import argparse
 from tqdm import tqdm
-import json
-import re
-from prompts import (
-    ATTACHMENTS_PROMPT,
-    EXTRA_ASSOCIATIONS_PROMPT,
-    DOC_COSTS_PROMPT,
-    HOA_NAMES_PROMPT,
-    BUYER_APPROVAL_PROMPT
-)
-from dotenv import load_dotenv
+# Prompts, parsers and models are declared in tasks.py
+import tasks
+from pdf_text import extract_text_from_pdf
+from async_engine import CallRunner, map_extracted
+from batch import run_batch_mode
+from dedup import find_duplicates, fan_out
+import circuit_breaker
+from circuit_breaker import backfill_models, backfill_files
+from result_log import ResultLog, latest_results, write_json_array
+import clients
+import streaming
+from streaming import ANSWER_STOP
 
-# Load environment variables
-load_dotenv()
+# Shared API clients (pooled connections, see clients.py)
+anthropic = clients.get_client('anthropic')
+openai_client = clients.get_client('openai')
 
-# API keys
-ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+# Send the document ahead of the instructions so all five prompts share a cached prefix
+CACHE_DOCUMENT_PREFIX = True
 
-# Initialize API clients
-anthropic = Anthropic(api_key=ANTHROPIC_API_KEY)
-openai_client = OpenAI(api_key=OPENAI_API_KEY)
-genai.configure(api_key=GEMINI_API_KEY)
+# Stream responses and stop at </answer> or </answers> (None waits for the full response)
+STREAM_STOP = ANSWER_STOP
 
-# Model configurations
-CLAUDE_MODELS = [
-    "claude-3-5-haiku-20241022"
-]
+# Ask for schema-constrained JSON instead of tagged answers (set by --structured)
+STRUCTURED = False
 
-GPT4_MODEL = "gpt-4o-mini-2024-07-18"
+# Append-only log of this run's results (see result_log.py, set in main)
+RESULT_LOG = None
+LOG_PATH = 'multi_prompt_results.jsonl'
 
-GEMINI_MODELS = [
-    "gemini-2.0-flash",
-    "gemini-2.5-pro-exp-03-25"
-]
+# Prompt families run on every file, in order
+PROMPT_NAMES = ['attachments', 'extra_associations', 'doc_costs', 'hoa_names', 'buyer_approval']
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file."""
-    try:
-        with open(pdf_path, 'rb') as file:
-            reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
-    except Exception as e:
-        print(f"Error reading PDF {pdf_path}: {str(e)}")
-        return ""
+def call_model(model_key, text, prompt_name):
+    """Call one model with one prompt family's prompt."""
+    return tasks.call_model(
+        prompt_name, model_key, text, STRUCTURED, cache_prefix=CACHE_DOCUMENT_PREFIX, stop_at=STREAM_STOP
+    )
 
-def parse_attachments_response(response):
-    """Parse response for attachments prompt."""
-    try:
-        pattern = r'<answer>(.*?)</answer>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return "Error: No answer found"
-    except Exception as e:
-        return f"Error: {str(e)}"
+# Result key -> function taking (text, prompt_name)
+MODEL_CALLERS = {
+    model_key: lambda text, prompt_name, model_key=model_key: call_model(model_key, text, prompt_name)
+    for model_key in tasks.get_task(PROMPT_NAMES[0])['models']
+}
 
-def parse_extra_associations_response(response):
-    """Parse response for extra associations prompt."""
-    try:
-        pattern = r'<answer>(.*?)</answer>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return "Error: No answer found"
-    except Exception as e:
-        return f"Error: {str(e)}"
+def parse_response(prompt_name, response):
+    """Parse a response for a prompt in whichever output mode is active.
 
-def parse_doc_costs_response(response):
-    """Parse response for document costs prompt."""
-    try:
-        pattern = r'<answers>\s*1\.\s*([^\n]*)\s*2\.\s*([^\n]*)\s*3\.\s*([^\n]*)\s*4\.\s*([^\n]*)\s*</answers>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return {
-                'doc_cost': match.group(1).strip(),
-                'rush_order': match.group(2).strip(),
-                'rush_fee': match.group(3).strip(),
-                'payment_timing': match.group(4).strip()
-            }
-        return {
-            'doc_cost': "Error: No answer found",
-            'rush_order': "Error: No answer found",
-            'rush_fee': "Error: No answer found",
-            'payment_timing': "Error: No answer found"
-        }
-    except Exception as e:
-        return {
-            'doc_cost': f"Error: {str(e)}",
-            'rush_order': f"Error: {str(e)}",
-            'rush_fee': f"Error: {str(e)}",
-            'payment_timing': f"Error: {str(e)}"
-        }
+    Returns (parsed, repair_attempts); malformed answer blocks get a cheap
+    reformatting call (see repair.py) instead of a full re-run.
+    """
+    return tasks.parse_response(prompt_name, response, STRUCTURED)
 
-def parse_hoa_names_response(response):
-    """Parse response for HOA names prompt."""
-    try:
-        pattern = r'<answer>\s*HOA:\s*([^\n]*)\s*PM:\s*([^\n]*)\s*</answer>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return {
-                'hoa_name': match.group(1).strip(),
-                'pm_name': match.group(2).strip()
-            }
-        return {
-            'hoa_name': "Error: No answer found",
-            'pm_name': "Error: No answer found"
-        }
-    except Exception as e:
-        return {
-            'hoa_name': f"Error: {str(e)}",
-            'pm_name': f"Error: {str(e)}"
-        }
-
-def parse_buyer_approval_response(response):
-    """Parse response for buyer approval prompt."""
-    try:
-        pattern = r'<answer>(.*?)</answer>'
-        match = re.search(pattern, response, re.DOTALL)
-        if match:
-            return match.group(1).strip()
-        return "Error: No answer found"
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def call_claude_haiku(client, text, prompt):
-    """Query Claude Haiku with the given text and prompt."""
-    try:
-        message = client.messages.create(
-            model="claude-3-5-haiku-20241022",
-            max_tokens=1000,
-            messages=[
-                {"role": "user", "content": f"{prompt.format(content=text)}"}
-            ]
-        )
-        return message.content[0].text
-    except Exception as e:
-        print(f"Error querying Claude Haiku: {e}")
-        return f"Error: {str(e)}"
+def logged_caller(file_name, model_key, caller):
+    """Wrap a model caller so its answers are logged as they complete (and replayed on --resume)."""
+    if RESULT_LOG is None:
+        return caller
 
-def call_gpt4(text, prompt):
-    """Call GPT-4o-mini API and get response."""
-    try:
-        response = openai_client.chat.completions.create(
-            model=GPT4_MODEL,
-            temperature=0.3,
-            max_tokens=500,
-            messages=[
-                {"role": "user", "content": prompt.format(content=text)}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-def call_gemini(text, model_name, prompt):
-    """Call Gemini API and get response."""
-    try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt.format(content=text))
-        return response.text
-    except Exception as e:
-        return f"Error: {str(e)}"
+    def call(text, prompt_name):
+        return RESULT_LOG.call_unit(file_name, prompt_name, model_key, lambda: caller(text, prompt_name))
+    return call
 
-def process_file(pdf_path):
+def process_file(pdf_path, text=None):
     """Process a single PDF file with all prompts and models."""
     filename = os.path.basename(pdf_path)
-    text = extract_text_from_pdf(pdf_path)
+    if text is None:
+        text = extract_text_from_pdf(pdf_path)
     
     if not text:
         empty_result = {
@@ -221,56 +114,161 @@ def process_file(pdf_path):
     
     results = {'file_name': filename}
     raw_responses = {}
-    
-    # Define prompts and their parsers
-    prompts_data = {
-        'attachments': (ATTACHMENTS_PROMPT, parse_attachments_response),
-        'extra_associations': (EXTRA_ASSOCIATIONS_PROMPT, parse_extra_associations_response),
-        'doc_costs': (DOC_COSTS_PROMPT, parse_doc_costs_response),
-        'hoa_names': (HOA_NAMES_PROMPT, parse_hoa_names_response),
-        'buyer_approval': (BUYER_APPROVAL_PROMPT, parse_buyer_approval_response)
-    }
+    repair_attempts = {}
     
     # Process with all models
-    for prompt_name, (prompt, parser) in prompts_data.items():
+    for prompt_name in PROMPT_NAMES:
         # Initialize results dictionary for this prompt
         if prompt_name not in results:
             results[prompt_name] = {}
         
-        # Claude Haiku
-        response = call_claude_haiku(anthropic, text, prompt)
-        raw_responses[f'claude_haiku_{prompt_name}'] = response
-        results[prompt_name]['claude_haiku'] = parser(response)
-        
-        # GPT-4o-mini
-        response = call_gpt4(text, prompt)
-        raw_responses[f'gpt4o_mini_{prompt_name}'] = response
-        results[prompt_name]['gpt4o_mini'] = parser(response)
-        
-        # Gemini Flash
-        response = call_gemini(text, GEMINI_MODELS[0], prompt)
-        raw_responses[f'gemini_flash_{prompt_name}'] = response
-        results[prompt_name]['gemini_flash'] = parser(response)
+        for model_key, caller in MODEL_CALLERS.items():
+            response = logged_caller(filename, model_key, caller)(text, prompt_name)
+            raw_responses[f'{model_key}_{prompt_name}'] = response
+            results[prompt_name][model_key], repair_attempts[f'{model_key}_{prompt_name}'] = \
+                parse_response(prompt_name, response)
     
     # Add raw responses to results
     results['raw_responses'] = raw_responses
+    results['repair_attempts'] = repair_attempts
+    # Failed calls ('<model>_<prompt>') are not answers; --backfill re-runs them later
+    results['backfill'] = backfill_models(raw_responses)
     
     return results
 
+async def process_file_async(pdf_path, text, runner):
+    """Process a single PDF file with all prompts and models concurrently."""
+    if not text:
+        return process_file(pdf_path, text)
+    
+    filename = os.path.basename(pdf_path)
+    results = {'file_name': filename}
+    raw_responses = {}
+    repair_attempts = {}
+    
+    prompt_names = PROMPT_NAMES
+    
+    async def run_model(model_key, caller):
+        """Run every prompt for one model, returning {prompt_name: response}."""
+        responses = {}
+        pending = prompt_names
+        if CACHE_DOCUMENT_PREFIX:
+            # The first call writes the shared document prefix to the provider's
+            # cache; the remaining prompts then read it instead of resending it
+            first = prompt_names[0]
+            responses[first] = await runner.run(caller, text, first)
+            pending = prompt_names[1:]
+        rest = await asyncio.gather(*[
+            runner.run(caller, text, name) for name in pending
+        ])
+        responses.update(zip(pending, rest))
+        return responses
+    
+    # Models run side by side; the runner enforces the global cap
+    model_keys = list(MODEL_CALLERS)
+    per_model = await asyncio.gather(*[
+        run_model(model_key, logged_caller(filename, model_key, MODEL_CALLERS[model_key]))
+        for model_key in model_keys
+    ])
+    
+    for model_key, responses in zip(model_keys, per_model):
+        for prompt_name in prompt_names:
+            raw_responses[f'{model_key}_{prompt_name}'] = responses[prompt_name]
+    
+    # Parsing may make repair calls, so it is scheduled like a model call
+    pairs = [(model_key, prompt_name) for model_key in model_keys for prompt_name in prompt_names]
+    parsed = await asyncio.gather(*[
+        runner.run(parse_response, prompt_name, raw_responses[f'{model_key}_{prompt_name}'])
+        for model_key, prompt_name in pairs
+    ])
+    for (model_key, prompt_name), (answer, attempts) in zip(pairs, parsed):
+        results.setdefault(prompt_name, {})[model_key] = answer
+        repair_attempts[f'{model_key}_{prompt_name}'] = attempts
+    
+    # Add raw responses to results
+    results['raw_responses'] = raw_responses
+    results['repair_attempts'] = repair_attempts
+    # Failed calls ('<model>_<prompt>') are not answers; --backfill re-runs them later
+    results['backfill'] = backfill_models(raw_responses)
+    
+    return results
+
+async def run_backtest(pdf_files, record, max_concurrency=None):
+    """Run every file through every prompt and model with bounded concurrency.
+
+    Each file's result is handed to record() as soon as it is ready rather
+    than kept in memory.
+    """
+    runner = CallRunner(max_concurrency)
+
+    async def run_one(pdf_path, text):
+        record(await process_file_async(pdf_path, text, runner))
+
+    try:
+        with tqdm(total=len(pdf_files), desc="Processing files") as progress:
+            await map_extracted(pdf_files, run_one, on_result=lambda result: progress.update(1))
+    finally:
+        runner.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run every prompt through every model for all files")
+    parser.add_argument('--batch', action='store_true',
+                        help="Send Claude and GPT requests through the provider batch APIs first")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Send every file to the models even when it duplicates another")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of tagged answers")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Re-run only the files whose model calls failed in the saved results")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its result log, skipping completed work")
+    return parser.parse_args()
+
 def main():
-    # Get list of PDF files
-    pdf_files = [os.path.join('files', f) for f in os.listdir('files') if f.endswith('.pdf')]
+    global STRUCTURED, RESULT_LOG
+    args = parse_args()
+    STRUCTURED = args.structured
+    # Stop before any work if a prompt is missing from prompts.py
+    for prompt_name in PROMPT_NAMES:
+        tasks.prompt_of(prompt_name)
     
-    results = []
+    # Every answer is appended to the log as it completes; the outputs below are built from it
+    RESULT_LOG = ResultLog(LOG_PATH, resume=args.resume or args.backfill)
+    if args.backfill:
+        pdf_files = [os.path.join('files', f) for f in backfill_files(RESULT_LOG.results())]
+        print(f"Backfilling {len(pdf_files)} files")
+    else:
+        # Get list of PDF files
+        pdf_files = [
+            os.path.join('files', f) for f in os.listdir('files')
+            if f.endswith('.pdf') and not (args.resume and RESULT_LOG.is_done(f))
+        ]
+    groups = None
+    if not args.no_dedup:
+        # Duplicate copies of a document are answered once and share the result
+        pdf_files, groups = find_duplicates(pdf_files)
     
-    print(f"Processing {len(pdf_files)} files for multiple prompts...")
-    for pdf_file in tqdm(pdf_files, desc="Processing files"):
-        result = process_file(pdf_file)
-        results.append(result)
+    def record(result):
+        for logged in fan_out([result], groups) if groups is not None else [result]:
+            RESULT_LOG.add_result(logged)
+    
+    try:
+        if args.batch:
+            # Answers land in the response cache, so the run below is mostly cache hits
+            run_batch_mode(pdf_files, process_file, 'multi_prompt_batch_jobs.json', anthropic, openai_client)
+        
+        print(f"Processing {len(pdf_files)} files for multiple prompts...")
+        # PDFs are extracted in worker processes while all model calls run concurrently
+        asyncio.run(run_backtest(pdf_files, record))
+    finally:
+        RESULT_LOG.close()
+    print(f"Connection pool stats: {clients.pool_stats()}")
+    print(f"Streaming stats: {streaming.stats.summary()}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
     
     # Convert results to DataFrame for CSV (excluding raw responses)
     df_results = []
-    for result in results:
+    for result in latest_results(LOG_PATH):
         df_result = {
             'file_name': result['file_name'],
             # Attachments
@@ -318,12 +316,14 @@ def main():
     df.to_csv(csv_filename, index=False)
     
     # Save complete results including raw responses to JSON
-    with open(json_filename, 'w') as f:
-        json.dump(results, f, indent=2)
+    count = write_json_array(json_filename, latest_results(LOG_PATH))
     
-    print(f"\nProcessed {len(results)} files. Results saved to:")
+    print(f"\nProcessed {count} files. Results saved to:")
     print(f"- {csv_filename} (parsed results)")
     print(f"- {json_filename} (complete results with raw responses)")
+    pending = backfill_files(latest_results(LOG_PATH))
+    if pending:
+        print(f"{len(pending)} files have failed model calls; re-run them with --backfill")
     print("\nResults summary:")
     pd.set_option('display.max_columns', None)
     pd.set_option('display.width', None)
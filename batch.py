@@ -0,0 +1,205 @@
+import os
+import io
+import json
+import time
+import llm
+import telemetry
+from pipeline import iter_extracted
+from response_cache import get_cache, make_key
+
+# Seconds between status checks while batch jobs are running
+POLL_INTERVAL = int(os.getenv('BATCH_POLL_INTERVAL', '60'))
+
+# Requests per submitted job (well under both providers' per-batch limits)
+MAX_REQUESTS_PER_JOB = 10000
+
+# Status values meaning a job will make no further progress
+ANTHROPIC_DONE = {'ended'}
+OPENAI_DONE = {'completed', 'failed', 'expired', 'cancelled'}
+
+class BatchCollector:
+    """Collects uncached Anthropic/OpenAI requests while a script does a dry pass."""
+
+    def __init__(self):
+        self.requests = {}
+
+    def add(self, provider, model, params, template, text, body):
+        """Record one request; custom_id is the response cache key."""
+        key, fields = make_key(provider, model, params, template, text)
+        self.requests[key] = {
+            'custom_id': key,
+            'provider': provider,
+            'model': model,
+            'fields': fields,
+            'body': body
+        }
+        return None
+
+def collect_requests(pdf_files, process_file):
+    """Run process_file over every PDF with the llm layer recording requests instead of sending them."""
+    collector = BatchCollector()
+    llm.set_collector(collector)
+    try:
+        for pdf_file, text in iter_extracted(pdf_files):
+            process_file(pdf_file, text)
+    finally:
+        llm.set_collector(None)
+    return list(collector.requests.values())
+
+def load_state(state_path):
+    """Load persisted batch job state, or an empty state."""
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    return {'jobs': []}
+
+def save_state(state, state_path):
+    """Atomically persist batch job state."""
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def submit_anthropic(client, requests):
+    """Submit requests as one Anthropic Message Batch and return its id."""
+    batch = client.messages.batches.create(requests=[
+        {'custom_id': r['custom_id'], 'params': r['body']} for r in requests
+    ])
+    return batch.id
+
+def submit_openai(client, requests):
+    """Upload requests as a JSONL file, start an OpenAI Batch and return its id."""
+    lines = [
+        json.dumps({
+            'custom_id': r['custom_id'],
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': r['body']
+        })
+        for r in requests
+    ]
+    data = ("\n".join(lines) + "\n").encode('utf-8')
+    input_file = client.files.create(file=('batch_input.jsonl', io.BytesIO(data)), purpose='batch')
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint='/v1/chat/completions',
+        completion_window='24h'
+    )
+    return batch.id
+
+def submit_requests(requests, anthropic_client, openai_client):
+    """Submit collected requests grouped by provider and model, yielding a job record per batch."""
+    groups = {}
+    for request in requests:
+        groups.setdefault((request['provider'], request['model']), []).append(request)
+
+    for (provider, model), group in groups.items():
+        for chunk in _chunks(group, MAX_REQUESTS_PER_JOB):
+            if provider == 'anthropic':
+                batch_id = submit_anthropic(anthropic_client, chunk)
+            else:
+                batch_id = submit_openai(openai_client, chunk)
+            print(f"Submitted {provider} batch {batch_id} ({model}, {len(chunk)} requests)")
+            yield {
+                'provider': provider,
+                'model': model,
+                'batch_id': batch_id,
+                'status': 'submitted',
+                'fields': {r['custom_id']: r['fields'] for r in chunk}
+            }
+
+def job_status(job, anthropic_client, openai_client):
+    """Return (status, finished) for a submitted job."""
+    if job['provider'] == 'anthropic':
+        batch = anthropic_client.messages.batches.retrieve(job['batch_id'])
+        return batch.processing_status, batch.processing_status in ANTHROPIC_DONE
+    batch = openai_client.batches.retrieve(job['batch_id'])
+    return batch.status, batch.status in OPENAI_DONE
+
+def fetch_anthropic_results(client, batch_id):
+    """Yield (custom_id, text, usage) for every succeeded request in an Anthropic batch."""
+    for entry in client.messages.batches.results(batch_id):
+        if entry.result.type == 'succeeded':
+            message = entry.result.message
+            yield entry.custom_id, llm.anthropic_text(message), llm.anthropic_usage(message)
+
+def fetch_openai_results(client, batch_id):
+    """Yield (custom_id, text, usage) for every succeeded request in an OpenAI batch."""
+    batch = client.batches.retrieve(batch_id)
+    if not batch.output_file_id:
+        return
+    content = client.files.content(batch.output_file_id).text
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        response = entry.get('response') or {}
+        if response.get('status_code') == 200:
+            body = response['body']
+            usage = llm.openai_usage(body['usage']) if body.get('usage') else None
+            yield entry['custom_id'], body['choices'][0]['message']['content'], usage
+
+def merge_job(job, anthropic_client, openai_client):
+    """Store a finished job's responses in the response cache; return how many were stored."""
+    cache = get_cache()
+    if job['provider'] == 'anthropic':
+        results = fetch_anthropic_results(anthropic_client, job['batch_id'])
+    else:
+        results = fetch_openai_results(openai_client, job['batch_id'])
+
+    stored = 0
+    for custom_id, text, usage in results:
+        fields = job['fields'].get(custom_id)
+        if fields is None or text is None:
+            continue
+        cache.put(custom_id, fields, text)
+        if usage is not None:
+            telemetry.record_batch_result(fields, *usage)
+        stored += 1
+    return stored
+
+def run_batch_mode(pdf_files, process_file, state_path, anthropic_client, openai_client, poll_interval=None):
+    """Submit every uncached request as provider batch jobs, wait, and merge into the cache.
+
+    Job ids are persisted in state_path so an interrupted run resumes polling
+    instead of resubmitting. Once this returns, the script's normal pass finds
+    the batched answers in the response cache; Gemini calls and any failed
+    batch requests are made synchronously in that pass.
+    """
+    poll_interval = poll_interval or POLL_INTERVAL
+    state = load_state(state_path)
+
+    if not state['jobs']:
+        requests = collect_requests(pdf_files, process_file)
+        print(f"Collected {len(requests)} uncached requests for batch submission")
+        if not requests:
+            return
+        # Save after every submission so no paid-for job id is ever lost
+        for job in submit_requests(requests, anthropic_client, openai_client):
+            state['jobs'].append(job)
+            save_state(state, state_path)
+    else:
+        print(f"Resuming {len(state['jobs'])} batch jobs from {state_path}")
+
+    while True:
+        pending = [job for job in state['jobs'] if job['status'] != 'merged']
+        if not pending:
+            break
+        for job in pending:
+            status, finished = job_status(job, anthropic_client, openai_client)
+            if finished:
+                stored = merge_job(job, anthropic_client, openai_client)
+                print(f"{job['provider']} batch {job['batch_id']} {status}: "
+                      f"{stored}/{len(job['fields'])} responses merged")
+                job['status'] = 'merged'
+            else:
+                job['status'] = status
+        save_state(state, state_path)
+        if any(job['status'] != 'merged' for job in state['jobs']):
+            time.sleep(poll_interval)
+
+    os.remove(state_path)
@@ -0,0 +1,112 @@
+import os
+import hashlib
+from collections import Counter
+
+# Share of documents where a second model is asked anyway to spot-check the primary
+SPOT_CHECK_RATE = float(os.getenv('CASCADE_SPOT_CHECK_RATE', '0.1'))
+
+def _normalize(value):
+    return " ".join(str(value).split()).lower()
+
+def _is_unclear(value):
+    # Answers may carry an explanation after the word, e.g. "Unclear - two dates given"
+    return _normalize(value).startswith('unclear')
+
+def is_failed(result):
+    """True when a parsed result is a parse or call failure."""
+    if isinstance(result, dict):
+        return 'error' in result
+    return str(result).startswith('Error')
+
+def unclear_fields(result):
+    """Names of fields answered "Unclear" (the whole answer for string results)."""
+    if not isinstance(result, dict):
+        return ['answer'] if _is_unclear(result) else []
+    return [field for field, value in result.items() if _is_unclear(value)]
+
+def disagreement(a, b):
+    """Names of fields where two parsed results differ."""
+    if not isinstance(a, dict) or not isinstance(b, dict):
+        return [] if _normalize(a) == _normalize(b) else ['answer']
+    return [field for field in a if _normalize(a[field]) != _normalize(b.get(field, ''))]
+
+def should_spot_check(text, rate=None):
+    """Deterministically pick about `rate` of documents for a second-model check."""
+    rate = SPOT_CHECK_RATE if rate is None else rate
+    bucket = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:8], 16) / 0xFFFFFFFF
+    return bucket < rate
+
+def vote(results):
+    """Combine parsed results field by field; ties go to the earlier (cheaper) model."""
+    usable = [r for r in results if not is_failed(r)]
+    if not usable:
+        return results[0]
+    if not isinstance(usable[0], dict):
+        counts = Counter(_normalize(r) for r in usable if not _is_unclear(r))
+        if not counts:
+            return usable[0]
+        winner = counts.most_common(1)[0][0]
+        return next(r for r in usable if _normalize(r) == winner)
+
+    combined = {}
+    for field in usable[0]:
+        answers = [r[field] for r in usable if field in r]
+        confident = [a for a in answers if not _is_unclear(a)] or answers
+        counts = Counter(_normalize(a) for a in confident)
+        winner = counts.most_common(1)[0][0]
+        combined[field] = next(a for a in confident if _normalize(a) == winner)
+    return combined
+
+def run_cascade(callers, parse, text, spot_check_rate=None):
+    """Answer with the first model in `callers`, escalating only when needed.
+
+    callers is an ordered list of (model_key, fn(text) -> response), cheapest
+    first. The next model is called when the primary answer fails to parse,
+    has an "Unclear" field, or (for spot-checked documents) a second model
+    disagrees; then every remaining model is called and the answers are
+    combined by vote. Returns a dict with the final result, the tier that
+    answered ('primary', 'spot_check' or 'ensemble'), the reason for
+    escalating, and the parsed and raw answers of every model called.
+    """
+    responses = {}
+    parsed = {}
+
+    def ask(model_key, fn):
+        responses[model_key] = fn(text)
+        parsed[model_key] = parse(responses[model_key])
+        return parsed[model_key]
+
+    primary_key, primary_fn = callers[0]
+    primary = ask(primary_key, primary_fn)
+    tier = 'primary'
+    reason = None
+
+    if is_failed(primary):
+        reason = 'parse_failed'
+    elif unclear_fields(primary):
+        reason = 'unclear: ' + ", ".join(unclear_fields(primary))
+    elif len(callers) > 1 and should_spot_check(text, spot_check_rate):
+        check_key, check_fn = callers[1]
+        differing = disagreement(primary, ask(check_key, check_fn))
+        if differing:
+            reason = 'spot_check_disagreed: ' + ", ".join(differing)
+        else:
+            tier = 'spot_check'
+
+    if reason and len(callers) > 1:
+        for model_key, fn in callers[1:]:
+            if model_key not in parsed:
+                ask(model_key, fn)
+        tier = 'ensemble'
+        final = vote([parsed[model_key] for model_key, _ in callers])
+    else:
+        final = primary
+
+    return {
+        'result': final,
+        'tier': tier,
+        'escalation_reason': reason,
+        'models_called': list(parsed),
+        'parsed': parsed,
+        'raw_responses': responses
+    }
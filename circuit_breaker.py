@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+from rate_limit import status_code
+
+# Consecutive failures that open a provider/model circuit
+FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+
+# Seconds an open circuit fails fast before letting probe requests through
+RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_SECONDS', '30'))
+
+# Probe requests allowed at once while half-open
+HALF_OPEN_PROBES = int(os.getenv('CIRCUIT_HALF_OPEN_PROBES', '1'))
+
+# Failures that mean the provider is down or unusable, not that one request was bad
+# (429s and 4xx request errors show the provider is up and count as successes)
+OUTAGE_STATUS = {401, 403, 408, 500, 502, 503, 504, 529}
+OUTAGE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError', 'InternalServerError', 'ServiceUnavailable',
+    'DeadlineExceeded', 'Unauthenticated', 'PermissionDenied', 'ConnectError', 'ConnectTimeout',
+    'ReadTimeout', 'RemoteProtocolError'
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider/model whose circuit is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"Circuit open for {name} (next probe in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+def is_outage(error):
+    """Whether an error counts towards opening the circuit."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if status_code(error) in OUTAGE_STATUS:
+        return True
+    return type(error).__name__ in OUTAGE_ERRORS
+
+class CircuitBreaker:
+    """Closed -> open after consecutive failures -> half-open probes -> closed on success."""
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None, half_open_probes=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or FAILURE_THRESHOLD
+        self.reset_timeout = RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self.half_open_probes = half_open_probes or HALF_OPEN_PROBES
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        """Return if a request may be sent, or raise CircuitOpenError."""
+        with self.lock:
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+                self.probes = 0
+                print(f"{self.name}: circuit half-open, probing")
+            if self.state == HALF_OPEN:
+                if self.probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 0)
+                self.probes += 1
+
+    def is_open(self):
+        """True unless the circuit is closed (retrying into an open circuit is pointless)."""
+        with self.lock:
+            return self.state != CLOSED
+
+    def record_success(self):
+        with self.lock:
+            if self.state == HALF_OPEN:
+                print(f"{self.name}: circuit closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.probes = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                print(f"{self.name}: circuit open after {self.failures} consecutive failures, "
+                      f"failing fast for {self.reset_timeout:.0f}s")
+
+    def record(self, error):
+        """Record the outcome of one request (error is None on success)."""
+        if error is not None and is_outage(error):
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def summary(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected
+            }
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_breaker(provider, model):
+    """Return the shared circuit breaker for a provider/model pair."""
+    key = (provider, model)
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(f"{provider}/{model}")
+        return _breakers[key]
+
+def summary():
+    """State of every circuit used in this run."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.summary() for breaker in breakers}
+
+def needs_backfill(response):
+    """True when a raw response is a failed call rather than a model answer.
+
+    Such results are not final: they are marked for backfill and re-run
+    later (e.g. once an open circuit has closed).
+    """
+    return not response or str(response).startswith('Error')
+
+def backfill_models(raw_responses):
+    """Keys of the raw responses (one per model) that need backfill."""
+    return [key for key, response in raw_responses.items() if needs_backfill(response)]
+
+def backfill_files(results):
+    """File names of saved results that still have models marked for backfill."""
+    return [result['file_name'] for result in results if result.get('backfill')]
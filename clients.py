@@ -0,0 +1,180 @@
+import os
+import threading
+import httpx
+from anthropic import Anthropic
+from openai import OpenAI
+import google.generativeai as genai
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# HTTP connection pool settings shared by the Anthropic and OpenAI clients
+POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', '64'))
+KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_KEEPALIVE_CONNECTIONS', '32'))
+KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', '90'))
+CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+READ_TIMEOUT = float(os.getenv('LLM_READ_TIMEOUT', '180'))
+
+# Gemini transport ("grpc" or "rest")
+GEMINI_TRANSPORT = os.getenv('GEMINI_TRANSPORT') or None
+
+# Alternative Gemini endpoint, e.g. the local mock server (implies the REST transport)
+GEMINI_BASE_URL = os.getenv('GEMINI_BASE_URL') or None
+
+class PoolStats:
+    """Counts requests and connection setups made through one HTTP client."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.in_flight = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def _trace(self, event_name, info):
+        # httpcore reports connection setup through the request "trace" extension
+        if event_name == 'connection.connect_tcp.complete':
+            with self.lock:
+                self.connections_opened += 1
+        elif event_name == 'connection.start_tls.complete':
+            with self.lock:
+                self.tls_handshakes += 1
+
+    def started(self, request):
+        request.extensions['trace'] = self._trace
+        with self.lock:
+            self.requests += 1
+            self.in_flight += 1
+
+    def finished(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def snapshot(self, transport=None):
+        with self.lock:
+            stats = {
+                'requests': self.requests,
+                'in_flight': self.in_flight,
+                'connections_opened': self.connections_opened,
+                'tls_handshakes': self.tls_handshakes
+            }
+        pool = getattr(transport, '_pool', None)
+        if pool is not None:
+            connections = list(pool.connections)
+            stats['open_connections'] = len(connections)
+            stats['idle_connections'] = sum(c.is_idle() for c in connections)
+        return stats
+
+class CountingTransport(httpx.HTTPTransport):
+    """HTTPTransport that reports requests into a PoolStats.
+
+    A request stops counting as in flight once its response headers arrive
+    or it fails (connect errors and timeouts included).
+    """
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    def handle_request(self, request):
+        self.stats.started(request)
+        try:
+            return super().handle_request(request)
+        finally:
+            self.stats.finished()
+
+def make_http_client(stats):
+    """Create a pooled, keep-alive httpx client that reports into stats."""
+    transport = CountingTransport(
+        stats,
+        limits=httpx.Limits(
+            max_connections=POOL_SIZE,
+            max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY
+        ),
+        retries=0
+    )
+    client = httpx.Client(
+        transport=transport,
+        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+    )
+    return client, transport
+
+class ClientRegistry:
+    """Owns one long-lived client per provider and one Gemini model object per model."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.transports = {}
+        self.stats = {}
+        self.gemini_models = {}
+        self.gemini_configured = False
+
+    def _build(self, provider):
+        stats = PoolStats()
+        http_client, transport = make_http_client(stats)
+        if provider == 'anthropic':
+            # Our rate limiter handles retries, so the SDK's own are turned off
+            client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'), http_client=http_client, max_retries=0)
+        elif provider == 'openai':
+            client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'), http_client=http_client, max_retries=0)
+        else:
+            raise ValueError(f"Unknown provider: {provider}")
+        self.stats[provider] = stats
+        self.transports[provider] = transport
+        return client
+
+    def get(self, provider):
+        """Return the shared client for 'anthropic' or 'openai'."""
+        with self.lock:
+            if provider not in self.clients:
+                self.clients[provider] = self._build(provider)
+            return self.clients[provider]
+
+    def gemini_model(self, model_name):
+        """Return the shared GenerativeModel for a Gemini model name."""
+        with self.lock:
+            if not self.gemini_configured:
+                kwargs = {'api_key': os.getenv('GEMINI_API_KEY')}
+                if GEMINI_TRANSPORT:
+                    kwargs['transport'] = GEMINI_TRANSPORT
+                if GEMINI_BASE_URL:
+                    kwargs['transport'] = 'rest'
+                    kwargs['client_options'] = {'api_endpoint': GEMINI_BASE_URL}
+                genai.configure(**kwargs)
+                self.gemini_configured = True
+            if model_name not in self.gemini_models:
+                self.gemini_models[model_name] = genai.GenerativeModel(model_name)
+            return self.gemini_models[model_name]
+
+    def pool_stats(self):
+        """Return connection pool statistics per provider."""
+        with self.lock:
+            providers = list(self.stats)
+        stats = {p: self.stats[p].snapshot(self.transports[p]) for p in providers}
+        if self.gemini_models:
+            stats['gemini'] = {'models': sorted(self.gemini_models)}
+        return stats
+
+    def close(self):
+        """Close every HTTP client."""
+        with self.lock:
+            for client in self.clients.values():
+                client.close()
+            self.clients.clear()
+
+registry = ClientRegistry()
+
+def get_client(provider):
+    """Return the process-wide client for a provider."""
+    return registry.get(provider)
+
+def get_gemini_model(model_name):
+    """Return the process-wide GenerativeModel for a Gemini model."""
+    return registry.gemini_model(model_name)
+
+def pool_stats():
+    """Return connection pool statistics for every client created so far."""
+    return registry.pool_stats()
@@ -0,0 +1,229 @@
+import os
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from tqdm import tqdm
+import tasks
+
+# Output budget per call in each mode (Claude needs one; other providers keep their defaults)
+SPLIT_MAX_TOKENS = 4000
+COMBINED_MAX_TOKENS = 8192
+
+from tasks import SYSTEM_PROMPT, COMBINED_MODELS
+from prompts import COMBINED_FAMILIES, COMBINED_EXTRACTION_PROMPT
+from parsers import COMBINED_PARSERS, parse_combined_response
+from pdf_text import extract_text_from_pdf
+from pipeline import iter_extracted
+from rate_limit import CHARS_PER_TOKEN
+import response_cache
+import telemetry
+
+MODELS = list(COMBINED_MODELS)
+
+def call_model(model_key, template, text, max_tokens):
+    """Call one model with a template and return (response, seconds, (input, output) tokens)."""
+    spec = COMBINED_MODELS[model_key]
+    if spec['provider'] == 'anthropic':
+        spec = dict(spec, max_tokens=max_tokens)
+    start = time.perf_counter()
+    try:
+        response = tasks.call_template(spec, template, text, system=SYSTEM_PROMPT)
+    except Exception as e:
+        response = f"Error calling {model_key}: {e}"
+    return response, time.perf_counter() - start, call_tokens(template, text, response)
+
+def estimate_call_tokens(template, text, response):
+    """Estimate (input, output) tokens for a call from character counts."""
+    prompt_chars = len(SYSTEM_PROMPT) + len(template) + len(text)
+    return prompt_chars // CHARS_PER_TOKEN, len(response or "") // CHARS_PER_TOKEN
+
+def call_tokens(template, text, response):
+    """(input, output) tokens of the call just made on this thread.
+
+    Uses the usage the provider reported (see telemetry.py); cached answers
+    and calls without usage fall back to the character estimate.
+    """
+    record = telemetry.last_record()
+    if record is not None and 'input_tokens' in record and not record['usage_estimated']:
+        return record['input_tokens'], record['output_tokens']
+    return estimate_call_tokens(template, text, response)
+
+def run_split(model_key, text):
+    """Answer every family with its own call, issued concurrently."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(COMBINED_FAMILIES)) as pool:
+        futures = {
+            name: pool.submit(call_model, model_key, template, text, SPLIT_MAX_TOKENS)
+            for name, template in COMBINED_FAMILIES
+        }
+        calls = {name: future.result() for name, future in futures.items()}
+    wall = time.perf_counter() - start
+
+    responses = {name: response for name, (response, _, _) in calls.items()}
+    results = {}
+    input_tokens = output_tokens = 0
+    for name, _ in COMBINED_FAMILIES:
+        results[name] = COMBINED_PARSERS[name](responses[name])
+        tokens_in, tokens_out = calls[name][2]
+        input_tokens += tokens_in
+        output_tokens += tokens_out
+    return {
+        'results': results,
+        'raw_responses': responses,
+        'calls': len(COMBINED_FAMILIES),
+        'wall_seconds': wall,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens
+    }
+
+def run_combined(model_key, text):
+    """Answer every family with a single call."""
+    response, wall, (input_tokens, output_tokens) = call_model(
+        model_key, COMBINED_EXTRACTION_PROMPT, text, COMBINED_MAX_TOKENS
+    )
+    return {
+        'results': parse_combined_response(response),
+        'raw_responses': {'combined': response},
+        'calls': 1,
+        'wall_seconds': wall,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens
+    }
+
+def process_file(file_path, text=None, modes=('split', 'combined')):
+    """Run a file through every model in each requested mode."""
+    if text is None:
+        text = extract_text_from_pdf(file_path)
+    result = {"file_name": os.path.basename(file_path)}
+    if not text:
+        result["error"] = "Failed to extract text from PDF"
+        return result
+
+    for mode in modes:
+        runner = run_split if mode == 'split' else run_combined
+        result[mode] = {model_key: runner(model_key, text) for model_key in MODELS}
+    return result
+
+def _normalize(value):
+    return " ".join(str(value).split()).lower()
+
+def load_truth(path):
+    """Load expected values keyed by file name, then by `family.field` column."""
+    with open(path, newline='') as f:
+        return {row['file_name']: row for row in csv.DictReader(f)}
+
+def score_fields(results, reference):
+    """Return (matching, compared) counts of fields equal to a reference.
+
+    `reference` maps `family.field` to the expected value; empty values are skipped.
+    """
+    matching = compared = 0
+    for family, fields in results.items():
+        for field, value in fields.items():
+            expected = reference.get(f"{family}.{field}")
+            if expected in (None, ""):
+                continue
+            compared += 1
+            matching += _normalize(value) == _normalize(expected)
+    return matching, compared
+
+def flatten(results):
+    """Turn {family: {field: value}} into {family.field: value}."""
+    return {
+        f"{family}.{field}": value
+        for family, fields in results.items()
+        for field, value in fields.items()
+    }
+
+def summarize(results, truth=None):
+    """Build one benchmark row per (mode, model)."""
+    rows = []
+    for mode in ('split', 'combined'):
+        for model_key in MODELS:
+            row = {
+                'mode': mode, 'model': model_key, 'files': 0, 'calls': 0,
+                'input_tokens': 0, 'output_tokens': 0, 'wall_seconds': 0.0,
+                'parse_errors': 0, 'matching': 0, 'compared': 0
+            }
+            for result in results:
+                run = result.get(mode, {}).get(model_key)
+                if not run:
+                    continue
+                row['files'] += 1
+                row['calls'] += run['calls']
+                row['input_tokens'] += run['input_tokens']
+                row['output_tokens'] += run['output_tokens']
+                row['wall_seconds'] += run['wall_seconds']
+                row['parse_errors'] += sum('error' in fields for fields in run['results'].values())
+
+                # Score against ground truth when given, otherwise agreement with split mode
+                if truth is not None:
+                    reference = truth.get(result['file_name'])
+                elif mode == 'combined' and 'split' in result:
+                    reference = flatten(result['split'][model_key]['results'])
+                else:
+                    reference = None
+                if reference:
+                    matching, compared = score_fields(run['results'], reference)
+                    row['matching'] += matching
+                    row['compared'] += compared
+            if row['files']:
+                row['wall_seconds'] = round(row['wall_seconds'], 2)
+                row['accuracy'] = round(row['matching'] / row['compared'], 3) if row['compared'] else "N/A"
+                rows.append(row)
+    return rows
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare combined single-call extraction with one call per prompt family")
+    parser.add_argument('--dir', default='files', help="Directory of PDFs to process")
+    parser.add_argument('--limit', type=int, default=None, help="Only process the first N files")
+    parser.add_argument('--mode', choices=['split', 'combined', 'both'], default='both')
+    parser.add_argument('--truth', default=None,
+                        help="CSV with file_name and family.field columns to score accuracy against")
+    parser.add_argument('--use-cache', action='store_true',
+                        help="Allow cached responses (wall times are then not meaningful)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not args.use_cache:
+        response_cache.set_bypass(True)
+
+    pdf_files = sorted(f for f in os.listdir(args.dir) if f.endswith(".pdf"))
+    if args.limit:
+        pdf_files = pdf_files[:args.limit]
+    modes = ('split', 'combined') if args.mode == 'both' else (args.mode,)
+
+    print(f"Benchmarking {', '.join(modes)} mode on {len(pdf_files)} files...")
+
+    results = []
+    file_paths = [os.path.join(args.dir, file_name) for file_name in pdf_files]
+    for file_path, text in tqdm(iter_extracted(file_paths), total=len(file_paths)):
+        results.append(process_file(file_path, text, modes))
+
+    # Save results to JSON file
+    with open("combined_extraction_results.json", "w") as f:
+        json.dump(results, f, indent=2)
+
+    # Save benchmark summary to CSV file
+    truth = load_truth(args.truth) if args.truth else None
+    rows = summarize(results, truth)
+    headers = ['mode', 'model', 'files', 'calls', 'input_tokens', 'output_tokens',
+               'wall_seconds', 'parse_errors', 'matching', 'compared', 'accuracy']
+    with open("combined_benchmark.csv", "w", newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    for row in rows:
+        print(f"{row['mode']:>8} {row['model']:<13} calls={row['calls']:<4} "
+              f"tokens={row['input_tokens'] + row['output_tokens']:<8} "
+              f"wall={row['wall_seconds']}s accuracy={row['accuracy']}")
+    print("Results saved to combined_extraction_results.json and combined_benchmark.csv")
+    if truth is None:
+        print("(accuracy for combined mode is agreement with split mode; pass --truth for ground truth)")
+
+if __name__ == "__main__":
+    main()
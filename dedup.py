@@ -0,0 +1,164 @@
+import os
+import re
+import zlib
+import numpy as np
+from pdf_text import sha256_bytes
+from pipeline import iter_extracted
+
+# MinHash settings: NUM_PERM hash functions split into LSH bands of BAND_ROWS rows
+NUM_PERM = 128
+BAND_ROWS = 4
+SHINGLE_SIZE = 9          # characters per shingle, taken from whitespace-free text
+NEAR_DUP_THRESHOLD = 0.9  # estimated Jaccard similarity needed to merge two documents
+
+# Universal hashing (a * x + b) mod PRIME over 32-bit shingle hashes
+PRIME = 4294967291
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, 2 ** 31, size=NUM_PERM).astype(np.uint64)
+
+DIGITS_RE = re.compile(r"\d+")
+
+def normalize_text(text):
+    """Lowercase and drop all whitespace (PDF copies of one order differ mostly in spacing)."""
+    return "".join(text.lower().split())
+
+def shingles(normalized):
+    """Return the set of 32-bit hashes of character shingles."""
+    if len(normalized) <= SHINGLE_SIZE:
+        return {zlib.crc32(normalized.encode('utf-8'))}
+    return {
+        zlib.crc32(normalized[i:i + SHINGLE_SIZE].encode('utf-8'))
+        for i in range(len(normalized) - SHINGLE_SIZE + 1)
+    }
+
+def minhash(shingle_hashes):
+    """Return the MinHash signature (NUM_PERM values) of a set of shingle hashes."""
+    x = np.fromiter(shingle_hashes, dtype=np.uint64, count=len(shingle_hashes))
+    return ((np.outer(_A, x) + _B[:, None]) % PRIME).min(axis=1)
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of two MinHash signatures."""
+    return float(np.mean(sig_a == sig_b))
+
+def _numbers(normalized):
+    # Order numbers, prices and dates must match exactly for a near-duplicate
+    return sorted(DIGITS_RE.findall(normalized))
+
+class _UnionFind:
+    def __init__(self, items):
+        self.parent = {item: item for item in items}
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            # Keep the earliest path as the root so groups have a stable representative
+            if root_b < root_a:
+                root_a, root_b = root_b, root_a
+            self.parent[root_b] = root_a
+
+def group_documents(texts, digests):
+    """Group documents that are byte-identical or have near-identical text.
+
+    texts and digests map path -> extracted text / file SHA-256. Returns a dict
+    of representative path -> member paths (representative first).
+    """
+    paths = sorted(texts)
+    groups = _UnionFind(paths)
+
+    # Exact duplicates: same bytes
+    by_digest = {}
+    for path in paths:
+        first = by_digest.setdefault(digests[path], path)
+        if first != path:
+            groups.union(first, path)
+
+    # Near duplicates: LSH over MinHash signatures, then verify each candidate pair
+    signatures = {}
+    numbers = {}
+    for path in paths:
+        normalized = normalize_text(texts[path] or "")
+        if normalized:
+            signatures[path] = minhash(shingles(normalized))
+            numbers[path] = _numbers(normalized)
+
+    buckets = {}
+    for path, signature in signatures.items():
+        for band in range(0, NUM_PERM, BAND_ROWS):
+            buckets.setdefault((band, signature[band:band + BAND_ROWS].tobytes()), []).append(path)
+
+    checked = set()
+    for members in buckets.values():
+        for i, a in enumerate(members):
+            for b in members[i + 1:]:
+                if (a, b) in checked or groups.find(a) == groups.find(b):
+                    continue
+                checked.add((a, b))
+                if numbers[a] == numbers[b] and similarity(signatures[a], signatures[b]) >= NEAR_DUP_THRESHOLD:
+                    groups.union(a, b)
+
+    result = {}
+    for path in paths:
+        result.setdefault(groups.find(path), []).append(path)
+    return result
+
+def find_duplicates(pdf_paths):
+    """Extract (through the text cache) and group duplicate PDFs.
+
+    Returns (representatives, groups): the paths to actually process, in
+    input order, and representative -> all member paths.
+    """
+    texts = dict(iter_extracted(pdf_paths))
+    digests = {}
+    for path in pdf_paths:
+        with open(path, 'rb') as f:
+            digests[path] = sha256_bytes(f.read())
+    groups = group_documents(texts, digests)
+    representatives = [path for path in pdf_paths if path in groups]
+    duplicates = len(pdf_paths) - len(representatives)
+    if duplicates:
+        print(f"Dedup: {len(pdf_paths)} files form {len(representatives)} unique documents "
+              f"({duplicates} duplicates will reuse their group's results)")
+    return representatives, groups
+
+def fan_out(results, groups):
+    """Copy each representative's result to the other members of its group.
+
+    results are dicts with a 'file_name' (base name) key, in representative
+    order. Copies get their own file_name and a 'duplicate_of' field.
+    """
+    by_name = {os.path.basename(rep): members for rep, members in groups.items()}
+    expanded = []
+    for result in results:
+        expanded.append(result)
+        for member in by_name.get(result['file_name'], [])[1:]:
+            copy = dict(result)
+            copy['file_name'] = os.path.basename(member)
+            copy['duplicate_of'] = result['file_name']
+            expanded.append(copy)
+    return expanded
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="List duplicate and near-duplicate PDFs")
+    parser.add_argument('--dir', default='files')
+    args = parser.parse_args()
+
+    pdf_paths = sorted(os.path.join(args.dir, f) for f in os.listdir(args.dir) if f.endswith('.pdf'))
+    representatives, groups = find_duplicates(pdf_paths)
+    for rep in representatives:
+        if len(groups[rep]) > 1:
+            print(os.path.basename(rep))
+            for member in groups[rep][1:]:
+                print(f"    = {os.path.basename(member)}")
+    print(f"{len(pdf_paths)} files, {len(representatives)} unique "
+          f"({1 - len(representatives) / max(len(pdf_paths), 1):.0%} fewer model calls)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+# Runs any subset of the registered tasks (tasks.py) over a folder of PDFs in
+# one pass. Each file is a small DAG: its text is extracted once and shared by
+# every task, each (task, model) call is a node that starts as soon as the text
+# is ready, and each task's parse node runs once its calls are in. All calls go
+# through one CallRunner, so adding a task adds calls to the same schedule
+# rather than another serial pass over the corpus. Files are started, and
+# their calls given slots, by priority: rush orders and near deadlines first
+# (see scheduler.py).
+import os
+import csv
+import asyncio
+import argparse
+from tqdm import tqdm
+import tasks
+import circuit_breaker
+import streaming
+from async_engine import map_extracted
+from scheduler import PriorityCallRunner, classify, load_hints, result_hints
+from circuit_breaker import backfill_models, backfill_files
+from dedup import find_duplicates, fan_out
+from page_select import FAMILY_KEYWORDS, select_text_for_file
+from result_log import ResultLog, latest_results, write_json_array
+
+# Tasks whose answers tell how urgent a file is (rush order, closing date)
+HINT_TASKS = ('document_costs', 'timeline_approval')
+
+def task_result(name, file_name, responses, structured=False, selection=None):
+    """Parse a task's responses ({model_key: raw}) into the result the scripts save."""
+    result = {'file_name': file_name}
+    repairs = {}
+    for model_key, response in responses.items():
+        result[model_key], repairs[model_key] = tasks.parse_response(name, response, structured)
+    result['repair_attempts'] = repairs
+    if selection is not None:
+        result['page_selection'] = selection
+    result['raw_responses'] = responses
+    # Failed calls are not answers; --backfill re-runs them later
+    result['backfill'] = backfill_models(responses)
+    return result
+
+class Engine:
+    """One run of several tasks over a corpus, sharing extraction and call scheduling."""
+
+    def __init__(self, task_names, resume=False, structured=False, select_pages=False, max_concurrency=None,
+                 log_paths=None):
+        """log_paths ({task name: path}) replaces the registry's result logs, e.g. one log per node."""
+        for name in task_names:
+            tasks.prompt_of(name)
+        self.task_names = list(task_names)
+        self.structured = structured
+        self.select_pages = select_pages
+        self.runner = PriorityCallRunner(max_concurrency)
+        log_paths = {name: (log_paths or {}).get(name, task['log_path']) for name, task in tasks.TASKS.items()}
+        # Rush status and closing dates already answered by earlier runs; read
+        # before the logs are opened, since a fresh run moves them aside
+        self.hints = load_hints({name: log_paths[name] for name in HINT_TASKS})
+        # One append-only log per task, shared by engine.py, watch.py and service.py
+        self.logs = {name: ResultLog(log_paths[name], resume=resume) for name in self.task_names}
+
+    def priority(self, file_path, text=None):
+        """Priority of a file from its name, its text if extracted, and earlier answers."""
+        file_name = os.path.basename(file_path)
+        return classify(file_name, text, self.hints.get(file_name))
+
+    def plan(self, file_paths, backfill=False):
+        """Map each file to the tasks it still needs, most urgent file first.
+
+        With backfill only files whose saved results have failed calls are
+        planned; otherwise files already logged by a resumed run are skipped.
+        """
+        plan = {}
+        if backfill:
+            paths = {os.path.basename(path): path for path in file_paths}
+            for name in self.task_names:
+                for file_name in backfill_files(self.logs[name].results()):
+                    if file_name in paths:
+                        plan.setdefault(paths[file_name], []).append(name)
+        else:
+            for path in file_paths:
+                pending = [name for name in self.task_names if not self.logs[name].is_done(os.path.basename(path))]
+                if pending:
+                    plan[path] = pending
+        # Only the file name and earlier answers are known before extraction
+        order = sorted(plan, key=lambda path: self.priority(path).sort_key())
+        return {path: plan[path] for path in order}
+
+    async def call(self, name, model_key, file_name, text, structured, priority):
+        log = self.logs[name]
+        return await self.runner.run(
+            log.call_unit, file_name, name, model_key,
+            lambda: tasks.call_model(name, model_key, text, structured),
+            priority=priority
+        )
+
+    async def run_file(self, file_path, text, task_names, structured=None, select_pages=None, priority=None,
+                       file_name=None):
+        """Run one file's DAG and return {task name: result}.
+
+        structured and select_pages override the engine's settings for this
+        file. Without a priority one is derived from the file name and text.
+        Results are logged under file_name (the path's base name by default),
+        e.g. the original name of a document stored under another.
+        """
+        structured = self.structured if structured is None else structured
+        select_pages = self.select_pages if select_pages is None else select_pages
+        file_name = file_name or os.path.basename(file_path)
+        if not text:
+            return {name: {'file_name': file_name, 'error': "Failed to extract text from PDF"} for name in task_names}
+        priority = priority or self.priority(file_name, text)
+        # Provider prompt caches are written by the first call that sends the
+        # document first; other cache_prefix tasks on the same model wait for it
+        warmed = {}
+
+        async def run_model(name, model_key, task_text):
+            task = tasks.get_task(name)
+            model = task['models'][model_key]['model']
+            # Page selection may hand back the whole document as an equal but distinct string
+            if not task['cache_prefix'] or task_text != text:
+                return await self.call(name, model_key, file_name, task_text, structured, priority)
+            if model in warmed:
+                await warmed[model]
+                return await self.call(name, model_key, file_name, task_text, structured, priority)
+            warmed[model] = asyncio.get_running_loop().create_future()
+            try:
+                return await self.call(name, model_key, file_name, task_text, structured, priority)
+            finally:
+                warmed[model].set_result(None)
+
+        async def run_task(name):
+            task_text, selection = text, None
+            if select_pages and name in FAMILY_KEYWORDS:
+                # Pages come from the extraction cache; short documents are sent whole
+                task_text, selection = select_text_for_file(file_path, name)
+            model_keys = list(tasks.get_task(name)['models'])
+            responses = await asyncio.gather(*[run_model(name, model_key, task_text) for model_key in model_keys])
+            # Parsing may make repair calls, so it is scheduled like a model call
+            return await self.runner.run(
+                task_result, name, file_name, dict(zip(model_keys, responses)), structured, selection,
+                priority=priority
+            )
+
+        results = await asyncio.gather(*[run_task(name) for name in task_names])
+        self.runner.deadlines.record(file_name, priority)
+        return dict(zip(task_names, results))
+
+    async def run(self, plan, groups=None, max_files_in_flight=None):
+        """Run every planned file, logging each task's result as soon as it is ready."""
+        progress = tqdm(total=len(plan), desc="Processing files")
+
+        def record(results):
+            self.record(results, groups)
+            progress.update(1)
+
+        try:
+            await map_extracted(
+                list(plan),
+                lambda file_path, text: self.run_file(file_path, text, plan[file_path]),
+                max_files_in_flight=max_files_in_flight,
+                on_result=record
+            )
+        finally:
+            progress.close()
+
+    def record(self, results, groups=None):
+        """Log each task's result of one file (copied to its duplicates when grouped)."""
+        for name, result in results.items():
+            for logged in fan_out([result], groups) if groups is not None else [result]:
+                self.logs[name].add_result(logged)
+                if name in HINT_TASKS:
+                    self.hints.setdefault(logged['file_name'], {}).update(result_hints(name, logged))
+
+    def close(self):
+        self.runner.close()
+        for log in self.logs.values():
+            log.close()
+
+def output_columns(name):
+    """CSV columns of a task: <model>_<field> for every model and field."""
+    task = tasks.get_task(name)
+    fields = task['fields'] or [name]
+    return [f"{model_key}_{field}" for model_key in task['models'] for field in fields]
+
+def output_row(name, result):
+    task = tasks.get_task(name)
+    row = {'file_name': result['file_name']}
+    for model_key in task['models']:
+        parsed = result.get(model_key, result.get('error', "N/A"))
+        pending = model_key in result.get('backfill', [])
+        for field in task['fields'] or [name]:
+            if pending:
+                value = "PENDING_BACKFILL"
+            elif isinstance(parsed, dict):
+                value = parsed.get(field, parsed.get('error', "N/A"))
+            else:
+                value = parsed
+            row[f"{model_key}_{field}"] = value
+    return row
+
+def write_outputs(name):
+    """Write a task's JSON and CSV from its result log; returns the number of files."""
+    log_path = tasks.get_task(name)['log_path']
+    base = log_path[:-len('.jsonl')] if log_path.endswith('.jsonl') else log_path
+    count = write_json_array(f"{base}.json", latest_results(log_path))
+    with open(f"{base}.csv", 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=['file_name'] + output_columns(name))
+        writer.writeheader()
+        for result in latest_results(log_path):
+            writer.writerow(output_row(name, result))
+    print(f"{name}: {count} files saved to {base}.json and {base}.csv")
+    return count
+
+def report_deadlines(deadlines, limit=10):
+    """Print files per priority class and those that finished after their deadline."""
+    print(f"Deadlines by priority: {deadlines.summary()}")
+    missed, count = deadlines.missed(), deadlines.missed_count()
+    if count:
+        print(f"{count} files finished after their deadline, most overdue first: "
+              f"{', '.join(missed[:limit])}{' ...' if count > limit else ''}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run several prompt families over a folder of PDFs in one pass")
+    parser.add_argument('--tasks', nargs='+', metavar='TASK',
+                        help="Tasks to run (default: every task whose prompt exists)")
+    parser.add_argument('--list', action='store_true', help="List the registered tasks and exit")
+    parser.add_argument('--dir', default='files', help="Folder of PDFs (default: %(default)s)")
+    parser.add_argument('--limit', type=int, help="Use at most this many PDFs")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Send every file to the models even when it duplicates another")
+    parser.add_argument('--select-pages', action='store_true',
+                        help="Send only the pages relevant to each task (where page_select has keywords)")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of tagged answers")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Re-run only the tasks whose model calls failed in the saved results")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from the result logs, skipping completed work")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    available = tasks.available_tasks()
+    if args.list:
+        for name, task in tasks.TASKS.items():
+            status = "" if name in available else f" (missing {task['prompt']})"
+            print(f"{name}: {', '.join(task['models'])} -> {task['log_path']}{status}")
+        return
+    task_names = args.tasks or available
+
+    pdf_files = sorted(f for f in os.listdir(args.dir) if f.endswith('.pdf'))[:args.limit]
+    file_paths = [os.path.join(args.dir, f) for f in pdf_files]
+    engine = Engine(task_names, resume=args.resume or args.backfill, structured=args.structured,
+                    select_pages=args.select_pages)
+    try:
+        groups = None
+        if not args.no_dedup:
+            # Duplicate copies of a document are answered once and share the result
+            file_paths, groups = find_duplicates(file_paths)
+        plan = engine.plan(file_paths, backfill=args.backfill)
+        calls = sum(len(tasks.get_task(name)['models']) for names in plan.values() for name in names)
+        print(f"Running {', '.join(task_names)} on {len(plan)} files ({calls} model calls)...")
+        asyncio.run(engine.run(plan, groups))
+    finally:
+        engine.close()
+
+    for name in task_names:
+        write_outputs(name)
+    print(f"Streaming stats: {streaming.stats.summary()}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+    report_deadlines(engine.runner.deadlines)
+    pending = {name: len(backfill_files(latest_results(tasks.get_task(name)['log_path']))) for name in task_names}
+    pending = {name: count for name, count in pending.items() if count}
+    if pending:
+        print(f"Files with failed model calls per task: {pending}; re-run them with --backfill")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import os
+import time
+import queue
+import threading
+import streaming
+from latency import history
+
+# Hedge after this percentile of the primary's recent latency...
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', '95'))
+# ...or after this many seconds while there is too little history
+DEFAULT_HEDGE_DELAY = float(os.getenv('HEDGE_DEFAULT_DELAY', '8'))
+
+class HedgeStats:
+    """Counts hedges fired and won, and the latency saved by them."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.losers_cancelled = 0
+        self.saved = []      # seconds saved where the losing primary eventually finished
+        self.pending = []    # (start, won_at) of primaries still running when the hedge won
+
+    def summary(self):
+        with self.lock:
+            now = time.perf_counter()
+            # Primaries still running saved at least the time elapsed since the hedge won
+            at_least = [now - won_at for _, won_at in self.pending]
+            return {
+                'calls': self.calls,
+                'hedged': self.hedged,
+                'hedge_rate': round(self.hedged / self.calls, 3) if self.calls else 0.0,
+                'hedge_wins': self.hedge_wins,
+                'losers_cancelled': self.losers_cancelled,
+                'latency_saved_seconds': round(sum(self.saved) + sum(at_least), 2),
+                'primaries_still_running': len(self.pending)
+            }
+
+stats = HedgeStats()
+
+def hedge_delay(provider, model):
+    """Seconds to wait for the primary before racing a second provider."""
+    delay = history.percentile(provider, model, HEDGE_PERCENTILE)
+    return DEFAULT_HEDGE_DELAY if delay is None else delay
+
+def hedged_call(attempts, parse, is_failed, delay=None):
+    """Race a backup model against a slow primary and return the first valid answer.
+
+    attempts is [(label, provider, model, fn), ...] with the primary first;
+    fn() returns the raw response. The backup starts when the primary has not
+    answered within `delay` (the primary's p95 latency by default) or as soon
+    as it returns an answer that fails to parse. The first parsed result that
+    is not failed wins. Streamed losers are closed once there is a winner
+    (see streaming.set_cancel), so their remaining output is not paid for;
+    a non-streamed loser cannot be interrupted and finishes on its daemon
+    thread. Returns a dict with the result, the winning label, whether a
+    hedge fired and the time to result.
+    """
+    delay = hedge_delay(attempts[0][1], attempts[0][2]) if delay is None else delay
+    start = time.perf_counter()
+    answers = queue.Queue()
+    state = {'won_at': None}
+    cancels = {}
+
+    def run(label, fn, cancel):
+        streaming.set_cancel(cancel)
+        try:
+            response = fn()
+        except Exception as e:
+            response = f"Error: {e}"
+        finally:
+            cancelled = streaming.was_cancelled()
+            streaming.set_cancel(None)
+        answers.put((label, response, time.perf_counter(), cancelled))
+
+    def launch(label, fn):
+        cancels[label] = threading.Event()
+        threading.Thread(target=run, args=(label, fn, cancels[label]), daemon=True).start()
+
+    labels = [label for label, _, _, _ in attempts]
+    launch(labels[0], attempts[0][3])
+    launched = 1
+    responses = {}
+    parsed = {}
+    winner = None
+
+    while True:
+        waiting = len(responses) < launched
+        can_launch = launched < len(attempts)
+        if not waiting and not can_launch:
+            break
+        label = None
+        if waiting:
+            # Only the primary gets a deadline; later attempts start when one fails
+            timeout = max(0.0, start + delay - time.perf_counter()) if can_launch and launched == 1 else None
+            try:
+                label, response, finished, _ = answers.get(timeout=timeout)
+            except queue.Empty:
+                pass
+        if label is not None:
+            responses[label] = response
+            parsed[label] = parse(response)
+            if not is_failed(parsed[label]):
+                winner = label
+                state['won_at'] = finished
+                break
+        # The primary is slow or an answer failed: race the next attempt
+        if can_launch:
+            launch(labels[launched], attempts[launched][3])
+            launched += 1
+
+    elapsed = time.perf_counter() - start
+    hedged = launched > 1
+    # Close the losers' streams rather than pay for output nobody reads
+    for label, cancel in cancels.items():
+        if label != winner and label not in responses:
+            cancel.set()
+    with stats.lock:
+        stats.calls += 1
+        stats.hedged += hedged
+        if hedged and winner is not None and winner != labels[0]:
+            stats.hedge_wins += 1
+            if labels[0] not in responses:
+                _track_abandoned(answers, labels[0], start, state['won_at'])
+
+    result = parsed[winner] if winner is not None else parsed.get(labels[0], next(iter(parsed.values())))
+    return {
+        'result': result,
+        'winner': winner,
+        'hedged': hedged,
+        'hedge_delay': round(delay, 3),
+        'seconds': round(elapsed, 3),
+        'parsed': parsed,
+        'raw_responses': responses
+    }
+
+def _track_abandoned(answers, primary_label, start, won_at):
+    """Record how much later the losing primary finished, or that it was cancelled."""
+    entry = (start, won_at)
+    stats.pending.append(entry)
+
+    def wait():
+        while True:
+            label, _, finished, cancelled = answers.get()
+            if label == primary_label:
+                with stats.lock:
+                    stats.pending.remove(entry)
+                    if cancelled:
+                        stats.losers_cancelled += 1
+                    else:
+                        stats.saved.append(finished - won_at)
+                return
+
+    threading.Thread(target=wait, daemon=True).start()
@@ -0,0 +1,79 @@
+import os
+import json
+import time
+import atexit
+import threading
+import telemetry
+
+# JSON file holding recent call latencies per provider/model across runs
+LATENCY_PATH = os.getenv('LLM_LATENCY_PATH', '.llm_latency.json')
+
+# Samples kept per provider/model, and how many are needed before percentiles are trusted
+WINDOW = 200
+MIN_SAMPLES = 20
+
+class LatencyHistory:
+    """Rolling window of provider request latencies of real (uncached) model calls."""
+
+    def __init__(self, path=None):
+        self.path = path or LATENCY_PATH
+        self.lock = threading.Lock()
+        self.samples = None
+
+    def _load(self):
+        if self.samples is None:
+            try:
+                with open(self.path, 'r') as f:
+                    self.samples = json.load(f)
+            except (OSError, ValueError):
+                self.samples = {}
+        return self.samples
+
+    def record(self, provider, model, seconds):
+        with self.lock:
+            window = self._load().setdefault(f"{provider}/{model}", [])
+            window.append(round(seconds, 3))
+            del window[:-WINDOW]
+
+    def percentile(self, provider, model, pct):
+        """Return the pct-th percentile latency, or None with too few samples."""
+        with self.lock:
+            window = sorted(self._load().get(f"{provider}/{model}", []))
+        if len(window) < MIN_SAMPLES:
+            return None
+        index = min(len(window) - 1, int(round(pct / 100 * (len(window) - 1))))
+        return window[index]
+
+    def save(self):
+        """Atomically write the history to disk."""
+        with self.lock:
+            if self.samples is None:
+                return
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.samples, f)
+            os.replace(tmp_path, self.path)
+
+history = LatencyHistory()
+atexit.register(history.save)
+
+def record_latency(provider, model, seconds):
+    """Record the latency of one call that actually reached the provider."""
+    history.record(provider, model, seconds)
+
+def timed_request(provider, model, request):
+    """Wrap one provider request so each successful attempt records its latency.
+
+    Only the time inside the request counts: waiting for the rate limiter,
+    retry backoff and circuit breaker waits happen outside it. Every
+    attempt's time also goes to the call's trace span (telemetry.py).
+    """
+    def run():
+        start = time.perf_counter()
+        try:
+            response = request()
+        finally:
+            telemetry.add_provider_time(time.perf_counter() - start)
+        record_latency(provider, model, time.perf_counter() - start)
+        return response
+    return run
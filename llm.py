@@ -0,0 +1,233 @@
+import json
+import clients
+import schemas
+import telemetry
+from rate_limit import call_with_rate_limit
+from circuit_breaker import get_breaker
+from response_cache import cached_call
+from prompts import render_document_first
+from latency import timed_request
+from streaming import stream_anthropic, stream_openai, stream_gemini
+
+# When set (see batch.py), cache misses are recorded here instead of being sent
+_collector = None
+
+def set_collector(collector):
+    """Record uncached requests with `collector` instead of sending them (None to stop)."""
+    global _collector
+    _collector = collector
+
+def render_prompt(template, text):
+    """Fill a prompt template with the document text."""
+    return template.format(content=text)
+
+def anthropic_request(model, template, text, max_tokens, temperature=None, system=None, cache_prefix=False,
+                      structured=None):
+    """Build the Messages API arguments for one call.
+
+    With cache_prefix the document goes first as its own block marked with
+    cache_control, so later prompts about the same document read it from
+    Anthropic's prompt cache instead of paying for it again. With structured
+    (a prompt family in schemas.py) the model must answer through a tool
+    whose input schema is the family's fields.
+    """
+    if cache_prefix:
+        document, instructions = render_document_first(template, text)
+        content = [
+            {"type": "text", "text": document, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": instructions}
+        ]
+    else:
+        content = render_prompt(template, text)
+    kwargs = {
+        'model': model,
+        'max_tokens': max_tokens,
+        'messages': [{"role": "user", "content": content}]
+    }
+    if temperature is not None:
+        kwargs['temperature'] = temperature
+    if system:
+        kwargs['system'] = system
+    if structured:
+        name = schemas.tool_name(structured)
+        kwargs['tools'] = [{
+            'name': name,
+            'description': f"Record the {structured} answer",
+            'input_schema': schemas.json_schema(structured)
+        }]
+        kwargs['tool_choice'] = {'type': 'tool', 'name': name}
+    return kwargs
+
+def anthropic_usage(message):
+    """Return (input, output, cached input) tokens of a Messages API response."""
+    usage = message.usage
+    cached = getattr(usage, 'cache_read_input_tokens', None) or 0
+    written = getattr(usage, 'cache_creation_input_tokens', None) or 0
+    return usage.input_tokens + cached + written, usage.output_tokens, cached
+
+def openai_usage(usage):
+    """Return (input, output, cached input) tokens of a Chat Completions usage object or dict."""
+    if not isinstance(usage, dict):
+        usage = usage.model_dump()
+    details = usage.get('prompt_tokens_details') or {}
+    return usage['prompt_tokens'], usage['completion_tokens'], details.get('cached_tokens') or 0
+
+def anthropic_text(message):
+    """Return a message's text, or the JSON of its tool input for structured calls."""
+    for block in message.content:
+        if block.type == 'tool_use':
+            return json.dumps(block.input)
+    return message.content[0].text
+
+def openai_request(model, template, text, max_tokens=None, temperature=None, system=None, cache_prefix=False,
+                   structured=None):
+    """Build the Chat Completions API arguments for one call.
+
+    OpenAI caches long shared prefixes automatically, so with cache_prefix
+    the document is simply placed ahead of the instructions. With structured
+    the reply is constrained to the family's JSON schema.
+    """
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    if cache_prefix:
+        document, instructions = render_document_first(template, text)
+        messages.append({"role": "user", "content": f"{document}\n\n{instructions}"})
+    else:
+        messages.append({"role": "user", "content": render_prompt(template, text)})
+    kwargs = {'model': model, 'messages': messages}
+    if max_tokens is not None:
+        kwargs['max_tokens'] = max_tokens
+    if temperature is not None:
+        kwargs['temperature'] = temperature
+    if structured:
+        kwargs['response_format'] = {
+            'type': 'json_schema',
+            'json_schema': {'name': structured, 'strict': True, 'schema': schemas.json_schema(structured)}
+        }
+    return kwargs
+
+def _params(max_tokens, temperature, system, cache_prefix, stop_at=None, structured=None):
+    """Sampling, layout and output-format parameters that distinguish cached responses."""
+    params = {'max_tokens': max_tokens, 'temperature': temperature, 'system': system}
+    if cache_prefix:
+        params['layout'] = 'document_first'
+    if structured:
+        params['schema'] = schemas.json_schema(structured)
+    elif stop_at:
+        params['stop_at'] = list(stop_at)
+    return params
+
+def call_anthropic(client, model, template, text, max_tokens, temperature=None, system=None, cache_prefix=False,
+                   stop_at=None, structured=None):
+    """Send a prompt template filled with text to an Anthropic model and return the response text.
+
+    With stop_at (closing tags such as streaming.EXTRACTION_STOP) the response
+    is streamed and cut off as soon as one of the tags arrives. With structured
+    the response is the JSON of the family's fields (stop_at is then ignored).
+    """
+    kwargs = anthropic_request(model, template, text, max_tokens, temperature, system, cache_prefix, structured)
+    params = _params(max_tokens, temperature, system, cache_prefix, stop_at, structured)
+
+    def request():
+        if stop_at and not structured:
+            return stream_anthropic(client, kwargs, stop_at)
+        message = client.messages.create(**kwargs)
+        telemetry.add_usage(*anthropic_usage(message))
+        return anthropic_text(message)
+
+    def send():
+        if _collector is not None:
+            return _collector.add('anthropic', model, params, template, text, kwargs)
+        telemetry.note_sent()
+        return call_with_rate_limit(
+            'anthropic', model, timed_request('anthropic', model, request), template + text, max_tokens,
+            on_retry=telemetry.note_retry, breaker=get_breaker('anthropic', model)
+        )
+
+    return telemetry.traced_call(
+        'anthropic', model, template, text,
+        lambda: cached_call('anthropic', model, params, template, text, send)
+    )
+
+def call_openai(client, model, template, text, max_tokens=None, temperature=None, system=None, cache_prefix=False,
+                stop_at=None, structured=None):
+    """Send a prompt template filled with text to an OpenAI chat model and return the response text.
+
+    With stop_at the response is streamed and cut off at the first closing tag.
+    With structured the response is the JSON of the family's fields.
+    """
+    kwargs = openai_request(model, template, text, max_tokens, temperature, system, cache_prefix, structured)
+    params = _params(max_tokens, temperature, system, cache_prefix, stop_at, structured)
+
+    def request():
+        if stop_at and not structured:
+            return stream_openai(client, kwargs, stop_at)
+        completion = client.chat.completions.create(**kwargs)
+        if completion.usage is not None:
+            telemetry.add_usage(*openai_usage(completion.usage))
+        return completion.choices[0].message.content
+
+    def send():
+        if _collector is not None:
+            return _collector.add('openai', model, params, template, text, kwargs)
+        telemetry.note_sent()
+        return call_with_rate_limit(
+            'openai', model, timed_request('openai', model, request), template + text, max_tokens,
+            on_retry=telemetry.note_retry, breaker=get_breaker('openai', model)
+        )
+
+    return telemetry.traced_call(
+        'openai', model, template, text,
+        lambda: cached_call('openai', model, params, template, text, send)
+    )
+
+def call_gemini(model_name, template, text, cache_prefix=False, stop_at=None, structured=None):
+    """Send a prompt template filled with text to a Gemini model and return the response text.
+
+    With stop_at the response is streamed and cut off at the first closing tag.
+    With structured the response is the JSON of the family's fields.
+    """
+    if cache_prefix:
+        # Document first as its own part so Gemini's implicit caching can reuse it
+        prompt = list(render_document_first(template, text))
+    else:
+        prompt = render_prompt(template, text)
+
+    def send():
+        if _collector is not None:
+            # No batch API for Gemini here; these run normally after the batch merge
+            return None
+        model = clients.get_gemini_model(model_name)
+
+        def request():
+            if stop_at and not structured:
+                return stream_gemini(model, prompt, stop_at)
+            if structured:
+                config = {'response_mime_type': 'application/json', 'response_schema': schemas.gemini_schema(structured)}
+                response = model.generate_content(prompt, generation_config=config)
+            else:
+                response = model.generate_content(prompt)
+            usage = getattr(response, 'usage_metadata', None)
+            if usage is not None:
+                telemetry.add_usage(
+                    usage.prompt_token_count, usage.candidates_token_count,
+                    getattr(usage, 'cached_content_token_count', 0)
+                )
+            return response.text
+
+        telemetry.note_sent()
+        return call_with_rate_limit(
+            'gemini', model_name, timed_request('gemini', model_name, request), template + text,
+            on_retry=telemetry.note_retry, breaker=get_breaker('gemini', model_name)
+        )
+
+    params = {'layout': 'document_first'} if cache_prefix else {}
+    if structured:
+        params['schema'] = schemas.gemini_schema(structured)
+    elif stop_at:
+        params['stop_at'] = list(stop_at)
+    return telemetry.traced_call(
+        'gemini', model_name, template, text,
+        lambda: cached_call('gemini', model_name, params, template, text, send)
+    )
@@ -0,0 +1,137 @@
+# End-to-end throughput benchmark against the local mock server.
+# Starts mock_server in-process (with the given latency, error and 429
+# settings), points all three providers at it and runs process_invoices over
+# the PDFs with many files in flight, then reports throughput, latency
+# percentiles from the telemetry trace, retries, open circuits and mock stats.
+import os
+import io
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import contextlib
+import mock_server
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline throughput against the local mock server")
+    parser.add_argument('--dir', default='invoices', help="Folder of PDFs to run (default: %(default)s)")
+    parser.add_argument('--limit', type=int, help="Use at most this many PDFs")
+    parser.add_argument('--repeat', type=int, default=1, help="Run every PDF this many times")
+    parser.add_argument('--files-in-flight', type=int, default=16, help="Files processed concurrently")
+    parser.add_argument('--client-rpm', type=int,
+                        help="Requests per minute allowed by our own rate limiter, per provider "
+                             "(default: the RATE_LIMIT_* settings)")
+    parser.add_argument('--stream-delay', type=float, default=0.01,
+                        help="Seconds between streamed text chunks")
+    parser.add_argument('--replay', action='append', metavar='RESULTS_JSON',
+                        help="Answer with raw_responses recorded in a results JSON file (repeatable)")
+    parser.add_argument('--latency', action='append', metavar='[PROVIDER=]DIST',
+                        help="Mock time to first byte, e.g. lognormal:1.5,0.4 or gemini=fixed:0.8 (repeatable)")
+    parser.add_argument('--error-rate', action='append', metavar='[PROVIDER=]P',
+                        help="Share of requests answered with a server error (repeatable)")
+    parser.add_argument('--rate-limit-rate', action='append', metavar='[PROVIDER=]P',
+                        help="Share of requests answered with a 429 (repeatable)")
+    parser.add_argument('--rpm', action='append', metavar='[PROVIDER=]N',
+                        help="Mock requests per minute before 429s (repeatable)")
+    parser.add_argument('--verbose', action='store_true', help="Show the pipeline's own output")
+    return parser.parse_args()
+
+def start_mock(args):
+    """Start the mock server on a free port in a background thread."""
+    server = mock_server.make_server(
+        '127.0.0.1', 0, stream_delay=args.stream_delay,
+        latency=mock_server.per_provider(args.latency, mock_server.parse_latency),
+        error_rate=mock_server.per_provider(args.error_rate, float),
+        rate_limit_rate=mock_server.per_provider(args.rate_limit_rate, float),
+        rpm=mock_server.per_provider(args.rpm, int),
+        replay=mock_server.ReplayPool(args.replay) if args.replay else None
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def configure_environment(base_url, workdir, client_rpm=None):
+    """Point every provider at the mock and keep caches and traces out of the repo.
+
+    Must run before the pipeline modules are imported, since they read these
+    settings at import time.
+    """
+    os.environ.update({
+        'ANTHROPIC_API_KEY': 'mock',
+        'OPENAI_API_KEY': 'mock',
+        'GEMINI_API_KEY': 'mock',
+        'ANTHROPIC_BASE_URL': base_url,
+        'OPENAI_BASE_URL': f"{base_url}/v1",
+        'GEMINI_BASE_URL': base_url,
+        'LLM_CACHE_PATH': os.path.join(workdir, 'cache.sqlite3'),
+        'LLM_CACHE_BYPASS': '1',
+        'LLM_LATENCY_PATH': os.path.join(workdir, 'latency.json'),
+        'LLM_TRACE_PATH': os.path.join(workdir, 'trace.jsonl')
+    })
+    if client_rpm:
+        for provider in ('ANTHROPIC', 'OPENAI', 'GEMINI'):
+            os.environ[f'RATE_LIMIT_{provider}_RPM'] = str(client_rpm)
+            # Token budget large enough that only the request budget binds
+            os.environ[f'RATE_LIMIT_{provider}_TPM'] = str(client_rpm * 100000)
+
+def link_copy(source, target):
+    os.symlink(os.path.abspath(source), target)
+    return target
+
+async def run_files(file_paths, process_file, files_in_flight):
+    from async_engine import CallRunner, map_extracted
+    runner = CallRunner(files_in_flight)
+    try:
+        return await map_extracted(
+            file_paths,
+            lambda file_path, text: runner.run(process_file, file_path, text),
+            max_files_in_flight=files_in_flight
+        )
+    finally:
+        runner.close()
+
+def main():
+    args = parse_args()
+    server = start_mock(args)
+    host, port = server.server_address[:2]
+    workdir = tempfile.mkdtemp(prefix='load_test_')
+    configure_environment(f"http://{host}:{port}", workdir, args.client_rpm)
+
+    import telemetry
+    import circuit_breaker
+    import process_invoices
+    from circuit_breaker import backfill_files
+
+    file_names = sorted(f for f in os.listdir(args.dir) if f.endswith('.pdf'))[:args.limit]
+    file_paths = [os.path.join(args.dir, f) for f in file_names]
+    if args.repeat > 1:
+        # Results are keyed by path, so each repetition gets its own link to the PDF
+        os.makedirs(os.path.join(workdir, 'pdfs'))
+        file_paths = [
+            link_copy(file_path, os.path.join(workdir, 'pdfs', f"{i}_{os.path.basename(file_path)}"))
+            for i in range(args.repeat) for file_path in file_paths
+        ]
+    print(f"Running {len(file_paths)} files against the mock at http://{host}:{port} "
+          f"({args.files_in_flight} in flight, scratch files in {workdir})")
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    start = time.perf_counter()
+    with output:
+        results = asyncio.run(run_files(file_paths, process_invoices.process_file, args.files_in_flight))
+    seconds = time.perf_counter() - start
+
+    df = telemetry.load_trace(os.environ['LLM_TRACE_PATH'], telemetry.RUN_ID)
+    calls = len(df)
+    print(f"\nFiles: {len(results)} in {seconds:.1f}s ({len(results) / seconds:.2f} files/s)")
+    print(f"Model calls: {calls} ({calls / seconds:.2f} calls/s), "
+          f"retries: {int(df['retries'].sum()) if calls else 0}, "
+          f"errors: {int(df['error'].notna().sum()) if calls else 0}")
+    if calls:
+        print(telemetry.summarize(df, ['provider', 'model']).drop(columns=['cache_hits', 'cost_usd']).to_string())
+    print(f"Files left for backfill: {len(backfill_files(results))}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+    print(f"Mock stats: {server.state.stats()}")
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,650 @@
+# Local stand-in for the Anthropic, OpenAI and Gemini APIs.
+# Point the SDKs at it with ANTHROPIC_BASE_URL=http://127.0.0.1:8765,
+# OPENAI_BASE_URL=http://127.0.0.1:8765/v1 and GEMINI_BASE_URL=http://127.0.0.1:8765
+# to exercise the pipeline (including --batch mode and streaming) without
+# network access or API spend. Latency distributions, injected errors, 429s
+# and replayed raw_responses from earlier result JSON make it usable for load
+# tests (see load_test.py).
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque, Counter
+from email import policy
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Text returned for every request unless --response-text is given
+DEFAULT_RESPONSE_TEXT = """<answer>N/A</answer>
+<extraction>
+Document cost: N/A
+Processing fee: N/A
+Rush order: No
+Rush fee: N/A
+Payment timing: N/A
+</extraction>"""
+
+PROVIDERS = ('anthropic', 'openai', 'gemini')
+
+def parse_latency(spec):
+    """Build a sampler from 'fixed:S', 'uniform:LOW,HIGH', 'normal:MEAN,SD' or 'lognormal:MEDIAN,SIGMA' (seconds)."""
+    kind, _, params = spec.partition(':')
+    values = [float(v) for v in params.split(',')] if params else []
+    if kind == 'fixed' and len(values) == 1:
+        return lambda: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda: random.uniform(values[0], values[1])
+    if kind == 'normal' and len(values) == 2:
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == 'lognormal' and len(values) == 2:
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Bad latency spec: {spec}")
+
+def per_provider(specs, convert):
+    """Parse repeated '[provider=]value' options into {provider or '*': converted value}."""
+    settings = {}
+    for spec in specs or []:
+        provider, sep, value = spec.partition('=')
+        if not sep or provider not in PROVIDERS:
+            provider, value = '*', spec
+        settings[provider] = convert(value)
+    return settings
+
+def provider_of(model_key):
+    """Provider behind a result key such as 'claude_haiku' or 'gpt4o_mini_doc_costs'."""
+    if model_key.startswith('claude'):
+        return 'anthropic'
+    if model_key.startswith('gpt'):
+        return 'openai'
+    if model_key.startswith('gemini'):
+        return 'gemini'
+    return None
+
+class ReplayPool:
+    """Recorded raw_responses from result JSON files, grouped by provider.
+
+    A request gets a recorded answer whose answer block (e.g. <extraction> or
+    <answers>) is asked for in its prompt, chosen by a hash of the prompt so
+    the same request always replays the same answer.
+    """
+
+    def __init__(self, paths):
+        self.responses = {provider: [] for provider in PROVIDERS}
+        for path in paths:
+            with open(path, 'r') as f:
+                results = json.load(f)
+            for result in results if isinstance(results, list) else [results]:
+                for key, response in (result.get('raw_responses') or {}).items():
+                    provider = provider_of(key)
+                    if provider and response and not str(response).startswith('Error'):
+                        self.responses[provider].append(response)
+
+    def __len__(self):
+        return sum(len(responses) for responses in self.responses.values())
+
+    def pick(self, provider, prompt):
+        candidates = self.responses.get(provider) or [r for rs in self.responses.values() for r in rs]
+        if not candidates:
+            return None
+        matching = [
+            response for response in candidates
+            if (tag := re.search(r'<(\w+)>', response)) and tag.group(0) in prompt
+        ]
+        candidates = matching or candidates
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        return candidates[int.from_bytes(digest[:8], 'big') % len(candidates)]
+
+class MockError(Exception):
+    """An injected API error: status code, provider-shaped body and headers."""
+
+    def __init__(self, status, body, headers=None):
+        super().__init__(status)
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+def error_body(provider, status, message):
+    """Error payload in the shape each provider's SDK expects."""
+    if provider == 'anthropic':
+        kind = {429: 'rate_limit_error', 529: 'overloaded_error'}.get(status, 'api_error')
+        return {'type': 'error', 'error': {'type': kind, 'message': message}}
+    if provider == 'gemini':
+        kind = {429: 'RESOURCE_EXHAUSTED', 503: 'UNAVAILABLE'}.get(status, 'INTERNAL')
+        return {'error': {'code': status, 'message': message, 'status': kind}}
+    kind = 'rate_limit_exceeded' if status == 429 else 'server_error'
+    return {'error': {'message': message, 'type': kind, 'param': None, 'code': kind}}
+
+# Status codes used for injected server errors, per provider
+SERVER_ERRORS = {'anthropic': (500, 529), 'openai': (500, 503), 'gemini': (500, 503)}
+
+class MockState:
+    """In-memory files, batch jobs, fault settings and counters shared by all request handlers."""
+
+    def __init__(self, response_text, batch_delay, stream_delay=0.0, latency=None, error_rate=None,
+                 rate_limit_rate=None, rpm=None, retry_after=1.0, replay=None):
+        self.response_text = response_text
+        self.batch_delay = batch_delay
+        self.stream_delay = stream_delay
+        # {provider or '*': value} settings, see per_provider()
+        self.latency = latency or {}
+        self.error_rate = error_rate or {}
+        self.rate_limit_rate = rate_limit_rate or {}
+        self.rpm = rpm or {}
+        self.retry_after = retry_after
+        self.replay = replay
+        self.streams_closed_early = 0
+        self.counts = Counter()
+        self.windows = {provider: deque() for provider in PROVIDERS}
+        self.started = time.time()
+        self.files = {}
+        self.anthropic_batches = {}
+        self.openai_batches = {}
+        self.lock = threading.Lock()
+
+    def _setting(self, settings, provider, default=None):
+        return settings.get(provider, settings.get('*', default))
+
+    def respond(self, body, provider='anthropic'):
+        """Return the completion text for a request body."""
+        if self.replay is not None:
+            response = self.replay.pick(provider, json.dumps(body))
+            if response is not None:
+                return response
+        return self.response_text
+
+    def admit(self, provider):
+        """Apply rate limits and injected faults to one completion request.
+
+        Raises MockError for a 429 or server error; otherwise sleeps for the
+        sampled latency (the time to the first byte).
+        """
+        with self.lock:
+            self.counts[f"{provider}_requests"] += 1
+            rpm = self._setting(self.rpm, provider)
+            if rpm:
+                window = self.windows[provider]
+                now = time.monotonic()
+                while window and window[0] <= now - 60:
+                    window.popleft()
+                if len(window) >= rpm:
+                    self.counts[f"{provider}_429"] += 1
+                    wait = window[0] + 60 - now
+                    raise MockError(429, error_body(provider, 429, "Requests per minute exceeded"),
+                                    {'retry-after': f"{wait:.1f}"})
+                window.append(now)
+        if random.random() < self._setting(self.rate_limit_rate, provider, 0.0):
+            with self.lock:
+                self.counts[f"{provider}_429"] += 1
+            raise MockError(429, error_body(provider, 429, "Injected rate limit"),
+                            {'retry-after': str(self.retry_after)})
+        sampler = self._setting(self.latency, provider)
+        if sampler is not None:
+            time.sleep(sampler())
+        if random.random() < self._setting(self.error_rate, provider, 0.0):
+            status = random.choice(SERVER_ERRORS[provider])
+            with self.lock:
+                self.counts[f"{provider}_errors"] += 1
+            raise MockError(status, error_body(provider, status, "Injected server error"))
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['streams_closed_early'] = self.streams_closed_early
+        seconds = max(time.time() - self.started, 1e-9)
+        requests = sum(stats.get(f"{provider}_requests", 0) for provider in PROVIDERS)
+        stats['requests_per_second'] = round(requests / seconds, 2)
+        return stats
+
+def structured_answer(schema):
+    """Answer every required field of a JSON schema with "N/A"."""
+    return {name: "N/A" for name in schema.get('required', [])}
+
+def anthropic_message(state, body):
+    """Build an Anthropic Messages API response (a tool call when one is forced)."""
+    text = state.respond(body, 'anthropic')
+    content = [{'type': 'text', 'text': text}]
+    stop_reason = 'end_turn'
+    choice = body.get('tool_choice') or {}
+    tool = next((t for t in body.get('tools', []) if t['name'] == choice.get('name')), None)
+    if tool is not None:
+        content = [{
+            'type': 'tool_use',
+            'id': f"toolu_{uuid.uuid4().hex}",
+            'name': tool['name'],
+            'input': structured_answer(tool['input_schema'])
+        }]
+        stop_reason = 'tool_use'
+    return {
+        'id': f"msg_{uuid.uuid4().hex}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': body.get('model'),
+        'content': content,
+        'stop_reason': stop_reason,
+        'stop_sequence': None,
+        'usage': {'input_tokens': len(json.dumps(body)) // 4, 'output_tokens': len(text) // 4}
+    }
+
+def openai_completion(state, body):
+    """Build an OpenAI Chat Completions response (schema-shaped JSON when asked for)."""
+    text = state.respond(body, 'openai')
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        text = json.dumps(structured_answer(response_format['json_schema']['schema']))
+    prompt_tokens = len(json.dumps(body)) // 4
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': body.get('model'),
+        'choices': [{
+            'index': 0,
+            'message': {'role': 'assistant', 'content': text},
+            'finish_reason': 'stop'
+        }],
+        'usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': len(text) // 4,
+            'total_tokens': prompt_tokens + len(text) // 4
+        }
+    }
+
+# Characters per streamed text delta
+STREAM_CHUNK_CHARS = 16
+
+def _text_chunks(text):
+    return [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)]
+
+def anthropic_stream_events(state, body):
+    """Yield (event, data) pairs of a streamed Anthropic Messages response."""
+    message = anthropic_message(state, body)
+    text = message['content'][0]['text']
+    start = dict(message, content=[], stop_reason=None, usage=dict(message['usage'], output_tokens=1))
+    yield 'message_start', {'type': 'message_start', 'message': start}
+    yield 'content_block_start', {'type': 'content_block_start', 'index': 0,
+                                  'content_block': {'type': 'text', 'text': ''}}
+    for chunk in _text_chunks(text):
+        yield 'content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                      'delta': {'type': 'text_delta', 'text': chunk}}
+    yield 'content_block_stop', {'type': 'content_block_stop', 'index': 0}
+    yield 'message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                            'usage': {'output_tokens': message['usage']['output_tokens']}}
+    yield 'message_stop', {'type': 'message_stop'}
+
+def openai_stream_events(state, body):
+    """Yield (event, data) pairs of a streamed OpenAI Chat Completions response."""
+    completion = openai_completion(state, body)
+    text = completion['choices'][0]['message']['content']
+
+    def chunk(delta, finish_reason=None):
+        return {
+            'id': completion['id'],
+            'object': 'chat.completion.chunk',
+            'created': completion['created'],
+            'model': completion['model'],
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+        }
+
+    yield None, chunk({'role': 'assistant', 'content': ''})
+    for piece in _text_chunks(text):
+        yield None, chunk({'content': piece})
+    yield None, chunk({}, 'stop')
+    yield None, '[DONE]'
+
+def gemini_response(state, body, text=None):
+    """Build a Gemini generateContent response (schema-shaped JSON when asked for)."""
+    config = body.get('generationConfig') or {}
+    if text is None:
+        text = state.respond(body, 'gemini')
+        if config.get('responseSchema'):
+            text = json.dumps(structured_answer(config['responseSchema']))
+    prompt_tokens = len(json.dumps(body)) // 4
+    return {
+        'candidates': [{
+            'content': {'parts': [{'text': text}], 'role': 'model'},
+            'finishReason': 1,
+            'index': 0
+        }],
+        'usageMetadata': {
+            'promptTokenCount': prompt_tokens,
+            'candidatesTokenCount': len(text) // 4,
+            'totalTokenCount': prompt_tokens + len(text) // 4
+        }
+    }
+
+def gemini_stream_objects(state, body):
+    """Yield the response objects of a streamed Gemini generateContent call."""
+    text = gemini_response(state, body)['candidates'][0]['content']['parts'][0]['text']
+    for piece in _text_chunks(text):
+        yield gemini_response(state, body, piece)
+
+def _iso(ts):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(ts))
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Routes requests to the Anthropic and OpenAI endpoints used by this project."""
+
+    server_version = 'MockLLM/1.0'
+    # Keep connections open so client connection pooling can be exercised
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data, content_type='application/octet-stream'):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_sse(self, events):
+        """Stream server-sent events, stopping quietly if the client hangs up."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event, data in events:
+                payload = data if isinstance(data, str) else json.dumps(data)
+                frame = (f"event: {event}\n" if event else "") + f"data: {payload}\n\n"
+                self.wfile.write(frame.encode('utf-8'))
+                self.wfile.flush()
+                if self.state.stream_delay:
+                    time.sleep(self.state.stream_delay)
+        except (BrokenPipeError, ConnectionResetError):
+            with self.state.lock:
+                self.state.streams_closed_early += 1
+
+    def _send_json_stream(self, objects):
+        """Stream a JSON array one element at a time (Gemini's REST streaming format)."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        try:
+            self.wfile.write(b'[')
+            for i, obj in enumerate(objects):
+                self.wfile.write(((",\r\n" if i else "") + json.dumps(obj)).encode('utf-8'))
+                self.wfile.flush()
+                if self.state.stream_delay:
+                    time.sleep(self.state.stream_delay)
+            self.wfile.write(b']')
+        except (BrokenPipeError, ConnectionResetError):
+            with self.state.lock:
+                self.state.streams_closed_early += 1
+
+    def _not_found(self):
+        self._send_json({'error': {'type': 'not_found_error', 'message': self.path}}, status=404)
+
+    def _base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Anthropic Message Batches
+
+    def _anthropic_batch(self, batch):
+        ended = time.time() >= batch['created_at'] + self.state.batch_delay
+        count = len(batch['requests'])
+        return {
+            'id': batch['id'],
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': {
+                'processing': 0 if ended else count,
+                'succeeded': count if ended else 0,
+                'errored': 0,
+                'canceled': 0,
+                'expired': 0
+            },
+            'created_at': _iso(batch['created_at']),
+            'expires_at': _iso(batch['created_at'] + 86400),
+            'ended_at': _iso(time.time()) if ended else None,
+            'cancel_initiated_at': None,
+            'archived_at': None,
+            'results_url': f"{self._base_url()}/v1/messages/batches/{batch['id']}/results" if ended else None
+        }
+
+    def _anthropic_batch_results(self, batch):
+        lines = []
+        for request in batch['requests']:
+            lines.append(json.dumps({
+                'custom_id': request['custom_id'],
+                'result': {'type': 'succeeded', 'message': anthropic_message(self.state, request['params'])}
+            }))
+        self._send_bytes(("\n".join(lines) + "\n").encode('utf-8'), 'application/binary')
+
+    # OpenAI Files and Batches
+
+    def _upload_file(self):
+        body = self._read_body()
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+        message = BytesParser(policy=policy.default).parsebytes(header + body)
+        content, filename, purpose = b'', 'upload.jsonl', 'batch'
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name == 'file':
+                content = part.get_payload(decode=True)
+                filename = part.get_filename() or filename
+            elif name == 'purpose':
+                purpose = part.get_payload(decode=True).decode('utf-8')
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.state.lock:
+            self.state.files[file_id] = content
+        self._send_json(self._file_object(file_id, filename, purpose, len(content)))
+
+    def _file_object(self, file_id, filename, purpose, size):
+        return {
+            'id': file_id,
+            'object': 'file',
+            'bytes': size,
+            'created_at': int(time.time()),
+            'filename': filename,
+            'purpose': purpose,
+            'status': 'processed'
+        }
+
+    def _openai_batch(self, batch):
+        done = time.time() >= batch['created_at'] + self.state.batch_delay
+        if done and batch['output_file_id'] is None:
+            lines = []
+            for line in self.state.files[batch['input_file_id']].decode('utf-8').splitlines():
+                if not line.strip():
+                    continue
+                request = json.loads(line)
+                lines.append(json.dumps({
+                    'id': f"batch_req_{uuid.uuid4().hex}",
+                    'custom_id': request['custom_id'],
+                    'response': {
+                        'status_code': 200,
+                        'request_id': uuid.uuid4().hex,
+                        'body': openai_completion(self.state, request['body'])
+                    },
+                    'error': None
+                }))
+            output_id = f"file-{uuid.uuid4().hex}"
+            with self.state.lock:
+                self.state.files[output_id] = ("\n".join(lines) + "\n").encode('utf-8')
+            batch['output_file_id'] = output_id
+            batch['total'] = len(lines)
+        return {
+            'id': batch['id'],
+            'object': 'batch',
+            'endpoint': batch['endpoint'],
+            'errors': None,
+            'input_file_id': batch['input_file_id'],
+            'completion_window': batch['completion_window'],
+            'status': 'completed' if done else 'in_progress',
+            'output_file_id': batch['output_file_id'],
+            'error_file_id': None,
+            'created_at': int(batch['created_at']),
+            'request_counts': {
+                'total': batch['total'],
+                'completed': batch['total'] if done else 0,
+                'failed': 0
+            }
+        }
+
+    # Routing
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path == '/mock/stats':
+            return self._send_json(self.state.stats())
+        match = re.fullmatch(r'/v1/messages/batches/([\w-]+)(/results)?', path)
+        if match:
+            batch = self.state.anthropic_batches.get(match.group(1))
+            if batch is None:
+                return self._not_found()
+            if match.group(2):
+                return self._anthropic_batch_results(batch)
+            return self._send_json(self._anthropic_batch(batch))
+
+        match = re.fullmatch(r'/v1/batches/([\w-]+)', path)
+        if match:
+            batch = self.state.openai_batches.get(match.group(1))
+            if batch is None:
+                return self._not_found()
+            return self._send_json(self._openai_batch(batch))
+
+        match = re.fullmatch(r'/v1/files/([\w-]+)/content', path)
+        if match:
+            content = self.state.files.get(match.group(1))
+            if content is None:
+                return self._not_found()
+            return self._send_bytes(content)
+
+        self._not_found()
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        if path == '/v1/files':
+            return self._upload_file()
+
+        body = json.loads(self._read_body() or b'{}')
+        gemini = re.fullmatch(r'/v1beta/models/([\w.-]+):(generateContent|streamGenerateContent)', path)
+        provider = 'anthropic' if path == '/v1/messages' else 'openai' if path == '/v1/chat/completions' else None
+        if gemini:
+            provider = 'gemini'
+        if provider is not None:
+            try:
+                self.state.admit(provider)
+            except MockError as e:
+                return self._send_json(e.body, status=e.status, headers=e.headers)
+        if path == '/v1/messages':
+            if body.get('stream'):
+                return self._send_sse(anthropic_stream_events(self.state, body))
+            return self._send_json(anthropic_message(self.state, body))
+        if path == '/v1/chat/completions':
+            if body.get('stream'):
+                return self._send_sse(openai_stream_events(self.state, body))
+            return self._send_json(openai_completion(self.state, body))
+        if gemini:
+            if gemini.group(2) == 'streamGenerateContent':
+                return self._send_json_stream(gemini_stream_objects(self.state, body))
+            return self._send_json(gemini_response(self.state, body))
+        if path == '/v1/messages/batches':
+            batch = {'id': f"msgbatch_{uuid.uuid4().hex}", 'requests': body['requests'], 'created_at': time.time()}
+            with self.state.lock:
+                self.state.anthropic_batches[batch['id']] = batch
+            return self._send_json(self._anthropic_batch(batch))
+        if path == '/v1/batches':
+            batch = {
+                'id': f"batch_{uuid.uuid4().hex}",
+                'input_file_id': body['input_file_id'],
+                'endpoint': body['endpoint'],
+                'completion_window': body.get('completion_window', '24h'),
+                'created_at': time.time(),
+                'output_file_id': None,
+                'total': 0
+            }
+            with self.state.lock:
+                self.state.openai_batches[batch['id']] = batch
+            return self._send_json(self._openai_batch(batch))
+        self._not_found()
+
+def make_server(host='127.0.0.1', port=8765, response_text=DEFAULT_RESPONSE_TEXT, batch_delay=0.0,
+                stream_delay=0.0, **faults):
+    """Create (but do not start) a mock API server.
+
+    faults are passed to MockState: latency, error_rate, rate_limit_rate and
+    rpm ({provider or '*': value}), retry_after and replay (a ReplayPool).
+    """
+    server = ThreadingHTTPServer((host, port), MockHandler)
+    server.daemon_threads = True
+    server.state = MockState(response_text, batch_delay, stream_delay, **faults)
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic, OpenAI and Gemini APIs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--response-text', default=DEFAULT_RESPONSE_TEXT,
+                        help="Completion text returned for every request")
+    parser.add_argument('--batch-delay', type=float, default=5.0,
+                        help="Seconds before a submitted batch reports completion")
+    parser.add_argument('--stream-delay', type=float, default=0.01,
+                        help="Seconds between streamed text chunks")
+    parser.add_argument('--replay', action='append', metavar='RESULTS_JSON',
+                        help="Answer with raw_responses recorded in a results JSON file (repeatable)")
+    parser.add_argument('--latency', action='append', metavar='[PROVIDER=]DIST',
+                        help="Time to first byte: fixed:S, uniform:LOW,HIGH, normal:MEAN,SD or "
+                             "lognormal:MEDIAN,SIGMA, optionally per provider (repeatable)")
+    parser.add_argument('--error-rate', action='append', metavar='[PROVIDER=]P',
+                        help="Share of requests answered with a 5xx/529 error (repeatable)")
+    parser.add_argument('--rate-limit-rate', action='append', metavar='[PROVIDER=]P',
+                        help="Share of requests answered with a 429 (repeatable)")
+    parser.add_argument('--rpm', action='append', metavar='[PROVIDER=]N',
+                        help="Requests per minute before answering 429 with Retry-After (repeatable)")
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                        help="Retry-After seconds sent with injected 429s")
+    args = parser.parse_args()
+
+    replay = ReplayPool(args.replay) if args.replay else None
+    server = make_server(
+        args.host, args.port, args.response_text, args.batch_delay, args.stream_delay,
+        latency=per_provider(args.latency, parse_latency),
+        error_rate=per_provider(args.error_rate, float),
+        rate_limit_rate=per_provider(args.rate_limit_rate, float),
+        rpm=per_provider(args.rpm, int),
+        retry_after=args.retry_after,
+        replay=replay
+    )
+    print(f"Mock LLM server listening on http://{args.host}:{args.port}")
+    if replay is not None:
+        print(f"Replaying {len(replay)} recorded responses")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Mock stats: {server.state.stats()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import os
+import re
+import csv
+import argparse
+import numpy as np
+from tqdm import tqdm
+import telemetry
+from pdf_text import extract_pages_from_pdf
+from rate_limit import CHARS_PER_TOKEN
+
+# Keywords and phrases that signal a page is relevant to each prompt family
+FAMILY_KEYWORDS = {
+    'property_info': [
+        'property address', 'property information', 'seller', 'buyer', 'purchaser', 'owner',
+        'homeowners association', 'hoa', 'association', 'management company', 'managed by',
+        'file number', 'escrow number', 'order number', 'attached', 'enclosed', 'attachment'
+    ],
+    'financial_status': [
+        'violation', 'lien', 'collection', 'delinquent', 'special assessment', 'assessment',
+        'dues', 'balance', 'outstanding', 'past due', 'fee', 'cost', 'rush', 'payment',
+        'remit to', 'payable to', 'mail checks', 'due at closing', 'paid'
+    ],
+    'timeline_approval': [
+        'good through', 'valid until', 'expires', 'effective through', 'closing date',
+        'date of closing', 'estimated closing', 'settlement date', 'paid through', 'paid to',
+        'approval', 'approve', 'application', 'right of first refusal', 'board'
+    ],
+    'document_costs': [
+        'fee', 'cost', 'price', 'charge', 'amount', 'total', 'rush', 'expedite', 'priority',
+        'processing fee', 'surcharge', 'credit card', 'pay at close', 'due at closing',
+        'collect at closing', 'pre-paid', 'paid', 'payment received', 'receipt'
+    ],
+    'attachments': ['attached', 'attachment', 'enclosed', 'appended', 'accompanying', 'see attached'],
+    'extra_associations': [
+        'master association', 'sub association', 'sub-association', 'metro district', 'water district',
+        'fire district', 'special district', 'association', 'district'
+    ],
+    'hoa_names': ['homeowners association', 'hoa', 'association', 'management', 'managed by', 'community'],
+    'buyer_approval': ['approval', 'approve', 'application', 'board', 'right of first refusal', 'interview']
+}
+
+# Selection settings
+TOP_PAGES = 2          # highest-scoring pages to keep
+NEIGHBOURS = 1         # pages kept on each side of a selected page
+MIN_PAGES = 4          # documents shorter than this are always sent whole
+MIN_SCORE = 0.05       # below this best score the ranking is not trusted
+PHRASE_WEIGHT = 0.5    # weight of exact keyword-phrase hits relative to TF-IDF similarity
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """Lowercase word tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+def tfidf_matrix(docs, vocab):
+    """Row-normalised TF-IDF matrix (len(docs) x len(vocab)) with IDF taken from docs."""
+    index = {term: i for i, term in enumerate(vocab)}
+    counts = np.zeros((len(docs), len(vocab)), dtype=np.float64)
+    for row, tokens in enumerate(docs):
+        for token in tokens:
+            col = index.get(token)
+            if col is not None:
+                counts[row, col] += 1
+    # Sublinear term frequency and smoothed IDF, as in standard TF-IDF
+    tf = np.where(counts > 0, 1.0 + np.log(np.maximum(counts, 1.0)), 0.0)
+    df = (counts > 0).sum(axis=0)
+    idf = np.log((1.0 + len(docs)) / (1.0 + df)) + 1.0
+    weights = tf * idf
+    norms = np.linalg.norm(weights, axis=1, keepdims=True)
+    return weights / np.where(norms == 0, 1.0, norms), idf
+
+def score_pages(pages, family):
+    """Relevance score of every page for a prompt family."""
+    keywords = FAMILY_KEYWORDS[family]
+    page_tokens = [tokenize(page) for page in pages]
+    vocab = sorted({token for tokens in page_tokens for token in tokens})
+    if not vocab:
+        return np.zeros(len(pages))
+
+    # Cosine similarity between each page and the family's keyword query
+    matrix, idf = tfidf_matrix(page_tokens, vocab)
+    index = {term: i for i, term in enumerate(vocab)}
+    query = np.zeros(len(vocab))
+    for token in tokenize(" ".join(keywords)):
+        if token in index:
+            query[index[token]] = idf[index[token]]
+    norm = np.linalg.norm(query)
+    similarity = matrix @ (query / norm) if norm else np.zeros(len(pages))
+
+    # Exact phrase hits catch multi-word cues TF-IDF splits apart
+    hits = np.array([
+        sum(page.lower().count(keyword) for keyword in keywords) for page in pages
+    ], dtype=np.float64)
+    phrase = np.log1p(hits)
+    if phrase.max() > 0:
+        phrase = phrase / phrase.max()
+    return similarity + PHRASE_WEIGHT * phrase
+
+def select_pages(pages, family, top_pages=None, neighbours=None):
+    """Return (indices of pages to send, info) for a family.
+
+    Falls back to every page when the document is short, the family is
+    unknown, or no page scores high enough to trust the ranking.
+    """
+    top_pages = TOP_PAGES if top_pages is None else top_pages
+    neighbours = NEIGHBOURS if neighbours is None else neighbours
+    all_pages = list(range(len(pages)))
+
+    if family not in FAMILY_KEYWORDS or len(pages) < MIN_PAGES:
+        return all_pages, {'fallback': 'short_document' if family in FAMILY_KEYWORDS else 'unknown_family'}
+
+    scores = score_pages(pages, family)
+    if scores.max() < MIN_SCORE:
+        return all_pages, {'fallback': 'low_score'}
+
+    # The first page carries the header (association, property, order) in almost every letter
+    keep = {0}
+    for page in np.argsort(-scores)[:top_pages]:
+        for neighbour in range(page - neighbours, page + neighbours + 1):
+            if 0 <= neighbour < len(pages):
+                keep.add(int(neighbour))
+    return sorted(keep), {'fallback': None, 'scores': [round(float(s), 3) for s in scores]}
+
+def select_text(pages, family, **kwargs):
+    """Return (text, report) with only the relevant pages of a document for a family."""
+    keep, info = select_pages(pages, family, **kwargs)
+    parts = []
+    previous = -1
+    for page in keep:
+        if page != previous + 1:
+            parts.append(f"[... {page - previous - 1} page(s) omitted ...]\n")
+        parts.append(pages[page] + "\n")
+        previous = page
+    if keep and keep[-1] != len(pages) - 1:
+        parts.append(f"[... {len(pages) - 1 - keep[-1]} page(s) omitted ...]\n")
+    text = "".join(parts)
+    full_chars = sum(len(page) + 1 for page in pages)
+    if len(text) >= full_chars:
+        # Omission markers cost more than the pages they replace
+        keep, info = list(range(len(pages))), {'fallback': 'no_saving'}
+        text = "".join(page + "\n" for page in pages)
+
+    report = {
+        'family': family,
+        'pages_total': len(pages),
+        'pages_kept': len(keep),
+        'tokens_full': full_chars // CHARS_PER_TOKEN,
+        'tokens_kept': len(text) // CHARS_PER_TOKEN,
+        **info
+    }
+    report['tokens_saved'] = max(0, report['tokens_full'] - report['tokens_kept'])
+    return text, report
+
+def select_text_for_file(pdf_path, family):
+    """Load a PDF's cached pages and return (selected text, report) for a family."""
+    text, report = select_text(extract_pages_from_pdf(pdf_path), family)
+    telemetry.register_document(os.path.basename(pdf_path), text)
+    return text, report
+
+def benchmark(pdf_paths, families, call_model=None):
+    """Measure tokens saved and, with call_model, the accuracy delta per family.
+
+    call_model(family, text) must return the parsed result dict for that family.
+    Accuracy is the share of fields where the selected-pages answer matches the
+    full-text answer (the full-text run is the reference).
+    """
+    rows = []
+    for pdf_path in tqdm(pdf_paths, desc="Scoring pages"):
+        pages = extract_pages_from_pdf(pdf_path)
+        if not pages:
+            continue
+        full_text = "".join(page + "\n" for page in pages)
+        for family in families:
+            text, report = select_text(pages, family)
+            row = {'file_name': os.path.basename(pdf_path), **report}
+            row.pop('scores', None)
+            if call_model is not None and report['fallback'] is None:
+                full = call_model(family, full_text)
+                selected = call_model(family, text)
+                compared = [k for k in full if k != 'error']
+                row['fields_compared'] = len(compared)
+                row['fields_matching'] = sum(
+                    " ".join(str(full[k]).split()).lower() == " ".join(str(selected.get(k, '')).split()).lower()
+                    for k in compared
+                )
+            rows.append(row)
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Report tokens saved and accuracy delta from page selection")
+    parser.add_argument('--dir', default='files', help="Directory of PDFs to score")
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--families', default='property_info,financial_status,timeline_approval,document_costs')
+    parser.add_argument('--with-model', action='store_true',
+                        help="Also call GPT-4o-mini on full and selected text to measure the accuracy delta")
+    args = parser.parse_args()
+
+    pdf_paths = sorted(os.path.join(args.dir, f) for f in os.listdir(args.dir) if f.endswith('.pdf'))
+    if args.limit:
+        pdf_paths = pdf_paths[:args.limit]
+    families = args.families.split(',')
+
+    if args.with_model:
+        import llm
+        import clients
+        from prompts import COMBINED_FAMILIES
+        from parsers import COMBINED_PARSERS
+        templates = dict(COMBINED_FAMILIES)
+        openai_client = clients.get_client('openai')
+
+        def run_family(family, text):
+            try:
+                response = llm.call_openai(openai_client, "gpt-4o-mini", templates[family], text, temperature=0)
+            except Exception as e:
+                response = f"Error: {e}"
+            return COMBINED_PARSERS[family](response)
+
+    rows = benchmark(pdf_paths, families, run_family if args.with_model else None)
+    with open('page_select_report.csv', 'w', newline='') as f:
+        headers = ['file_name', 'family', 'pages_total', 'pages_kept', 'tokens_full', 'tokens_kept',
+                   'tokens_saved', 'fallback', 'fields_compared', 'fields_matching']
+        writer = csv.DictWriter(f, fieldnames=headers)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # Summary per family
+    for family in families:
+        family_rows = [r for r in rows if r['family'] == family]
+        full = sum(r['tokens_full'] for r in family_rows)
+        saved = sum(r['tokens_saved'] for r in family_rows)
+        selected = sum(1 for r in family_rows if r['fallback'] is None)
+        line = (f"{family:<18} files={len(family_rows):<4} selected={selected:<4} "
+                f"tokens_saved={saved} ({saved / full:.1%})" if full else f"{family:<18} no files")
+        compared = sum(r.get('fields_compared', 0) for r in family_rows)
+        if compared:
+            matching = sum(r.get('fields_matching', 0) for r in family_rows)
+            line += f" agreement_with_full_text={matching / compared:.1%}"
+        print(line)
+    print("Per-file report saved to page_select_report.csv")
+
+if __name__ == "__main__":
+    main()
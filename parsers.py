@@ -0,0 +1,235 @@
+import re
+
+def parse_property_info_response(response):
+    """Parse the response from the model to extract property information."""
+    try:
+        # Extract the content between <extraction> tags
+        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
+        if not extraction_match:
+            return {"error": "No extraction found in response"}
+        
+        extraction_text = extraction_match.group(1).strip()
+        
+        # Parse each field
+        result = {}
+        
+        # Property Address
+        address_match = re.search(r'Property Address: (.*?)(?:\n|$)', extraction_text)
+        result["property_address"] = address_match.group(1).strip() if address_match else "N/A"
+        
+        # Seller Name
+        seller_match = re.search(r'Seller Name: (.*?)(?:\n|$)', extraction_text)
+        result["seller_name"] = seller_match.group(1).strip() if seller_match else "N/A"
+        
+        # Buyer Name
+        buyer_match = re.search(r'Buyer Name: (.*?)(?:\n|$)', extraction_text)
+        result["buyer_name"] = buyer_match.group(1).strip() if buyer_match else "N/A"
+        
+        # HOA Name
+        hoa_match = re.search(r'HOA Name: (.*?)(?:\n|$)', extraction_text)
+        result["hoa_name"] = hoa_match.group(1).strip() if hoa_match else "N/A"
+        
+        # PM Name
+        pm_match = re.search(r'PM Name: (.*?)(?:\n|$)', extraction_text)
+        result["pm_name"] = pm_match.group(1).strip() if pm_match else "N/A"
+        
+        # Additional HOAs or special districts
+        additional_match = re.search(r'Additional HOAs or special districts: (.*?)(?:\n|$)', extraction_text)
+        result["additional_associations"] = additional_match.group(1).strip() if additional_match else "N/A"
+        
+        # File Number
+        file_match = re.search(r'File Number: (.*?)(?:\n|$)', extraction_text)
+        result["file_number"] = file_match.group(1).strip() if file_match else "N/A"
+        
+        # Document Attachments
+        attachments_match = re.search(r'Document Attachments: (.*?)(?:\n|$)', extraction_text)
+        result["document_attachments"] = attachments_match.group(1).strip() if attachments_match else "N/A"
+        
+        return result
+    except Exception as e:
+        return {"error": f"Error parsing response: {e}"}
+
+def parse_document_costs_response(response):
+    """Parse the response from the model to extract document costs information."""
+    try:
+        # Extract the content between <extraction> tags
+        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
+        if not extraction_match:
+            return {"error": "No extraction found in response"}
+        
+        extraction_text = extraction_match.group(1).strip()
+        
+        # Parse each field
+        result = {}
+        
+        # Document cost
+        doc_cost_match = re.search(r'Document cost: (.*?)(?:\n|$)', extraction_text)
+        result["document_cost"] = doc_cost_match.group(1).strip() if doc_cost_match else "N/A"
+        
+        # Processing fee
+        proc_fee_match = re.search(r'Processing fee: (.*?)(?:\n|$)', extraction_text)
+        result["processing_fee"] = proc_fee_match.group(1).strip() if proc_fee_match else "N/A"
+        
+        # Rush order status
+        rush_order_match = re.search(r'Rush order: (.*?)(?:\n|$)', extraction_text)
+        result["rush_order"] = rush_order_match.group(1).strip() if rush_order_match else "N/A"
+        
+        # Rush fee
+        rush_fee_match = re.search(r'Rush fee: (.*?)(?:\n|$)', extraction_text)
+        result["rush_fee"] = rush_fee_match.group(1).strip() if rush_fee_match else "N/A"
+        
+        # Payment timing
+        payment_timing_match = re.search(r'Payment timing: (.*?)(?:\n|$)', extraction_text)
+        result["payment_timing"] = payment_timing_match.group(1).strip() if payment_timing_match else "N/A"
+        
+        return result
+    except Exception as e:
+        return {"error": f"Error parsing response: {e}"}
+
+def _field(extraction_text, label):
+    """Return the single-line value after `label:` in an extraction block, or N/A."""
+    match = re.search(rf'{re.escape(label)}: (.*?)(?:\n|$)', extraction_text)
+    return match.group(1).strip() if match else "N/A"
+
+def _field_with_details(extraction_text, label, next_labels):
+    """Return a `label:` value plus any detail lines that follow it before the next label."""
+    stop = '|'.join(re.escape(l) for l in next_labels)
+    pattern = rf'{re.escape(label)}: (.*?)(?=\n\s*(?:{stop}):|\Z)' if stop else rf'{re.escape(label)}: (.*)'
+    match = re.search(pattern, extraction_text, re.DOTALL)
+    return match.group(1).strip() if match else "N/A"
+
+def parse_financial_status_response(response):
+    """Parse the response from the model to extract financial status information."""
+    try:
+        # Extract the content between <extraction> tags
+        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
+        if not extraction_match:
+            return {"error": "No extraction found in response"}
+        
+        extraction_text = extraction_match.group(1).strip()
+        
+        # Part A answers may be followed by detail lines
+        part_a = ['Violations', 'Collections/Liens', 'Special Assessments', 'PART B']
+        result = {
+            "violations": _field_with_details(extraction_text, 'Violations', part_a[1:]),
+            "collections_liens": _field_with_details(extraction_text, 'Collections/Liens', part_a[2:]),
+            "special_assessments": _field_with_details(extraction_text, 'Special Assessments', part_a[3:])
+        }
+        
+        # Parts B and C are one line each
+        result["regular_assessment_amount"] = _field(extraction_text, 'Regular assessment amount')
+        result["assessment_frequency"] = _field(extraction_text, 'Assessment frequency')
+        result["outstanding_balance"] = _field(extraction_text, 'Outstanding balance')
+        result["document_cost"] = _field(extraction_text, 'Document cost')
+        result["rush_order"] = _field(extraction_text, 'Rush order')
+        result["rush_fee"] = _field(extraction_text, 'Rush fee')
+        result["payment_timing"] = _field(extraction_text, 'Payment timing')
+        result["mailing_address"] = _field_with_details(extraction_text, 'Mailing address for payments', [])
+        
+        return result
+    except Exception as e:
+        return {"error": f"Error parsing response: {e}"}
+
+def parse_timeline_approval_response(response):
+    """Parse the response from the model to extract dates and buyer approval."""
+    try:
+        # Extract the content between <extraction> tags
+        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
+        if not extraction_match:
+            return {"error": "No extraction found in response"}
+        
+        extraction_text = extraction_match.group(1).strip()
+        
+        return {
+            "good_through_date": _field(extraction_text, 'Good Through Date'),
+            "closing_date": _field(extraction_text, 'Closing Date'),
+            "dues_paid_through": _field(extraction_text, 'Dues/Assessments paid to/through'),
+            "buyer_approval_required": _field_with_details(extraction_text, 'Buyer Approval Required', [])
+        }
+    except Exception as e:
+        return {"error": f"Error parsing response: {e}"}
+
+def parse_answer_response(response):
+    """Parse a single <answer> block (attachments, extra associations and buyer approval prompts)."""
+    try:
+        pattern = r'<answer>(.*?)</answer>'
+        match = re.search(pattern, response, re.DOTALL)
+        if match:
+            return match.group(1).strip()
+        return "Error: No answer found"
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+def parse_doc_costs_response(response):
+    """Parse response for document costs prompt."""
+    try:
+        pattern = r'<answers>\s*1\.\s*([^\n]*)\s*2\.\s*([^\n]*)\s*3\.\s*([^\n]*)\s*4\.\s*([^\n]*)\s*</answers>'
+        match = re.search(pattern, response, re.DOTALL)
+        if match:
+            return {
+                'doc_cost': match.group(1).strip(),
+                'rush_order': match.group(2).strip(),
+                'rush_fee': match.group(3).strip(),
+                'payment_timing': match.group(4).strip()
+            }
+        return {
+            'doc_cost': "Error: No answer found",
+            'rush_order': "Error: No answer found",
+            'rush_fee': "Error: No answer found",
+            'payment_timing': "Error: No answer found"
+        }
+    except Exception as e:
+        return {
+            'doc_cost': f"Error: {str(e)}",
+            'rush_order': f"Error: {str(e)}",
+            'rush_fee': f"Error: {str(e)}",
+            'payment_timing': f"Error: {str(e)}"
+        }
+
+def parse_hoa_names_response(response):
+    """Parse response for HOA names prompt."""
+    try:
+        pattern = r'<answer>\s*HOA:\s*([^\n]*)\s*PM:\s*([^\n]*)\s*</answer>'
+        match = re.search(pattern, response, re.DOTALL)
+        if match:
+            return {
+                'hoa_name': match.group(1).strip(),
+                'pm_name': match.group(2).strip()
+            }
+        return {
+            'hoa_name': "Error: No answer found",
+            'pm_name': "Error: No answer found"
+        }
+    except Exception as e:
+        return {
+            'hoa_name': f"Error: {str(e)}",
+            'pm_name': f"Error: {str(e)}"
+        }
+
+# Parser for each prompt family answered in combined mode
+COMBINED_PARSERS = {
+    'property_info': parse_property_info_response,
+    'financial_status': parse_financial_status_response,
+    'timeline_approval': parse_timeline_approval_response,
+    'document_costs': parse_document_costs_response
+}
+
+def parse_combined_response(response, parsers=None):
+    """Split a combined-mode response into the per-family result dicts."""
+    parsers = parsers or COMBINED_PARSERS
+    results = {}
+    for name, parser in parsers.items():
+        try:
+            match = re.search(rf'<{name}>(.*?)</{name}>', response, re.DOTALL)
+        except Exception as e:
+            results[name] = {"error": f"Error parsing response: {e}"}
+            continue
+        if not match:
+            results[name] = {"error": f"No {name} section found in response"}
+            continue
+        section = match.group(1)
+        # Hand each family parser the block shape it already understands
+        if '<extraction>' not in section:
+            section = f"<extraction>{section}</extraction>"
+        results[name] = parser(section)
+    return results
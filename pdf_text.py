@@ -0,0 +1,72 @@
+import os
+import io
+import json
+import hashlib
+import PyPDF2
+import telemetry
+
+# Bump this whenever the extraction logic changes so old cache entries are ignored
+EXTRACTOR_VERSION = "pypdf2-3.0.1-v1"
+
+# Directory for cached page text (can be overridden with PDF_TEXT_CACHE_DIR)
+CACHE_DIR = os.getenv('PDF_TEXT_CACHE_DIR', '.pdf_text_cache')
+
+def sha256_bytes(data):
+    """Return the SHA-256 hex digest of the given bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def _cache_path(digest):
+    """Return the cache file path for a document digest."""
+    return os.path.join(CACHE_DIR, EXTRACTOR_VERSION, digest[:2], f"{digest}.json")
+
+def _read_cache(digest):
+    """Return cached pages for a digest, or None on a miss."""
+    try:
+        with open(_cache_path(digest), 'r') as f:
+            return json.load(f)['pages']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _write_cache(digest, pages):
+    """Atomically store extracted pages for a digest."""
+    path = _cache_path(digest)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'extractor_version': EXTRACTOR_VERSION, 'pages': pages}, f)
+    os.replace(tmp_path, path)
+
+def _parse_pages(data):
+    """Run PyPDF2 over the raw PDF bytes and return the text of each page."""
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    return [page.extract_text() or "" for page in reader.pages]
+
+def extract_pages_from_pdf(pdf_path, use_cache=True):
+    """Extract the text of each page of a PDF, using the on-disk cache."""
+    try:
+        with open(pdf_path, 'rb') as file:
+            data = file.read()
+        digest = sha256_bytes(data)
+
+        if use_cache:
+            pages = _read_cache(digest)
+            if pages is not None:
+                return pages
+
+        pages = _parse_pages(data)
+        if use_cache:
+            try:
+                _write_cache(digest, pages)
+            except OSError as e:
+                print(f"Could not cache text for {pdf_path}: {e}")
+        return pages
+    except Exception as e:
+        print(f"Error reading PDF {pdf_path}: {str(e)}")
+        return []
+
+def extract_text_from_pdf(pdf_path, use_cache=True):
+    """Extract text from a PDF file."""
+    pages = extract_pages_from_pdf(pdf_path, use_cache=use_cache)
+    text = "".join(page + "\n" for page in pages)
+    telemetry.register_document(os.path.basename(pdf_path), text)
+    return text
@@ -0,0 +1,59 @@
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import telemetry
+from pdf_text import extract_text_from_pdf
+
+# Default number of extraction worker processes
+EXTRACT_WORKERS = os.cpu_count() or 1
+
+def _producer(pdf_paths, pool, slots, out_queue, stop):
+    """Submit extraction jobs, blocking whenever too many results are pending."""
+    for pdf_path in pdf_paths:
+        # Wait for a free slot so finished-but-unconsumed texts stay bounded
+        while not slots.acquire(timeout=0.1):
+            if stop.is_set():
+                return
+        if stop.is_set():
+            return
+        future = pool.submit(extract_text_from_pdf, pdf_path)
+        future.add_done_callback(lambda f, p=pdf_path: out_queue.put((p, f)))
+
+def iter_extracted(pdf_paths, max_workers=None, max_pending=None):
+    """Extract PDFs in a process pool and yield (pdf_path, text) as each finishes.
+
+    At most max_pending documents are being extracted or waiting to be consumed
+    at any time, so a slow consumer (the API-calling stage) applies back-pressure
+    to extraction instead of letting texts pile up in memory.
+    """
+    pdf_paths = list(pdf_paths)
+    max_workers = max_workers or EXTRACT_WORKERS
+    max_pending = max_pending or max_workers * 2
+
+    slots = threading.Semaphore(max_pending)
+    out_queue = queue.Queue()
+    stop = threading.Event()
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        producer = threading.Thread(
+            target=_producer,
+            args=(pdf_paths, pool, slots, out_queue, stop),
+            daemon=True
+        )
+        producer.start()
+        try:
+            for _ in range(len(pdf_paths)):
+                pdf_path, future = out_queue.get()
+                slots.release()
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f"Error extracting {pdf_path}: {str(e)}")
+                    text = ""
+                # Extraction ran in a worker process; name the text here for the trace
+                telemetry.register_document(os.path.basename(pdf_path), text)
+                yield pdf_path, text
+        finally:
+            stop.set()
+            producer.join()
@@ -1,140 +1,168 @@
 import os
-import json
-import re
 import csv
-from PyPDF2 import PdfReader
-import anthropic
-import openai
-import google.generativeai as genai
-from dotenv import load_dotenv
+import argparse
+import threading
 from tqdm import tqdm
+import clients
 
-# Load environment variables
-load_dotenv()
+# Shared API clients (pooled connections, see clients.py)
+claude_client = clients.get_client('anthropic')
+openai_client = clients.get_client('openai')
 
-# Initialize API clients
-claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-openai.api_key = os.getenv("OPENAI_API_KEY")
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Prompt, parser and models are declared in tasks.py
+import tasks
+from pdf_text import extract_text_from_pdf
+from pipeline import iter_extracted
+from batch import run_batch_mode
+from page_select import select_text_for_file
+from cascade import run_cascade, is_failed
+import circuit_breaker
+from circuit_breaker import backfill_models, backfill_files
+from result_log import ResultLog, latest_results, write_json_array
+import hedge
+import streaming
+from streaming import EXTRACTION_STOP
 
-# Model configurations
-claude_model = "claude-3-haiku-20240307"
-gpt4_model = "gpt-4o-mini"
-gemini_model = "gemini-1.5-flash"
+# Send only the pages relevant to document costs (set by --select-pages)
+SELECT_PAGES = False
 
-# Import the prompt
-from prompts import DOCUMENT_COSTS_PROMPT
+# Cheap-first mode: ask CASCADE_PRIMARY first, the others only when needed (set by --cascade)
+CASCADE = False
+CASCADE_PRIMARY = os.getenv('CASCADE_PRIMARY', 'gpt4o_mini')
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file."""
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return None
-
-def parse_document_costs_response(response):
-    """Parse the response from the model to extract document costs information."""
-    try:
-        # Extract the content between <extraction> tags
-        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
-        if not extraction_match:
-            return {"error": "No extraction found in response"}
-        
-        extraction_text = extraction_match.group(1).strip()
-        
-        # Parse each field
-        result = {}
-        
-        # Document cost
-        doc_cost_match = re.search(r'Document cost: (.*?)(?:\n|$)', extraction_text)
-        result["document_cost"] = doc_cost_match.group(1).strip() if doc_cost_match else "N/A"
-        
-        # Processing fee
-        proc_fee_match = re.search(r'Processing fee: (.*?)(?:\n|$)', extraction_text)
-        result["processing_fee"] = proc_fee_match.group(1).strip() if proc_fee_match else "N/A"
-        
-        # Rush order status
-        rush_order_match = re.search(r'Rush order: (.*?)(?:\n|$)', extraction_text)
-        result["rush_order"] = rush_order_match.group(1).strip() if rush_order_match else "N/A"
-        
-        # Rush fee
-        rush_fee_match = re.search(r'Rush fee: (.*?)(?:\n|$)', extraction_text)
-        result["rush_fee"] = rush_fee_match.group(1).strip() if rush_fee_match else "N/A"
-        
-        # Payment timing
-        payment_timing_match = re.search(r'Payment timing: (.*?)(?:\n|$)', extraction_text)
-        result["payment_timing"] = payment_timing_match.group(1).strip() if payment_timing_match else "N/A"
-        
-        return result
-    except Exception as e:
-        return {"error": f"Error parsing response: {e}"}
+# Stream responses and stop at the closing tag the parser needs (None waits for the full response)
+STREAM_STOP = EXTRACTION_STOP
 
-def call_claude_haiku(text):
-    """Call Claude Haiku model with the document costs prompt."""
-    try:
-        response = claude_client.messages.create(
-            model=claude_model,
-            max_tokens=4000,
-            temperature=0,
-            system="You are a helpful assistant that extracts information from PDF documents.",
-            messages=[
-                {"role": "user", "content": DOCUMENT_COSTS_PROMPT.format(content=text)}
-            ]
-        )
-        return response.content[0].text
-    except Exception as e:
-        return f"Error calling Claude Haiku: {e}"
+# Schema-constrained JSON output instead of the <extraction> block (set by --structured)
+STRUCTURED_FAMILY = None
 
-def call_gpt4(text):
-    """Call GPT-4o-mini model with the document costs prompt."""
-    try:
-        response = openai.chat.completions.create(
-            model=gpt4_model,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts information from PDF documents."},
-                {"role": "user", "content": DOCUMENT_COSTS_PROMPT.format(content=text)}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error calling GPT-4o-mini: {e}"
+# Append-only log of this run's results (see result_log.py, set in main)
+RESULT_LOG = None
+LOG_PATH = "document_costs_results.jsonl"
 
-def call_gemini(text):
-    """Call Gemini Flash model with the document costs prompt."""
-    try:
-        model = genai.GenerativeModel(gemini_model)
-        response = model.generate_content(DOCUMENT_COSTS_PROMPT.format(content=text))
-        return response.text
-    except Exception as e:
-        return f"Error calling Gemini Flash: {e}"
+# Latency-critical mode: race a second provider when the primary is slow (set by --hedge)
+HEDGE = False
+
+def parse_response(response, repairs=None):
+    """Parse a response in whichever output mode is active.
+
+    A malformed <extraction> block is sent to a cheap model for reformatting
+    (see repair.py); the number of repair calls is appended to `repairs`.
+    """
+    parsed, attempts = tasks.parse_response('document_costs', response, STRUCTURED_FAMILY is not None)
+    if repairs is not None:
+        repairs.append(attempts)
+    return parsed
+
+def call_model(model_key, text):
+    """Call one of the task's models with the document costs prompt."""
+    return tasks.call_model('document_costs', model_key, text, STRUCTURED_FAMILY is not None, stop_at=STREAM_STOP)
+
+MODEL_CALLERS = {
+    model_key: lambda text, model_key=model_key: call_model(model_key, text)
+    for model_key in tasks.get_task('document_costs')['models']
+}
+
+MODEL_IDS = tasks.model_ids('document_costs')
 
-def process_file(file_path):
+def cascade_callers(primary, callers=None):
+    """Model callers in cascade order: the primary first, then the rest."""
+    callers = callers or MODEL_CALLERS
+    return [(primary, callers[primary])] + [
+        (model_key, fn) for model_key, fn in callers.items() if model_key != primary
+    ]
+
+def logged_callers(file_name, settled=None):
+    """MODEL_CALLERS whose answers are logged as they complete (and replayed on --resume).
+
+    Answers arriving after settled (a threading.Event) is set are not logged:
+    a hedge's losing attempt may finish after the file, or the run, is done.
+    """
+    if RESULT_LOG is None:
+        return MODEL_CALLERS
+    should_log = None if settled is None else lambda: not settled.is_set()
+    return {
+        model_key: lambda text, model_key=model_key, fn=fn: RESULT_LOG.call_unit(
+            file_name, 'document_costs', model_key, lambda: fn(text), should_log
+        )
+        for model_key, fn in MODEL_CALLERS.items()
+    }
+
+def process_file(file_path, text=None):
     """Process a single file with all three models."""
     print(f"\nProcessing file: {os.path.basename(file_path)}")
     
-    # Extract text from PDF
-    text = extract_text_from_pdf(file_path)
+    # Extract text from PDF unless the extraction stage already did
+    if text is None:
+        text = extract_text_from_pdf(file_path)
     if not text:
         return {
             "file_name": os.path.basename(file_path),
             "error": "Failed to extract text from PDF"
         }
+    selection = None
+    if SELECT_PAGES:
+        # Pages come from the extraction cache; short documents are sent whole
+        text, selection = select_text_for_file(file_path, 'document_costs')
+    
+    # A hedge's losing attempt may finish after a winner is chosen; its answer is not logged
+    settled = threading.Event() if HEDGE else None
+    callers = logged_callers(os.path.basename(file_path), settled)
+    if HEDGE:
+        # Primary plus the next model in cascade order as the backup
+        attempts = [
+            (model_key, *MODEL_IDS[model_key], lambda fn=fn: fn(text))
+            for model_key, fn in cascade_callers(CASCADE_PRIMARY, callers)[:2]
+        ]
+        repairs = []
+        try:
+            outcome = hedge.hedged_call(attempts, lambda response: parse_response(response, repairs), is_failed)
+        finally:
+            settled.set()
+        return {
+            "file_name": os.path.basename(file_path),
+            **outcome["parsed"],
+            "hedged_result": outcome["result"],
+            "answered_by": outcome["winner"],
+            "hedged": outcome["hedged"],
+            "hedge_delay": outcome["hedge_delay"],
+            "seconds_to_result": outcome["seconds"],
+            "repair_attempts": sum(repairs),
+            # A failed final answer is re-run by --backfill once the providers recover
+            "backfill": backfill_models(outcome["raw_responses"]) if is_failed(outcome["result"]) else [],
+            "page_selection": selection,
+            "raw_responses": outcome["raw_responses"]
+        }
+    
+    if CASCADE:
+        repairs = []
+        outcome = run_cascade(
+            cascade_callers(CASCADE_PRIMARY, callers), lambda response: parse_response(response, repairs), text
+        )
+        return {
+            "file_name": os.path.basename(file_path),
+            **outcome["parsed"],
+            "cascade": outcome["result"],
+            "tier": outcome["tier"],
+            "escalation_reason": outcome["escalation_reason"],
+            "models_called": outcome["models_called"],
+            "repair_attempts": sum(repairs),
+            # A failed final answer is re-run by --backfill once the providers recover
+            "backfill": backfill_models(outcome["raw_responses"]) if is_failed(outcome["result"]) else [],
+            "page_selection": selection,
+            "raw_responses": outcome["raw_responses"]
+        }
     
     # Call each model
-    claude_response = call_claude_haiku(text)
-    gpt4_response = call_gpt4(text)
-    gemini_response = call_gemini(text)
+    claude_response = callers["claude_haiku"](text)
+    gpt4_response = callers["gpt4o_mini"](text)
+    gemini_response = callers["gemini_flash"](text)
     
     # Parse responses
-    claude_result = parse_document_costs_response(claude_response)
-    gpt4_result = parse_document_costs_response(gpt4_response)
-    gemini_result = parse_document_costs_response(gemini_response)
+    repairs = []
+    claude_result = parse_response(claude_response, repairs)
+    gpt4_result = parse_response(gpt4_response, repairs)
+    gemini_result = parse_response(gemini_response, repairs)
     
     # Combine results
     result = {
@@ -142,32 +170,84 @@ def process_file(file_path):
         "claude_haiku": claude_result,
         "gpt4o_mini": gpt4_result,
         "gemini_flash": gemini_result,
+        "repair_attempts": dict(zip(["claude_haiku", "gpt4o_mini", "gemini_flash"], repairs)),
+        "page_selection": selection,
         "raw_responses": {
             "claude_haiku": claude_response,
             "gpt4o_mini": gpt4_response,
             "gemini_flash": gemini_response
         }
     }
+    # Failed calls are not answers; --backfill re-runs them later
+    result["backfill"] = backfill_models(result["raw_responses"])
     
     return result
 
+def model_field(result, model, field):
+    """CSV value of one model's field; models awaiting backfill have no answer yet."""
+    backfill = result.get("backfill", [])
+    # In cascade and hedged mode a non-empty list means the final answer itself failed
+    if model in backfill or (model in ("cascade", "hedged_result") and model in result and backfill):
+        return "PENDING_BACKFILL"
+    return result.get(model, {}).get(field, "N/A")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract document costs from invoices")
+    parser.add_argument('--batch', action='store_true',
+                        help="Send Claude and GPT requests through the provider batch APIs first")
+    parser.add_argument('--select-pages', action='store_true',
+                        help="Send only the pages most relevant to document costs")
+    parser.add_argument('--cascade', action='store_true',
+                        help="Ask one model first and the others only on parse failure, Unclear or disagreement")
+    parser.add_argument('--primary', choices=list(MODEL_CALLERS), default=CASCADE_PRIMARY,
+                        help="First model asked in cascade and hedged mode")
+    parser.add_argument('--hedge', action='store_true',
+                        help="Race a second provider when the primary is slower than its p95 latency")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of the <extraction> block")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Re-run only the files whose model calls failed in the saved results")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its result log, skipping completed work")
+    return parser.parse_args()
+
 def main():
-    # Process only the specific invoice file
-    target_file = "08628bc5422025-04-11_Order Confirmation - HVW-A00756.pdf"
-    pdf_files = [target_file]
+    global SELECT_PAGES, CASCADE, CASCADE_PRIMARY, HEDGE, STRUCTURED_FAMILY, RESULT_LOG
+    args = parse_args()
+    SELECT_PAGES = args.select_pages
+    CASCADE = args.cascade
+    CASCADE_PRIMARY = args.primary
+    HEDGE = args.hedge
+    STRUCTURED_FAMILY = 'document_costs' if args.structured else None
     
-    print(f"Processing invoice file: {target_file}")
+    # Every answer is appended to the log as it completes; the outputs below are built from it
+    RESULT_LOG = ResultLog(LOG_PATH, resume=args.resume or args.backfill)
+    if args.backfill:
+        pdf_files = backfill_files(RESULT_LOG.results())
+        print(f"Backfilling {len(pdf_files)} invoice files")
+    else:
+        # Process only the specific invoice file
+        target_file = "08628bc5422025-04-11_Order Confirmation - HVW-A00756.pdf"
+        pdf_files = [target_file]
+        if args.resume:
+            pdf_files = [f for f in pdf_files if not RESULT_LOG.is_done(f)]
+        
+        print(f"Processing invoice file: {target_file}")
     
-    # Process the file
-    results = []
-    for file_name in tqdm(pdf_files):
-        file_path = os.path.join("invoices", file_name)
-        result = process_file(file_path)
-        results.append(result)
+    file_paths = [os.path.join("invoices", file_name) for file_name in pdf_files]
+    try:
+        if args.batch:
+            # Answers land in the response cache, so the run below is mostly cache hits
+            run_batch_mode(file_paths, process_file, "document_costs_batch_jobs.json", claude_client, openai_client)
+        
+        # Process the file
+        for file_path, text in tqdm(iter_extracted(file_paths), total=len(file_paths)):
+            RESULT_LOG.add_result(process_file(file_path, text))
+    finally:
+        RESULT_LOG.close()
     
     # Save results to JSON file
-    with open("document_costs_results.json", "w") as f:
-        json.dump(results, f, indent=2)
+    write_json_array("document_costs_results.json", latest_results(LOG_PATH))
     
     # Save results to CSV file
     with open("document_costs_results.csv", "w", newline='') as f:
@@ -189,31 +269,62 @@ def main():
             "gemini_flash_processing_fee",
             "gemini_flash_rush_order",
             "gemini_flash_rush_fee",
-            "gemini_flash_payment_timing"
+            "gemini_flash_payment_timing",
+            "cascade_document_cost",
+            "cascade_processing_fee",
+            "cascade_rush_order",
+            "cascade_rush_fee",
+            "cascade_payment_timing",
+            "cascade_tier",
+            "hedged_document_cost",
+            "hedged_processing_fee",
+            "hedged_rush_order",
+            "hedged_rush_fee",
+            "hedged_payment_timing",
+            "hedged_answered_by"
         ])
         
         # Write data rows
-        for result in results:
+        for result in latest_results(LOG_PATH):
             writer.writerow([
                 result["file_name"],
-                result["claude_haiku"].get("document_cost", "N/A"),
-                result["claude_haiku"].get("processing_fee", "N/A"),
-                result["claude_haiku"].get("rush_order", "N/A"),
-                result["claude_haiku"].get("rush_fee", "N/A"),
-                result["claude_haiku"].get("payment_timing", "N/A"),
-                result["gpt4o_mini"].get("document_cost", "N/A"),
-                result["gpt4o_mini"].get("processing_fee", "N/A"),
-                result["gpt4o_mini"].get("rush_order", "N/A"),
-                result["gpt4o_mini"].get("rush_fee", "N/A"),
-                result["gpt4o_mini"].get("payment_timing", "N/A"),
-                result["gemini_flash"].get("document_cost", "N/A"),
-                result["gemini_flash"].get("processing_fee", "N/A"),
-                result["gemini_flash"].get("rush_order", "N/A"),
-                result["gemini_flash"].get("rush_fee", "N/A"),
-                result["gemini_flash"].get("payment_timing", "N/A")
+                model_field(result, "claude_haiku", "document_cost"),
+                model_field(result, "claude_haiku", "processing_fee"),
+                model_field(result, "claude_haiku", "rush_order"),
+                model_field(result, "claude_haiku", "rush_fee"),
+                model_field(result, "claude_haiku", "payment_timing"),
+                model_field(result, "gpt4o_mini", "document_cost"),
+                model_field(result, "gpt4o_mini", "processing_fee"),
+                model_field(result, "gpt4o_mini", "rush_order"),
+                model_field(result, "gpt4o_mini", "rush_fee"),
+                model_field(result, "gpt4o_mini", "payment_timing"),
+                model_field(result, "gemini_flash", "document_cost"),
+                model_field(result, "gemini_flash", "processing_fee"),
+                model_field(result, "gemini_flash", "rush_order"),
+                model_field(result, "gemini_flash", "rush_fee"),
+                model_field(result, "gemini_flash", "payment_timing"),
+                model_field(result, "cascade", "document_cost"),
+                model_field(result, "cascade", "processing_fee"),
+                model_field(result, "cascade", "rush_order"),
+                model_field(result, "cascade", "rush_fee"),
+                model_field(result, "cascade", "payment_timing"),
+                result.get("tier", "N/A"),
+                model_field(result, "hedged_result", "document_cost"),
+                model_field(result, "hedged_result", "processing_fee"),
+                model_field(result, "hedged_result", "rush_order"),
+                model_field(result, "hedged_result", "rush_fee"),
+                model_field(result, "hedged_result", "payment_timing"),
+                result.get("answered_by") or "N/A"
             ])
     
     print(f"Results saved to document_costs_results.json and document_costs_results.csv")
+    print(f"Streaming stats: {streaming.stats.summary()}")
+    if HEDGE:
+        print(f"Hedging: {hedge.stats.summary()}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+    pending = backfill_files(latest_results(LOG_PATH))
+    if pending:
+        print(f"{len(pending)} files have failed model calls; re-run them with --backfill")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -372,4 +372,55 @@ The accuracy of this extraction is mission-critical, so take extra care in your
 
 Here is the content to analyze:
 {content}
-"""
\ No newline at end of file
+"""
+# Every template above ends by introducing the document with this line
+CONTENT_INTRO = "Here is the content to analyze:\n{content}"
+
+# Shared document block placed ahead of the per-prompt instructions
+DOCUMENT_BLOCK = """Here is the content to analyze:
+<document>
+{content}
+</document>"""
+
+def split_template(template):
+    """Return a template's instructions with the trailing content placeholder removed."""
+    head, sep, tail = template.rpartition(CONTENT_INTRO)
+    if not sep:
+        raise ValueError("Prompt template does not end with the content placeholder")
+    return (head.rstrip() + tail).format()
+
+def render_document_first(template, text):
+    """Render a template as (document, instructions) with the document first.
+
+    The document block is identical for every prompt family, so providers can
+    cache it as a shared prefix and only the instructions differ per call.
+    """
+    document = DOCUMENT_BLOCK.format(content=text)
+    instructions = split_template(template).rstrip() + "\n\nThe content to analyze is the document provided above."
+    return document, instructions
+
+# Prompt families answered together in combined mode, with the tag that wraps each answer
+COMBINED_FAMILIES = [
+    ('property_info', PROPERTY_INFO_PROMPT),
+    ('financial_status', FINANCIAL_STATUS_PROMPT),
+    ('timeline_approval', TIMELINE_APPROVAL_PROMPT),
+    ('document_costs', DOCUMENT_COSTS_PROMPT)
+]
+
+COMBINED_HEADER = """You will complete {count} separate extraction tasks about the same PDF document.
+Each task below is written as if it were the only one. Complete every task in order, following its instructions exactly.
+For each task, write its analysis sections as instructed, but instead of wrapping its final answer in <extraction> tags,
+wrap it in the task's own tag shown in its heading (for example <property_info>...</property_info>).
+Inside that tag use exactly the line format the task asks for in its <extraction> block.
+"""
+
+def build_combined_prompt(families):
+    """Join several prompt families into one template that asks for every answer at once."""
+    sections = [COMBINED_HEADER.format(count=len(families))]
+    for i, (name, template) in enumerate(families, 1):
+        sections.append(f"=== TASK {i}: answer inside <{name}> tags ===\n{split_template(template).strip()}")
+    # Double the braces so the joined instructions survive .format(content=...)
+    body = "\n\n".join(sections).replace("{", "{{").replace("}", "}}")
+    return f"{body}\n\n{CONTENT_INTRO}\n"
+
+COMBINED_EXTRACTION_PROMPT = build_combined_prompt(COMBINED_FAMILIES)
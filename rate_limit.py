@@ -0,0 +1,208 @@
+import os
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+
+# Default (requests per minute, tokens per minute) per provider.
+# Override with e.g. RATE_LIMIT_OPENAI_RPM=5000 / RATE_LIMIT_OPENAI_TPM=2000000
+DEFAULT_LIMITS = {
+    'anthropic': (50, 50000),
+    'openai': (500, 200000),
+    'gemini': (2000, 4000000)
+}
+
+# Retry settings for rate-limited or transient failures
+MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', '6'))
+BASE_BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+
+# Status codes worth retrying (529 is Anthropic's "overloaded")
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+RETRYABLE_ERRORS = {
+    'APIConnectionError', 'APITimeoutError', 'InternalServerError',
+    'ResourceExhausted', 'ServiceUnavailable', 'DeadlineExceeded', 'TooManyRequests'
+}
+
+# Rough characters-per-token ratio used to estimate prompt size before sending
+CHARS_PER_TOKEN = 4
+
+class TokenBucket:
+    """Continuously refilling bucket holding up to `per_minute` units."""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until `amount` units are available (0 if available now)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+class RateLimiter:
+    """Request and token budget for one provider/model, with adaptive slow-down on 429s."""
+
+    def __init__(self, rpm, tpm):
+        self.max_rpm = rpm
+        self.max_tpm = tpm
+        self.scale = 1.0
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        """Block until one request of `estimated_tokens` fits in the budget."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(estimated_tokens, now)
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(estimated_tokens)
+                    return
+            time.sleep(min(wait, 5.0))
+
+    def _set_scale(self, scale):
+        self.scale = min(1.0, max(0.05, scale))
+        self.requests.rate = self.max_rpm * self.scale / 60.0
+        self.tokens.rate = self.max_tpm * self.scale / 60.0
+
+    def on_success(self):
+        """Creep back towards the configured rate after throttling."""
+        with self.lock:
+            if self.scale < 1.0:
+                self._set_scale(self.scale + 0.02)
+
+    def on_rate_limited(self, delay):
+        """Halve the sending rate and pause every caller for `delay` seconds."""
+        with self.lock:
+            self._set_scale(self.scale * 0.5)
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+def _limit_from_env(provider, kind, default):
+    return int(os.getenv(f'RATE_LIMIT_{provider.upper()}_{kind}', default))
+
+def get_limiter(provider, model):
+    """Return the shared limiter for a provider/model pair."""
+    key = (provider, model)
+    with _limiters_lock:
+        if key not in _limiters:
+            rpm, tpm = DEFAULT_LIMITS.get(provider, (60, 100000))
+            _limiters[key] = RateLimiter(
+                _limit_from_env(provider, 'RPM', rpm),
+                _limit_from_env(provider, 'TPM', tpm)
+            )
+        return _limiters[key]
+
+def estimate_tokens(prompt, max_tokens=None):
+    """Estimate the tokens a request will count against a TPM limit."""
+    return len(prompt) // CHARS_PER_TOKEN + (max_tokens or 1000)
+
+def status_code(error):
+    """HTTP-style status code of an API error, if it has one."""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(error):
+    """Whether an API error is a rate limit or transient failure worth retrying."""
+    if status_code(error) in RETRYABLE_STATUS:
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+def retry_after(error):
+    """Return the server-requested delay in seconds from a Retry-After header, if any."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    value = headers.get('retry-after-ms')
+    if value:
+        try:
+            return float(value) / 1000.0
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff for the given attempt number."""
+    return random.uniform(0, min(MAX_BACKOFF, BASE_BACKOFF * 2 ** attempt))
+
+def call_with_rate_limit(provider, model, fn, prompt, max_tokens=None, max_retries=None, on_retry=None,
+                         breaker=None):
+    """Call fn() within the provider/model budget, retrying 429s and transient errors.
+
+    Non-retryable errors, and the last error once retries run out, are raised.
+    on_retry() is called before each retry. With a circuit breaker every
+    attempt is recorded, and attempts are refused (CircuitOpenError) while
+    the circuit is open, which also cuts short the retries of calls in flight.
+    """
+    limiter = get_limiter(provider, model)
+    estimated = estimate_tokens(prompt, max_tokens)
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.allow()
+        limiter.acquire(estimated)
+        try:
+            result = fn()
+        except Exception as e:
+            if breaker is not None:
+                breaker.record(e)
+            if attempt >= max_retries or not is_retryable(e) or (breaker is not None and breaker.is_open()):
+                raise
+            delay = retry_after(e)
+            if delay is None:
+                delay = backoff_delay(attempt)
+            else:
+                # Spread callers that were all told the same Retry-After
+                delay += random.uniform(0, 1.0)
+            if status_code(e) == 429 or type(e).__name__ in ('ResourceExhausted', 'TooManyRequests'):
+                limiter.on_rate_limited(delay)
+            print(f"{provider}/{model}: {type(e).__name__}, retrying in {delay:.1f}s")
+            if on_retry is not None:
+                on_retry()
+            time.sleep(delay)
+            attempt += 1
+            continue
+        limiter.on_success()
+        if breaker is not None:
+            breaker.record(None)
+        return result
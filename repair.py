@@ -0,0 +1,93 @@
+import os
+import re
+import clients
+import llm
+import telemetry
+from prompts import split_template
+
+# Cheap model that reformats a malformed answer (it never sees the document)
+REPAIR_MODEL = os.getenv('REPAIR_MODEL', 'gpt-4o-mini')
+REPAIR_MAX_ATTEMPTS = int(os.getenv('REPAIR_MAX_ATTEMPTS', '1'))
+REPAIR_MAX_TOKENS = 1000
+
+REPAIR_PROMPT = """The text below is a model's answer that was supposed to end with a block in exactly this format:
+
+{block}
+
+Rewrite the information from the answer into that block. Do not add anything the answer does not say; \
+use N/A where it gives nothing. Reply with the block only.
+
+<answer_to_reformat>
+{{content}}
+</answer_to_reformat>
+"""
+
+# Answer blocks of the backtest_multi prompts
+ANSWER_BLOCKS = {
+    'attachments': "<answer>\n[the answer]\n</answer>",
+    'extra_associations': "<answer>\n[the answer]\n</answer>",
+    'buyer_approval': "<answer>\n[the answer]\n</answer>",
+    'doc_costs': "<answers>\n1. [document cost]\n2. [rush order]\n3. [rush fee]\n4. [payment timing]\n</answers>",
+    'hoa_names': "<answer>\nHOA: [HOA name]\nPM: [property management company name]\n</answer>"
+}
+
+def expected_block(family, template=None):
+    """Return the answer block a family's prompt asks for."""
+    if family in ANSWER_BLOCKS:
+        return ANSWER_BLOCKS[family]
+    match = re.search(r'<extraction>.*?</extraction>', split_template(template), re.DOTALL)
+    if not match:
+        raise ValueError(f"No <extraction> block in the {family} prompt")
+    return match.group(0)
+
+def repair_template(family, template=None):
+    """Build the repair prompt for a family; the malformed answer fills {content}."""
+    block = expected_block(family, template)
+    repair = REPAIR_PROMPT.format(block=block.replace("{", "{{").replace("}", "}}"))
+    telemetry.register_family(f"repair_{family}", repair)
+    return repair
+
+def needs_repair(parsed):
+    """True when a parser reported that the answer block was missing or malformed."""
+    if isinstance(parsed, dict):
+        if 'error' in parsed:
+            return True
+        return bool(parsed) and all(str(value).startswith('Error') for value in parsed.values())
+    return str(parsed).startswith('Error')
+
+def parse_with_repair(family, response, parse, template=None, max_attempts=None):
+    """Parse a response, asking a cheap model to reformat it while parsing fails.
+
+    Only the model's own answer is sent back, never the document. Failed
+    calls (responses that are themselves error messages) are not repaired.
+    Returns (parsed, attempts), where attempts is the number of repair calls.
+    """
+    parsed = parse(response)
+    if not needs_repair(parsed) or not response or str(response).startswith('Error'):
+        return parsed, 0
+
+    max_attempts = REPAIR_MAX_ATTEMPTS if max_attempts is None else max_attempts
+    repair = repair_template(family, template)
+    attempts = 0
+    while attempts < max_attempts and needs_repair(parsed):
+        attempts += 1
+        try:
+            repaired = llm.call_openai(
+                clients.get_client('openai'),
+                REPAIR_MODEL,
+                repair,
+                response,
+                max_tokens=REPAIR_MAX_TOKENS,
+                # Later attempts sample differently instead of re-reading the cached first answer
+                temperature=min(1.0, 0.3 * (attempts - 1))
+            )
+        except Exception as e:
+            print(f"Repair call failed: {e}")
+            break
+        if repaired is None:
+            # Batch collection pass: the repair runs in the normal pass
+            break
+        candidate = parse(repaired)
+        if not needs_repair(candidate):
+            parsed = candidate
+    return parsed, attempts
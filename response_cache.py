@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# SQLite file holding cached model responses
+CACHE_PATH = os.getenv('LLM_CACHE_PATH', '.llm_cache.sqlite3')
+
+# Eviction limits: entries beyond MAX_ENTRIES are dropped least-recently-used first,
+# and anything not used for MAX_AGE_DAYS is dropped regardless
+MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '200000'))
+MAX_AGE_DAYS = float(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '90'))
+
+# Run eviction once every this many writes
+EVICT_EVERY = 500
+
+# LLM_CACHE_BYPASS=1 skips lookups (fresh responses are still stored)
+BYPASS = os.getenv('LLM_CACHE_BYPASS', '') not in ('', '0', 'false', 'False')
+
+def sha256_text(text):
+    """Return the SHA-256 hex digest of a string."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def make_key(provider, model, params, template, text):
+    """Build the cache key and its components for one model call."""
+    prompt_hash = sha256_text(template)
+    document_hash = sha256_text(text)
+    params_json = json.dumps(params, sort_keys=True)
+    key = sha256_text('\x1f'.join([provider, model, params_json, prompt_hash, document_hash]))
+    return key, {
+        'provider': provider,
+        'model': model,
+        'params': params_json,
+        'prompt_hash': prompt_hash,
+        'document_hash': document_hash
+    }
+
+class ResponseCache:
+    """SQLite-backed store of raw model responses."""
+
+    def __init__(self, path=None, max_entries=None, max_age_days=None):
+        self.path = path or CACHE_PATH
+        self.max_entries = max_entries or MAX_ENTRIES
+        self.max_age_days = max_age_days or MAX_AGE_DAYS
+        self.local = threading.local()
+        self.writes = 0
+        self.lock = threading.Lock()
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                params TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                document_hash TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """Return the cached response for key, or None."""
+        conn = self._connect()
+        row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key, fields, response):
+        """Store a response under key."""
+        now = time.time()
+        self._connect().execute(
+            'INSERT OR REPLACE INTO responses '
+            '(key, provider, model, params, prompt_hash, document_hash, response, created_at, last_used) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, fields['provider'], fields['model'], fields['params'], fields['prompt_hash'],
+             fields['document_hash'], response, now, now)
+        )
+        with self.lock:
+            self.writes += 1
+            evict = self.writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        """Drop entries older than max_age_days, then the least recently used beyond max_entries."""
+        conn = self._connect()
+        cutoff = time.time() - self.max_age_days * 86400
+        conn.execute('DELETE FROM responses WHERE last_used < ?', (cutoff,))
+        conn.execute(
+            'DELETE FROM responses WHERE key IN ('
+            'SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        """Remove every cached response."""
+        self._connect().execute('DELETE FROM responses')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the process-wide response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+def set_bypass(enabled):
+    """Turn cache lookups off (True) or on (False) for this process."""
+    global BYPASS
+    BYPASS = enabled
+
+def cached_call(provider, model, params, template, text, fn):
+    """Return the cached response for this call, or run fn() and cache its result."""
+    cache = get_cache()
+    key, fields = make_key(provider, model, params, template, text)
+    if not BYPASS:
+        response = cache.get(key)
+        if response is not None:
+            return response
+    response = fn()
+    if response is not None:
+        cache.put(key, fields, response)
+    return response
@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import threading
+from circuit_breaker import needs_backfill
+
+# fsync the log after this many records or this many seconds, whichever comes first
+# (every record is flushed to the OS straight away, so only a machine crash can lose the last batch)
+FSYNC_EVERY = int(os.getenv('RESULT_LOG_FSYNC_EVERY', '20'))
+FSYNC_SECONDS = float(os.getenv('RESULT_LOG_FSYNC_SECONDS', '2'))
+
+def read_records(path):
+    """Yield the records of a log, skipping a line cut short by a crash."""
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+def latest_results(path):
+    """Yield the newest result of every file in the log, in first-seen order.
+
+    Only a file name -> offset index is held in memory; each result is read
+    back from disk as it is yielded.
+    """
+    if not os.path.exists(path):
+        return
+    order = []
+    offsets = {}
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if line.endswith(b'\n') and line.startswith(b'{"type": "file"'):
+                name = json.loads(line)['file_name']
+                if name not in offsets:
+                    order.append(name)
+                offsets[name] = offset
+            offset += len(line)
+        for name in order:
+            f.seek(offsets[name])
+            yield json.loads(f.readline())['result']
+
+def write_json_array(path, results):
+    """Write results as a JSON list one item at a time (same layout as json.dump(..., indent=2))."""
+    count = 0
+    with open(path, 'w') as f:
+        f.write('[')
+        for result in results:
+            item = json.dumps(result, indent=2).replace('\n', '\n  ')
+            f.write((',\n  ' if count else '\n  ') + item)
+            count += 1
+        f.write('\n]' if count else ']')
+    return count
+
+class ResultLog:
+    """Append-only JSONL log of a run's results.
+
+    A "unit" record holds the raw answer of one (file, prompt, model) call as
+    soon as it completes; a "file" record holds a file's full result. With
+    resume, files that already have a result are skipped and completed units
+    of unfinished files are replayed instead of called again.
+    """
+
+    def __init__(self, path, resume=False, fsync_every=None, fsync_seconds=None):
+        self.path = path
+        self.fsync_every = fsync_every or FSYNC_EVERY
+        self.fsync_seconds = FSYNC_SECONDS if fsync_seconds is None else fsync_seconds
+        self.lock = threading.Lock()
+        self.done_files = set()
+        self.units = {}
+        if resume:
+            self._load()
+            self._drop_partial_line()
+        elif os.path.exists(path) and os.path.getsize(path):
+            # Keep the previous run's log rather than overwrite answers already paid for
+            os.replace(path, f"{path}.prev")
+            print(f"Previous result log moved to {path}.prev")
+        self.file = open(path, 'a')
+        self.pending = 0
+        self.synced_at = time.monotonic()
+
+    def _load(self):
+        for record in read_records(self.path):
+            if record['type'] == 'file':
+                self.done_files.add(record['file_name'])
+            elif record['type'] == 'unit':
+                self.units[(record['file_name'], record['prompt'], record['model'])] = record['raw_response']
+        # Units of finished files will not be needed again
+        self.units = {key: value for key, value in self.units.items() if key[0] not in self.done_files}
+
+    def _drop_partial_line(self):
+        # A crash mid-write leaves a partial last line; cut it so new records start cleanly
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            data_end = f.seek(0, os.SEEK_END)
+            if data_end == 0:
+                return
+            f.seek(max(0, data_end - 1))
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            keep = f.read().rfind(b'\n') + 1
+            f.truncate(keep)
+
+    def append(self, record):
+        """Write one record, fsyncing in batches."""
+        line = json.dumps(record) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            self.pending += 1
+            if self.pending >= self.fsync_every or time.monotonic() - self.synced_at >= self.fsync_seconds:
+                self._sync()
+
+    def _sync(self):
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.synced_at = time.monotonic()
+
+    def call_unit(self, file_name, prompt, model, fn, should_log=None):
+        """Return the logged answer of a unit, or run fn() and log its answer.
+
+        Failed calls are returned but not logged, so they run again on resume.
+        should_log() is asked once fn() returns; False skips logging an answer
+        that came too late to be used (e.g. a hedge's losing attempt).
+        """
+        key = (file_name, prompt, model)
+        with self.lock:
+            if key in self.units:
+                return self.units[key]
+        response = fn()
+        if should_log is not None and not should_log():
+            return response
+        if not needs_backfill(response):
+            self.append({
+                'type': 'unit', 'file_name': file_name, 'prompt': prompt, 'model': model,
+                'raw_response': response
+            })
+        return response
+
+    def add_result(self, result):
+        """Log a file's full result; its units are no longer needed."""
+        self.append({'type': 'file', 'file_name': result['file_name'], 'result': result})
+        with self.lock:
+            self.done_files.add(result['file_name'])
+        self.discard_units(result['file_name'])
+
+    def discard_units(self, file_name):
+        """Forget the logged units of a file (e.g. because the file has changed)."""
+        with self.lock:
+            for key in [key for key in self.units if key[0] == file_name]:
+                del self.units[key]
+
+    def is_done(self, file_name):
+        return file_name in self.done_files
+
+    def results(self):
+        """Newest result of every file logged so far."""
+        with self.lock:
+            self.file.flush()
+        return latest_results(self.path)
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                self._sync()
+                self.file.close()
@@ -1,153 +1,113 @@
 import os
-import json
-import re
-from PyPDF2 import PdfReader
-import anthropic
-import openai
-import google.generativeai as genai
-from dotenv import load_dotenv
+import argparse
 from tqdm import tqdm
 
-# Load environment variables
-load_dotenv()
+# Prompt, parser and models are declared in tasks.py
+import tasks
+from pdf_text import extract_text_from_pdf
+from pipeline import iter_extracted
+from dedup import find_duplicates, fan_out
+from cascade import run_cascade, is_failed
+import circuit_breaker
+from circuit_breaker import backfill_models, backfill_files
+from result_log import ResultLog, latest_results, write_json_array
+import streaming
+from streaming import EXTRACTION_STOP
 
-# Initialize API clients
-claude_client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-openai.api_key = os.getenv("OPENAI_API_KEY")
+# Cheap-first mode: ask CASCADE_PRIMARY first, the others only when needed (set by --cascade)
+CASCADE = False
+CASCADE_PRIMARY = os.getenv('CASCADE_PRIMARY', 'gpt4o_mini')
 
-# Configure Gemini with API key
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Stream responses and stop at the closing tag the parser needs (None waits for the full response)
+STREAM_STOP = EXTRACTION_STOP
 
-# Model configurations
-claude_model = "claude-3-haiku-20240307"
-gpt4_model = "gpt-4o-mini"
-gemini_model = "gemini-1.5-flash"
+# Schema-constrained JSON output instead of the <extraction> block (set by --structured)
+STRUCTURED_FAMILY = None
 
-# Import the prompt
-from prompts import PROPERTY_INFO_PROMPT
+# Append-only log of this run's results (see result_log.py, set in main)
+RESULT_LOG = None
+LOG_PATH = "property_info_results.jsonl"
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from a PDF file."""
-    try:
-        reader = PdfReader(pdf_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
-    except Exception as e:
-        print(f"Error extracting text from {pdf_path}: {e}")
-        return None
+def parse_response(response, repairs=None):
+    """Parse a response in whichever output mode is active.
 
-def parse_property_info_response(response):
-    """Parse the response from the model to extract property information."""
-    try:
-        # Extract the content between <extraction> tags
-        extraction_match = re.search(r'<extraction>(.*?)</extraction>', response, re.DOTALL)
-        if not extraction_match:
-            return {"error": "No extraction found in response"}
-        
-        extraction_text = extraction_match.group(1).strip()
-        
-        # Parse each field
-        result = {}
-        
-        # Property Address
-        address_match = re.search(r'Property Address: (.*?)(?:\n|$)', extraction_text)
-        result["property_address"] = address_match.group(1).strip() if address_match else "N/A"
-        
-        # Seller Name
-        seller_match = re.search(r'Seller Name: (.*?)(?:\n|$)', extraction_text)
-        result["seller_name"] = seller_match.group(1).strip() if seller_match else "N/A"
-        
-        # Buyer Name
-        buyer_match = re.search(r'Buyer Name: (.*?)(?:\n|$)', extraction_text)
-        result["buyer_name"] = buyer_match.group(1).strip() if buyer_match else "N/A"
-        
-        # HOA Name
-        hoa_match = re.search(r'HOA Name: (.*?)(?:\n|$)', extraction_text)
-        result["hoa_name"] = hoa_match.group(1).strip() if hoa_match else "N/A"
-        
-        # PM Name
-        pm_match = re.search(r'PM Name: (.*?)(?:\n|$)', extraction_text)
-        result["pm_name"] = pm_match.group(1).strip() if pm_match else "N/A"
-        
-        # Additional HOAs or special districts
-        additional_match = re.search(r'Additional HOAs or special districts: (.*?)(?:\n|$)', extraction_text)
-        result["additional_associations"] = additional_match.group(1).strip() if additional_match else "N/A"
-        
-        # File Number
-        file_match = re.search(r'File Number: (.*?)(?:\n|$)', extraction_text)
-        result["file_number"] = file_match.group(1).strip() if file_match else "N/A"
-        
-        # Document Attachments
-        attachments_match = re.search(r'Document Attachments: (.*?)(?:\n|$)', extraction_text)
-        result["document_attachments"] = attachments_match.group(1).strip() if attachments_match else "N/A"
-        
-        return result
-    except Exception as e:
-        return {"error": f"Error parsing response: {e}"}
+    A malformed <extraction> block is sent to a cheap model for reformatting
+    (see repair.py); the number of repair calls is appended to `repairs`.
+    """
+    parsed, attempts = tasks.parse_response('property_info', response, STRUCTURED_FAMILY is not None)
+    if repairs is not None:
+        repairs.append(attempts)
+    return parsed
 
-def call_claude_haiku(text):
-    """Call Claude Haiku model with the property info prompt."""
-    try:
-        response = claude_client.messages.create(
-            model=claude_model,
-            max_tokens=4000,
-            temperature=0,
-            system="You are a helpful assistant that extracts information from PDF documents.",
-            messages=[
-                {"role": "user", "content": PROPERTY_INFO_PROMPT.format(content=text)}
-            ]
-        )
-        return response.content[0].text
-    except Exception as e:
-        return f"Error calling Claude Haiku: {e}"
+def call_model(model_key, text):
+    """Call one of the task's models with the property info prompt."""
+    return tasks.call_model('property_info', model_key, text, STRUCTURED_FAMILY is not None, stop_at=STREAM_STOP)
 
-def call_gpt4(text):
-    """Call GPT-4o-mini model with the property info prompt."""
-    try:
-        response = openai.chat.completions.create(
-            model=gpt4_model,
-            temperature=0,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that extracts information from PDF documents."},
-                {"role": "user", "content": PROPERTY_INFO_PROMPT.format(content=text)}
-            ]
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error calling GPT-4o-mini: {e}"
+MODEL_CALLERS = {
+    model_key: lambda text, model_key=model_key: call_model(model_key, text)
+    for model_key in tasks.get_task('property_info')['models']
+}
 
-def call_gemini(text):
-    """Call Gemini Flash model with the property info prompt."""
-    try:
-        model = genai.GenerativeModel(gemini_model)
-        response = model.generate_content(PROPERTY_INFO_PROMPT.format(content=text))
-        return response.text
-    except Exception as e:
-        return f"Error calling Gemini Flash: {e}"
+def cascade_callers(primary, callers=None):
+    """Model callers in cascade order: the primary first, then the rest."""
+    callers = callers or MODEL_CALLERS
+    return [(primary, callers[primary])] + [
+        (model_key, fn) for model_key, fn in callers.items() if model_key != primary
+    ]
+
+def logged_callers(file_name):
+    """MODEL_CALLERS whose answers are logged as they complete (and replayed on --resume)."""
+    if RESULT_LOG is None:
+        return MODEL_CALLERS
+    return {
+        model_key: lambda text, model_key=model_key, fn=fn: RESULT_LOG.call_unit(
+            file_name, 'property_info', model_key, lambda: fn(text)
+        )
+        for model_key, fn in MODEL_CALLERS.items()
+    }
 
-def process_file(file_path):
+def process_file(file_path, text=None):
     """Process a single file with all three models."""
     print(f"\nProcessing file: {os.path.basename(file_path)}")
     
-    # Extract text from PDF
-    text = extract_text_from_pdf(file_path)
+    # Extract text from PDF unless the extraction stage already did
+    if text is None:
+        text = extract_text_from_pdf(file_path)
     if not text:
         return {
             "file_name": os.path.basename(file_path),
             "error": "Failed to extract text from PDF"
         }
     
+    callers = logged_callers(os.path.basename(file_path))
+    if CASCADE:
+        repairs = []
+        outcome = run_cascade(
+            cascade_callers(CASCADE_PRIMARY, callers), lambda response: parse_response(response, repairs), text
+        )
+        return {
+            "file_name": os.path.basename(file_path),
+            **outcome["parsed"],
+            "cascade": outcome["result"],
+            "tier": outcome["tier"],
+            "escalation_reason": outcome["escalation_reason"],
+            "models_called": outcome["models_called"],
+            "repair_attempts": sum(repairs),
+            # A failed final answer is re-run by --backfill once the providers recover
+            "backfill": backfill_models(outcome["raw_responses"]) if is_failed(outcome["result"]) else [],
+            "raw_responses": outcome["raw_responses"]
+        }
+    
     # Call each model
-    claude_response = call_claude_haiku(text)
-    gpt4_response = call_gpt4(text)
-    gemini_response = call_gemini(text)
+    claude_response = callers["claude_haiku"](text)
+    gpt4_response = callers["gpt4o_mini"](text)
+    gemini_response = callers["gemini_flash"](text)
     
     # Parse responses
-    claude_result = parse_property_info_response(claude_response)
-    gpt4_result = parse_property_info_response(gpt4_response)
-    gemini_result = parse_property_info_response(gemini_response)
+    repairs = []
+    claude_result = parse_response(claude_response, repairs)
+    gpt4_result = parse_response(gpt4_response, repairs)
+    gemini_result = parse_response(gemini_response, repairs)
     
     # Combine results
     result = {
@@ -155,37 +115,76 @@ def process_file(file_path):
         "claude_haiku": claude_result,
         "gpt4o_mini": gpt4_result,
         "gemini_flash": gemini_result,
+        "repair_attempts": dict(zip(["claude_haiku", "gpt4o_mini", "gemini_flash"], repairs)),
         "raw_responses": {
             "claude_haiku": claude_response,
             "gpt4o_mini": gpt4_response,
             "gemini_flash": gemini_response
         }
     }
+    # Failed calls are not answers; --backfill re-runs them later
+    result["backfill"] = backfill_models(result["raw_responses"])
     
     return result
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Extract property information from status letters")
+    parser.add_argument('--cascade', action='store_true',
+                        help="Ask one model first and the others only on parse failure, Unclear or disagreement")
+    parser.add_argument('--primary', choices=list(MODEL_CALLERS), default=CASCADE_PRIMARY,
+                        help="First model asked in cascade mode")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of the <extraction> block")
+    parser.add_argument('--backfill', action='store_true',
+                        help="Re-run only the files whose model calls failed in the saved results")
+    parser.add_argument('--resume', action='store_true',
+                        help="Continue an interrupted run from its result log, skipping completed work")
+    return parser.parse_args()
+
 def main():
-    # Get list of PDF files
-    pdf_files = [f for f in os.listdir("files") if f.endswith(".pdf")]
-    pdf_files.sort()  # Sort alphabetically
-    
-    # Process only the first 5 files
-    pdf_files = pdf_files[:5]
+    global CASCADE, CASCADE_PRIMARY, STRUCTURED_FAMILY, RESULT_LOG
+    args = parse_args()
+    CASCADE = args.cascade
+    CASCADE_PRIMARY = args.primary
+    STRUCTURED_FAMILY = 'property_info' if args.structured else None
     
-    print(f"Processing {len(pdf_files)} files with PROPERTY_INFO_PROMPT...")
+    # Every answer is appended to the log as it completes; the output below is built from it
+    RESULT_LOG = ResultLog(LOG_PATH, resume=args.resume or args.backfill)
+    if args.backfill:
+        pdf_files = backfill_files(RESULT_LOG.results())
+        print(f"Backfilling {len(pdf_files)} files with PROPERTY_INFO_PROMPT...")
+    else:
+        # Get list of PDF files
+        pdf_files = [f for f in os.listdir("files") if f.endswith(".pdf")]
+        pdf_files.sort()  # Sort alphabetically
+        
+        # Process only the first 5 files
+        pdf_files = pdf_files[:5]
+        if args.resume:
+            pdf_files = [f for f in pdf_files if not RESULT_LOG.is_done(f)]
+        
+        print(f"Processing {len(pdf_files)} files with PROPERTY_INFO_PROMPT...")
     
     # Process each file
-    results = []
-    for file_name in tqdm(pdf_files):
-        file_path = os.path.join("files", file_name)
-        result = process_file(file_path)
-        results.append(result)
+    file_paths = [os.path.join("files", file_name) for file_name in pdf_files]
+    # Duplicate copies of a document are answered once and share the result
+    file_paths, groups = find_duplicates(file_paths)
+    try:
+        for file_path, text in tqdm(iter_extracted(file_paths), total=len(file_paths)):
+            for result in fan_out([process_file(file_path, text)], groups):
+                RESULT_LOG.add_result(result)
+    finally:
+        RESULT_LOG.close()
     
     # Save results to JSON file
-    with open("property_info_results.json", "w") as f:
-        json.dump(results, f, indent=2)
+    write_json_array("property_info_results.json", latest_results(LOG_PATH))
     
     print(f"Results saved to property_info_results.json")
+    print(f"Streaming stats: {streaming.stats.summary()}")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+    pending = backfill_files(latest_results(LOG_PATH))
+    if pending:
+        print(f"{len(pending)} files have failed model calls; re-run them with --backfill")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,262 @@
+import os
+import re
+import time
+import heapq
+import asyncio
+import itertools
+from datetime import datetime, timedelta
+from async_engine import CallRunner
+from result_log import latest_results
+
+# Share of call slots each priority class gets while several classes are waiting
+# (weighted fair queueing); within a class the earliest deadline goes first
+PRIORITY_WEIGHTS = {
+    'rush': int(os.getenv('PRIORITY_WEIGHT_RUSH', '4')),
+    'urgent': int(os.getenv('PRIORITY_WEIGHT_URGENT', '2')),
+    'normal': int(os.getenv('PRIORITY_WEIGHT_NORMAL', '1'))
+}
+
+# A deadline closer than this makes a file urgent
+URGENT_HOURS = float(os.getenv('PRIORITY_URGENT_HOURS', '48'))
+
+# Results are needed this many days before closing
+CLOSING_LEAD_DAYS = int(os.getenv('PRIORITY_CLOSING_LEAD_DAYS', '1'))
+
+# Turnaround assumed when the document states none, in business days from the order date
+DEFAULT_TURNAROUND_DAYS = int(os.getenv('PRIORITY_DEFAULT_TURNAROUND_DAYS', '10'))
+
+# How many of the most overdue files a run's deadline report names
+MAX_MISSED_FILES = int(os.getenv('PRIORITY_MAX_MISSED_FILES', '100'))
+
+FILENAME_DATE_RE = re.compile(r'(\d{4}-\d{2}-\d{2})')
+# "Package Rush Status Letter Package (3 Business Days)", "Package Expedited (1-2business days) ..."
+PACKAGE_RE = re.compile(r'^Package\s+(Rush|Expedited|Standard)\b(.*)$', re.IGNORECASE | re.MULTILINE)
+BUSINESS_DAYS_RE = re.compile(r'(\d+)\s*(?:-\s*(\d+))?\s*business\s*days?|business\s*(\d+)\s*days?', re.IGNORECASE)
+CLOSING_DATE_RE = re.compile(
+    r'(?:settlement|closing|close of escrow)\s*date:?\s*(\d{1,2}/\d{1,2}/\d{2,4}|\d{4}-\d{2}-\d{2})', re.IGNORECASE
+)
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%B %d, %Y', '%b %d, %Y', '%d %B %Y')
+
+class Priority:
+    """Priority class, deadline (epoch seconds, None for none) and why."""
+
+    def __init__(self, klass='normal', deadline=None, reason=None):
+        self.klass = klass
+        self.deadline = deadline
+        self.reason = reason
+
+    def sort_key(self):
+        # Heavier classes first, then earliest deadline
+        return (-PRIORITY_WEIGHTS.get(self.klass, 1), self.deadline if self.deadline is not None else float('inf'))
+
+    def __repr__(self):
+        deadline = time.strftime('%Y-%m-%d', time.localtime(self.deadline)) if self.deadline else None
+        return f"Priority({self.klass}, deadline={deadline}, {self.reason})"
+
+NORMAL = Priority()
+
+def parse_date(value):
+    """Parse a date as written in documents or model answers, or return None."""
+    value = str(value or '').strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def add_business_days(start, days):
+    current = start
+    while days > 0:
+        current += timedelta(days=1)
+        if current.weekday() < 5:
+            days -= 1
+    return current
+
+def filename_date(file_name):
+    """Order date embedded in a file name such as '...2025-04-11_Order Confirmation...'."""
+    match = FILENAME_DATE_RE.search(file_name)
+    return parse_date(match.group(1)) if match else None
+
+def text_hints(text):
+    """Cheap first pass over the document text: package speed, turnaround and closing date."""
+    hints = {}
+    package = PACKAGE_RE.search(text or '')
+    if package:
+        hints['rush'] = package.group(1).lower() in ('rush', 'expedited')
+        days = BUSINESS_DAYS_RE.search(package.group(2))
+        if days:
+            hints['turnaround_days'] = int(days.group(2) or days.group(1) or days.group(3))
+    closing = CLOSING_DATE_RE.search(text or '')
+    if closing:
+        hints['closing_date'] = parse_date(closing.group(1))
+    return hints
+
+def result_hints(task_name, result):
+    """Rush status or closing date from a model answer of document_costs or timeline_approval.
+
+    Only answers that parsed and whose model is not awaiting backfill count,
+    so a run that failed during an outage leaves the text scan in charge.
+    """
+    hints = {}
+    backfill = result.get('backfill') or []
+    answers = [value for key, value in result.items() if isinstance(value, dict) and key not in (
+        'raw_responses', 'repair_attempts', 'page_selection'
+    ) and key not in backfill and not value.get('error')]
+    if task_name == 'document_costs':
+        rush_orders = [str(answer.get('rush_order', '')).strip().lower() for answer in answers]
+        votes = [rush_order.startswith('yes') for rush_order in rush_orders if rush_order.startswith(('yes', 'no'))]
+        if votes:
+            hints['rush'] = any(votes)
+    elif task_name == 'timeline_approval':
+        dates = [parse_date(answer.get('closing_date')) for answer in answers]
+        dates = [day for day in dates if day]
+        if dates:
+            hints['closing_date'] = min(dates)
+    return hints
+
+def load_hints(log_paths):
+    """Hints per file name from earlier model answers in the result logs ({task name: log path})."""
+    hints = {}
+    for task_name, path in log_paths.items():
+        for result in latest_results(path):
+            found = result_hints(task_name, result)
+            if found:
+                hints.setdefault(result['file_name'], {}).update(found)
+    return hints
+
+def classify(file_name, text=None, known=None, now=None):
+    """Priority of a file from its name, a cheap scan of its text and earlier model answers.
+
+    Model answers (known) override the text scan. The deadline is the
+    earlier of the stated turnaround from the order date and the day before
+    closing.
+    """
+    now = time.time() if now is None else now
+    hints = text_hints(text) if text else {}
+    hints.update(known or {})
+    deadlines = []
+    ordered = filename_date(file_name)
+    if ordered:
+        days = hints.get('turnaround_days', DEFAULT_TURNAROUND_DAYS)
+        deadlines.append((add_business_days(ordered, days), f"ordered {ordered}, {days} business days"))
+    if hints.get('closing_date'):
+        deadlines.append((hints['closing_date'] - timedelta(days=CLOSING_LEAD_DAYS), f"closing {hints['closing_date']}"))
+    deadline, reason = min(deadlines) if deadlines else (None, "no dates")
+    deadline_ts = time.mktime(deadline.timetuple()) if deadline else None
+    if hints.get('rush'):
+        klass = 'rush'
+    elif deadline_ts is not None and deadline_ts - now < URGENT_HOURS * 3600:
+        klass = 'urgent'
+    else:
+        klass = 'normal'
+    return Priority(klass, deadline_ts, reason)
+
+class PriorityGate:
+    """A fixed number of slots handed out by weighted fair queueing across classes
+    and earliest deadline first within a class."""
+
+    def __init__(self, slots, weights=None):
+        self.free = slots
+        self.weights = weights or PRIORITY_WEIGHTS
+        self.waiting = {klass: [] for klass in self.weights}
+        # Slots each class has been given, divided by its weight
+        self.virtual = {klass: 0.0 for klass in self.weights}
+        self.counter = itertools.count()
+
+    def _charge(self, klass):
+        self.virtual[klass] += 1.0 / self.weights[klass]
+
+    async def acquire(self, priority=None):
+        priority = priority or NORMAL
+        klass = priority.klass if priority.klass in self.weights else 'normal'
+        if self.free > 0 and not any(self.waiting.values()):
+            self.free -= 1
+            self._charge(klass)
+            return
+        if not self.waiting[klass]:
+            # A class returning from idle starts level with the busiest one instead of
+            # spending credit it saved up while it had nothing queued
+            active = [self.virtual[k] for k, heap in self.waiting.items() if heap]
+            if active:
+                self.virtual[klass] = max(self.virtual[klass], min(active))
+        deadline = priority.deadline if priority.deadline is not None else float('inf')
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting[klass], (deadline, next(self.counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as the waiter was cancelled: give it back
+                self.release()
+            raise
+
+    def release(self):
+        self.free += 1
+        while self.free > 0:
+            ready = [klass for klass, heap in self.waiting.items() if heap]
+            if not ready:
+                return
+            klass = min(ready, key=lambda k: (self.virtual[k], -self.weights[k]))
+            _, _, future = heapq.heappop(self.waiting[klass])
+            if future.cancelled():
+                continue
+            self.free -= 1
+            self._charge(klass)
+            future.set_result(None)
+
+class DeadlineReport:
+    """Completed files per priority class, and the ones that finished after their deadline.
+
+    Only counters and the max_missed most overdue files are kept, so a
+    long-running watcher or service does not grow it without bound.
+    """
+
+    def __init__(self, max_missed=None):
+        self.max_missed = max_missed or MAX_MISSED_FILES
+        self.classes = {}
+        # Min-heap of (seconds late, file name): the least overdue is dropped first
+        self.late = []
+
+    def record(self, file_name, priority, finished_at=None):
+        finished_at = time.time() if finished_at is None else finished_at
+        stats = self.classes.setdefault(priority.klass, {'files': 0, 'missed': 0, 'max_hours_late': 0.0})
+        stats['files'] += 1
+        if priority.deadline is not None and finished_at > priority.deadline:
+            late = finished_at - priority.deadline
+            stats['missed'] += 1
+            stats['max_hours_late'] = round(max(stats['max_hours_late'], late / 3600), 1)
+            if len(self.late) < self.max_missed:
+                heapq.heappush(self.late, (late, file_name))
+            else:
+                heapq.heappushpop(self.late, (late, file_name))
+
+    def summary(self):
+        return {klass: dict(stats) for klass, stats in self.classes.items()}
+
+    def missed_count(self):
+        return sum(stats['missed'] for stats in self.classes.values())
+
+    def missed(self):
+        """File names that finished after their deadline, most overdue first (up to max_missed)."""
+        return [file_name for _, file_name in sorted(self.late, reverse=True)]
+
+class PriorityCallRunner(CallRunner):
+    """CallRunner whose slots go to calls by priority instead of arrival order.
+
+    Calls without a priority are 'normal' with no deadline, so with no
+    priorities given it behaves like a plain FIFO CallRunner.
+    """
+
+    def __init__(self, max_concurrency=None, weights=None):
+        super().__init__(max_concurrency)
+        self.gate = PriorityGate(self.max_concurrency, weights)
+        self.deadlines = DeadlineReport()
+
+    async def run(self, fn, *args, priority=None):
+        await self.gate.acquire(priority)
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, fn, *args)
+        finally:
+            self.gate.release()
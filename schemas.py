@@ -0,0 +1,107 @@
+import json
+
+# Fields of each prompt family for structured output: (field, description).
+# Answers stay strings so "N/A" and "Unclear" keep their meaning from the prompts.
+FAMILY_FIELDS = {
+    'property_info': [
+        ('property_address', "Property address, or N/A or Unclear"),
+        ('seller_name', "Seller name(s), or N/A or Unclear"),
+        ('buyer_name', "Buyer name(s), or N/A or Unclear"),
+        ('hoa_name', "HOA name, or N/A or Unclear"),
+        ('pm_name', "Property management company name, or N/A or Unclear"),
+        ('additional_associations', "Additional HOAs or special districts, or N/A or Unclear"),
+        ('file_number', "File number, or N/A or Unclear"),
+        ('document_attachments', "Document attachments, or N/A or Unclear")
+    ],
+    'document_costs': [
+        ('document_cost', "Document cost as a number, or N/A"),
+        ('processing_fee', "Processing fee as a number, or N/A"),
+        ('rush_order', "Yes or No"),
+        ('rush_fee', "Rush fee as a number, or N/A"),
+        ('payment_timing', "pre-paid, due at closing, or N/A")
+    ],
+    'financial_status': [
+        ('violations', "Yes, No, N/A or Unclear, followed by any details"),
+        ('collections_liens', "Yes, No, N/A or Unclear, followed by any details"),
+        ('special_assessments', "Yes, No, N/A or Unclear, followed by any details"),
+        ('regular_assessment_amount', "Regular assessment amount, or N/A"),
+        ('assessment_frequency', "Assessment frequency, or N/A"),
+        ('outstanding_balance', "Outstanding balance, or N/A"),
+        ('document_cost', "Document cost as a number, or N/A"),
+        ('rush_order', "Yes or No"),
+        ('rush_fee', "Rush fee as a number, or N/A"),
+        ('payment_timing', "pre-paid, due at closing, or N/A"),
+        ('mailing_address', "Mailing address for payments, or N/A")
+    ],
+    'timeline_approval': [
+        ('good_through_date', "Good through date, or N/A or Unclear"),
+        ('closing_date', "Closing date, or N/A or Unclear"),
+        ('dues_paid_through', "Date dues/assessments are paid to or through, or N/A or Unclear"),
+        ('buyer_approval_required', "Yes, No, N/A or Unclear, followed by any details")
+    ],
+    # backtest_multi families
+    'attachments': [('answer', "The answer the prompt asks for")],
+    'extra_associations': [('answer', "The answer the prompt asks for")],
+    'doc_costs': [
+        ('doc_cost', "Document cost"),
+        ('rush_order', "Rush order"),
+        ('rush_fee', "Rush fee"),
+        ('payment_timing', "Payment timing")
+    ],
+    'hoa_names': [('hoa_name', "HOA name"), ('pm_name', "Property management company name")],
+    'buyer_approval': [('answer', "The answer the prompt asks for")]
+}
+
+# Families whose parsed result is a bare string rather than a dict
+SINGLE_ANSWER_FAMILIES = {'attachments', 'extra_associations', 'buyer_approval'}
+
+# Families whose parsers report errors in every field instead of an "error" key
+FIELDWISE_ERROR_FAMILIES = {'doc_costs', 'hoa_names'}
+
+def json_schema(family):
+    """JSON Schema for a family (strict: every field required, nothing extra)."""
+    fields = FAMILY_FIELDS[family]
+    return {
+        'type': 'object',
+        'properties': {name: {'type': 'string', 'description': description} for name, description in fields},
+        'required': [name for name, _ in fields],
+        'additionalProperties': False
+    }
+
+def gemini_schema(family):
+    """Response schema in the subset Gemini accepts (no additionalProperties)."""
+    schema = json_schema(family)
+    del schema['additionalProperties']
+    return schema
+
+def tool_name(family):
+    """Name of the Anthropic tool that records a family's answer."""
+    return f"record_{family}"
+
+def parse_structured(family, response):
+    """Decode a structured response and validate it into the family's record.
+
+    Returns the same shape as the family's regex parser: a dict of string
+    fields (a bare string for single-answer families), or an error.
+    """
+    try:
+        data = json.loads(response)
+    except (TypeError, ValueError) as e:
+        return _error(family, f"Invalid JSON: {e}")
+    if not isinstance(data, dict):
+        return _error(family, "Expected a JSON object")
+
+    missing = [name for name, _ in FAMILY_FIELDS[family] if name not in data]
+    if missing:
+        return _error(family, f"Missing fields: {', '.join(missing)}")
+
+    record = {name: str(data[name]).strip() for name, _ in FAMILY_FIELDS[family]}
+    return record['answer'] if family in SINGLE_ANSWER_FAMILIES else record
+
+def _error(family, message):
+    # Match the error shape of the family's regex parser
+    if family in SINGLE_ANSWER_FAMILIES:
+        return f"Error: {message}"
+    if family in FIELDWISE_ERROR_FAMILIES:
+        return {name: f"Error: {message}" for name, _ in FAMILY_FIELDS[family]}
+    return {"error": message}
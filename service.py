@@ -0,0 +1,401 @@
+# Local HTTP extraction service. The closing app submits a PDF (a path under
+# SERVICE_ROOT or the raw bytes), polls the job and fetches its result:
+#
+#   POST /jobs            {"path": "invoices/x.pdf", "tasks": ["document_costs"]}
+#                         or the PDF bytes (Content-Type: application/pdf, ?tasks=a,b&name=x.pdf)
+#                         optional "priority" (rush, urgent, normal) and "deadline" (YYYY-MM-DD)
+#   GET  /jobs/<id>       status of a job
+#   GET  /jobs/<id>/result parsed results per task (?raw=1 adds raw responses)
+#   GET  /tasks           prompt families that can be requested
+#   GET  /stats           queue, worker and connection pool statistics
+#
+# Jobs are keyed by document hash and options, so submitting the same PDF again
+# while its job is queued, running or done returns that job instead of a new one.
+# Jobs are run by a pool of workers on one event loop that shares the engine,
+# its call cap and the pooled provider clients. Queued jobs are started most
+# urgent first, by the priority the client gave or the one derived from the
+# file name and earlier answers (see scheduler.py).
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import itertools
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import tasks
+import clients
+import circuit_breaker
+import telemetry
+from engine import Engine
+from pdf_text import extract_text_from_pdf, sha256_bytes
+from scheduler import Priority, PRIORITY_WEIGHTS, parse_date
+
+# Jobs processed at once; their model calls share the engine's global cap
+WORKERS = int(os.getenv('SERVICE_WORKERS', '4'))
+
+# Submitted paths must be inside this folder
+ROOT = os.path.abspath(os.getenv('SERVICE_ROOT', '.'))
+
+# Uploaded PDFs are stored here under their SHA-256
+UPLOAD_DIR = os.getenv('SERVICE_UPLOAD_DIR', '.service_uploads')
+
+# Finished jobs kept in memory for polling; the oldest are dropped beyond this
+MAX_FINISHED_JOBS = int(os.getenv('SERVICE_MAX_FINISHED_JOBS', '1000'))
+
+# Largest upload accepted, in bytes
+MAX_UPLOAD_BYTES = int(os.getenv('SERVICE_MAX_UPLOAD_BYTES', str(50 * 1024 * 1024)))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class RequestError(Exception):
+    """A bad request, reported to the client with its HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def job_key(digest, task_names, structured, select_pages):
+    """Idempotency key: the same document with the same options is the same job."""
+    return f"{digest}:{','.join(sorted(task_names))}:{int(structured)}:{int(select_pages)}"
+
+def job_view(job, include_results=False, raw=False):
+    """The JSON a client sees for a job."""
+    view = {
+        key: job[key] for key in (
+            'id', 'status', 'document_sha256', 'file_name', 'tasks', 'structured', 'select_pages',
+            'submissions', 'submitted_at', 'started_at', 'finished_at', 'error'
+        )
+    }
+    priority = job['priority']
+    view['priority'] = priority.klass
+    view['deadline'] = time.strftime('%Y-%m-%d', time.localtime(priority.deadline)) if priority.deadline else None
+    if job['finished_at'] is not None:
+        view['seconds'] = round(job['finished_at'] - job['submitted_at'], 3)
+    if include_results:
+        results = job['results'] or {}
+        if not raw:
+            results = {
+                name: {key: value for key, value in result.items() if key != 'raw_responses'}
+                for name, result in results.items()
+            }
+        view['results'] = results
+    return view
+
+class ExtractionService:
+    """Job table, queue and worker pool behind the HTTP handler."""
+
+    def __init__(self, task_names=None, workers=None):
+        self.task_names = task_names or tasks.available_tasks()
+        self.workers = workers or WORKERS
+        self.jobs = {}
+        self.by_key = {}
+        self.finished = []
+        self.lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.engine = None
+        self.queue = None
+        # Keeps submission order among jobs of equal priority
+        self.counter = itertools.count()
+
+    def start(self):
+        """Start the event loop thread and its workers."""
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_workers(), self.loop).result()
+
+    async def _start_workers(self):
+        # Appends to the task result logs like the scripts and engine.py do
+        self.engine = Engine(self.task_names, resume=True)
+        self.queue = asyncio.PriorityQueue()
+        for _ in range(self.workers):
+            self.loop.create_task(self._worker())
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.engine.close()
+
+    def job_priority(self, file_name, klass=None, deadline=None):
+        """Priority of a job: the client's class and deadline over the ones derived from its file name."""
+        derived = self.engine.priority(file_name)
+        if klass is None and deadline is None:
+            return derived
+        if klass is not None and klass not in PRIORITY_WEIGHTS:
+            raise RequestError(400, f"Unknown priority {klass!r} (known: {', '.join(PRIORITY_WEIGHTS)})")
+        deadline_ts = derived.deadline
+        if deadline is not None:
+            day = parse_date(deadline)
+            if day is None:
+                raise RequestError(400, f"Cannot read deadline {deadline!r}; use YYYY-MM-DD")
+            deadline_ts = time.mktime(day.timetuple())
+        return Priority(klass or derived.klass, deadline_ts, "requested")
+
+    def submit(self, path, task_names, structured=False, select_pages=False, priority=None, deadline=None,
+               file_name=None):
+        """Queue a job for a PDF, or return the existing job for the same document and options.
+
+        file_name is the document's original name when path is an upload
+        stored under its hash; order dates in the name feed its priority.
+        Returns (job view, coalesced).
+        """
+        file_name = os.path.basename(file_name or path)
+        unknown = [name for name in task_names if name not in self.task_names]
+        if unknown:
+            raise RequestError(400, f"Unknown or unavailable tasks: {', '.join(unknown)}")
+        requested = priority is not None or deadline is not None
+        priority = self.job_priority(file_name, priority, deadline)
+        with open(path, 'rb') as f:
+            digest = sha256_bytes(f.read())
+        key = job_key(digest, task_names, structured, select_pages)
+        with self.lock:
+            job = self.jobs.get(self.by_key.get(key))
+            if job is not None and job['status'] != FAILED:
+                job['submissions'] += 1
+                return job_view(job), True
+            job = {
+                'id': uuid.uuid4().hex,
+                'key': key,
+                'path': path,
+                'document_sha256': digest,
+                'file_name': file_name,
+                'tasks': list(task_names),
+                'structured': structured,
+                'select_pages': select_pages,
+                # Given by the client, or derived now and refined from the text once extracted
+                'priority': priority,
+                'requested_priority': requested,
+                'status': QUEUED,
+                'submissions': 1,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'error': None,
+                'results': None
+            }
+            self.jobs[job['id']] = job
+            self.by_key[key] = job['id']
+            view = job_view(job)
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, (priority.sort_key(), next(self.counter), job['id']))
+        return view, False
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self.queue.get()
+            with self.lock:
+                job = self.jobs[job_id]
+                job['status'] = RUNNING
+                job['started_at'] = time.time()
+            try:
+                text = await self.loop.run_in_executor(None, extract_text_from_pdf, job['path'])
+                if text:
+                    # Trace the calls under the original name rather than the stored hash name
+                    telemetry.register_document(job['file_name'], text)
+                if not job['requested_priority'] and text:
+                    # Refine the queueing priority with the document's package speed and closing date
+                    priority = self.engine.priority(job['file_name'], text)
+                    with self.lock:
+                        job['priority'] = priority
+                # Uploads are stored under their hash; results are logged under the original name
+                results = await self.engine.run_file(
+                    job['path'], text, job['tasks'], job['structured'], job['select_pages'], job['priority'],
+                    file_name=job['file_name']
+                )
+                self.engine.record(results)
+                status, error = DONE, None
+            except Exception as e:
+                results, status, error = None, FAILED, f"{type(e).__name__}: {e}"
+            with self.lock:
+                job.update(status=status, error=error, results=results, finished_at=time.time())
+                self._forget_old_jobs(job)
+            self.queue.task_done()
+
+    def _forget_old_jobs(self, job):
+        # Called with the lock held
+        self.finished.append(job['id'])
+        while len(self.finished) > MAX_FINISHED_JOBS:
+            old = self.jobs.pop(self.finished.pop(0), None)
+            if old is not None and self.by_key.get(old['key']) == old['id']:
+                del self.by_key[old['key']]
+
+    def stats(self):
+        with self.lock:
+            statuses = [job['status'] for job in self.jobs.values()]
+        return {
+            'workers': self.workers,
+            'queued': self.queue.qsize() if self.queue is not None else 0,
+            'jobs': {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED)},
+            'max_concurrent_calls': self.engine.runner.max_concurrency if self.engine else None,
+            'deadlines': self.engine.runner.deadlines.summary() if self.engine else None,
+            'connection_pools': clients.pool_stats(),
+            'circuit_breakers': circuit_breaker.summary()
+        }
+
+def store_upload(data):
+    """Save uploaded PDF bytes under their hash and return the path."""
+    if not data.startswith(b'%PDF'):
+        raise RequestError(400, "Upload is not a PDF")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{sha256_bytes(data)}.pdf")
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+def resolve_path(path):
+    """Absolute path of a submitted PDF, which must be a file under ROOT."""
+    full = os.path.abspath(os.path.join(ROOT, path))
+    if os.path.commonpath([full, ROOT]) != ROOT:
+        raise RequestError(403, f"{path} is outside {ROOT}")
+    if not os.path.isfile(full):
+        raise RequestError(404, f"No such file: {path}")
+    return full
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """Routes the submit/poll/result API to the ExtractionService."""
+
+    server_version = 'ClosingChecks/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_UPLOAD_BYTES:
+            raise RequestError(413, f"Body larger than {MAX_UPLOAD_BYTES} bytes")
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status, message):
+        self._send_json({'error': message}, status=status)
+
+    def _submit(self, query):
+        body = self._read_body()
+        if self.headers.get('Content-Type', '').startswith('application/pdf'):
+            options = {key: values[-1] for key, values in query.items()}
+            path = store_upload(body)
+            task_names = options['tasks'].split(',') if options.get('tasks') else None
+            file_name = options.get('name')
+        else:
+            try:
+                options = json.loads(body or b'{}')
+            except ValueError:
+                raise RequestError(400, "Body must be JSON or a PDF")
+            if not isinstance(options, dict):
+                raise RequestError(400, "Body must be a JSON object")
+            if not isinstance(options.get('path'), str) or not options['path']:
+                raise RequestError(400, "Give a 'path' or upload the PDF")
+            task_names = options.get('tasks')
+            if task_names is not None and (
+                not isinstance(task_names, list) or not all(isinstance(name, str) for name in task_names)
+            ):
+                raise RequestError(400, "'tasks' must be a list of task names")
+            for key in ('priority', 'deadline'):
+                if options.get(key) is not None and not isinstance(options[key], str):
+                    raise RequestError(400, f"'{key}' must be a string")
+            path = resolve_path(options['path'])
+            file_name = None
+        view, coalesced = self.service.submit(
+            path,
+            task_names or self.service.task_names,
+            structured=str(options.get('structured', '')).lower() in ('1', 'true'),
+            select_pages=str(options.get('select_pages', '')).lower() in ('1', 'true'),
+            priority=options.get('priority') or None,
+            deadline=options.get('deadline') or None,
+            file_name=file_name
+        )
+        view['coalesced'] = coalesced
+        self._send_json(view, status=200 if coalesced else 202, headers={'Location': f"/jobs/{view['id']}"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/tasks':
+            return self._send_json({
+                name: {'models': list(tasks.get_task(name)['models']), 'fields': tasks.get_task(name)['fields']}
+                for name in self.service.task_names
+            })
+        if url.path == '/stats':
+            return self._send_json(self.service.stats())
+        match = re.fullmatch(r'/jobs/(\w+)(/result)?', url.path)
+        if not match:
+            return self._error(404, f"Not found: {url.path}")
+        job = self.service.get(match.group(1))
+        if job is None:
+            return self._error(404, f"No such job: {match.group(1)}")
+        if not match.group(2):
+            return self._send_json(job_view(job))
+        if job['status'] in (QUEUED, RUNNING):
+            # Not ready yet: the client polls again
+            return self._send_json(job_view(job), status=202, headers={'Retry-After': '1'})
+        raw = query.get('raw', ['0'])[-1].lower() in ('1', 'true')
+        self._send_json(job_view(job, include_results=True, raw=raw), status=200 if job['status'] == DONE else 500)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/jobs':
+            return self._error(404, f"Not found: {url.path}")
+        try:
+            self._submit(parse_qs(url.query))
+        except RequestError as e:
+            self._error(e.status, str(e))
+        except Exception as e:
+            # Every request gets a response, even one the checks above did not foresee
+            self._error(500, f"{type(e).__name__}: {e}")
+
+def make_server(host='127.0.0.1', port=8780, task_names=None, workers=None):
+    """Create the HTTP server and start the service's workers (serve_forever is up to the caller)."""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = ExtractionService(task_names, workers)
+    server.service.start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP service that extracts closing-document fields on demand")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8780)
+    parser.add_argument('--workers', type=int, default=WORKERS, help="Jobs processed at once (default: %(default)s)")
+    parser.add_argument('--tasks', nargs='+', metavar='TASK',
+                        help="Tasks clients may request (default: every task whose prompt exists)")
+    args = parser.parse_args()
+
+    server = make_server(args.host, args.port, args.tasks, args.workers)
+    print(f"Extraction service listening on http://{args.host}:{args.port} "
+          f"({args.workers} workers, tasks: {', '.join(server.service.task_names)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.stop()
+
+if __name__ == "__main__":
+    main()
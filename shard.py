@@ -0,0 +1,448 @@
+# Spreads a run over several hosts that share the PDF folder and this
+# directory over NFS (or any shared filesystem). The work is cut into
+# (file, task) units; a node claims a unit by creating its lease file with
+# O_CREAT|O_EXCL, which only one node can win, and keeps it alive by touching
+# it from a heartbeat thread. A node that dies stops touching its leases, so
+# once a lease is older than SHARD_LEASE_SECONDS another node takes the unit
+# over. A finished unit gets a done marker and is never claimed again.
+#
+# Each node appends to its own result logs under the shard directory, so no
+# two hosts write the same file; `merge` combines them into the usual
+# <task>_engine_results.jsonl/.json/.csv.
+#
+#   python shard.py run --dir files --tasks attachments hoa_names   # on every host
+#   python shard.py status --dir files --tasks attachments hoa_names
+#   python shard.py merge --tasks attachments hoa_names
+#   python shard.py simulate --nodes 3 --kill-after 5 --dir invoices --tasks document_costs
+import os
+import sys
+import glob
+import json
+import time
+import uuid
+import socket
+import hashlib
+import asyncio
+import argparse
+import threading
+import subprocess
+import tasks
+import circuit_breaker
+from engine import Engine, write_outputs
+from dedup import find_duplicates
+from pdf_text import extract_text_from_pdf
+from result_log import ResultLog, latest_results
+
+# Leases, done markers and per-node logs; must be on the filesystem every node shares
+SHARD_DIR = os.getenv('SHARD_DIR', '.shard')
+
+# A lease not renewed for this long is considered abandoned by a dead node
+LEASE_SECONDS = float(os.getenv('SHARD_LEASE_SECONDS', '120'))
+
+# Leases are renewed this often (a few renewals fit in one lease, so a slow NFS write is not fatal)
+HEARTBEAT_SECONDS = float(os.getenv('SHARD_HEARTBEAT_SECONDS', str(LEASE_SECONDS / 4)))
+
+# Seconds to wait before looking again when every remaining unit is leased by another node
+IDLE_POLL_SECONDS = float(os.getenv('SHARD_IDLE_POLL_SECONDS', '5'))
+
+# Files processed at once by one node; their calls share the node's call cap
+MAX_FILES_IN_FLIGHT = int(os.getenv('SHARD_FILES_IN_FLIGHT', '8'))
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def unit_id(file_name, task_name):
+    """File-system-safe name of a (file, task) unit."""
+    return f"{hashlib.sha1(file_name.encode('utf-8')).hexdigest()[:20]}.{task_name}"
+
+def node_log_path(shard_dir, task_name, node):
+    return os.path.join(shard_dir, 'logs', f"{task_name}.{node}.jsonl")
+
+class LeaseStore:
+    """Claims, renews and completes (file, task) units through files in a shared directory.
+
+    Expiry is judged by file mtimes, which the file server sets, against the
+    mtime of this node's own freshly touched clock file, so clock skew between
+    hosts does not matter.
+    """
+
+    def __init__(self, shard_dir, node, lease_seconds=None):
+        self.node = node
+        self.lease_seconds = lease_seconds or LEASE_SECONDS
+        self.lease_dir = os.path.join(shard_dir, 'leases')
+        self.done_dir = os.path.join(shard_dir, 'done')
+        self.node_dir = os.path.join(shard_dir, 'nodes')
+        for folder in (self.lease_dir, self.done_dir, self.node_dir, os.path.join(shard_dir, 'logs')):
+            os.makedirs(folder, exist_ok=True)
+        self.clock_path = os.path.join(self.node_dir, f"{node}.alive")
+        self.lock = threading.Lock()
+        # Unit id -> token written in the lease file when it was claimed
+        self.held = {}
+
+    def lease_path(self, file_name, task_name):
+        return os.path.join(self.lease_dir, f"{unit_id(file_name, task_name)}.lease")
+
+    def done_path(self, file_name, task_name):
+        return os.path.join(self.done_dir, f"{unit_id(file_name, task_name)}.done")
+
+    def now(self):
+        """The file server's current time, read back from a file touched just now."""
+        with open(self.clock_path, 'a'):
+            pass
+        os.utime(self.clock_path)
+        return os.stat(self.clock_path).st_mtime
+
+    def is_done(self, file_name, task_name):
+        return os.path.exists(self.done_path(file_name, task_name))
+
+    def claim(self, file_name, task_name, now=None):
+        """Try to take a unit; True if this node now holds its lease."""
+        if self.is_done(file_name, task_name):
+            return False
+        path = self.lease_path(file_name, task_name)
+        if self._create(path, file_name, task_name):
+            return True
+        if self._break_expired(path, self.now() if now is None else now):
+            return self._create(path, file_name, task_name)
+        return False
+
+    def _create(self, path, file_name, task_name):
+        token = uuid.uuid4().hex
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'node': self.node, 'token': token, 'file_name': file_name, 'task': task_name,
+                       'claimed_at': time.time()}, f)
+        with self.lock:
+            self.held[os.path.basename(path)] = token
+        return True
+
+    def _break_expired(self, path, now):
+        """Remove a lease whose owner stopped renewing it; True if the unit may be claimed."""
+        try:
+            if os.stat(path).st_mtime + self.lease_seconds > now:
+                return False
+        except FileNotFoundError:
+            return True
+        # Renaming is atomic, so of several nodes breaking the same lease only one succeeds
+        tombstone = f"{path}.{self.node}.{uuid.uuid4().hex}.expired"
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return True
+        if os.stat(tombstone).st_mtime + self.lease_seconds > now:
+            # Renewed between the check and the rename: put it back unless it was claimed meanwhile
+            try:
+                os.link(tombstone, path)
+            except FileExistsError:
+                pass
+            os.unlink(tombstone)
+            return False
+        try:
+            with open(tombstone, 'r') as f:
+                lease = json.load(f)
+            print(f"{self.node}: taking over {lease['file_name']} ({lease['task']}) from {lease['node']}")
+        except ValueError:
+            # The owner died between creating the lease and writing it
+            pass
+        os.unlink(tombstone)
+        return True
+
+    def _owns(self, path, token):
+        try:
+            with open(path, 'r') as f:
+                return json.load(f).get('token') == token
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def renew(self):
+        """Touch every held lease; leases taken over by another node are dropped."""
+        with self.lock:
+            held = dict(self.held)
+        for name, token in held.items():
+            path = os.path.join(self.lease_dir, name)
+            if self._owns(path, token):
+                os.utime(path)
+            else:
+                print(f"Lease {name} was taken over by another node")
+                with self.lock:
+                    self.held.pop(name, None)
+        if os.path.exists(self.clock_path):
+            os.utime(self.clock_path)
+
+    def release(self, file_name, task_name):
+        """Give a unit back without finishing it (e.g. the call failed)."""
+        path = self.lease_path(file_name, task_name)
+        with self.lock:
+            token = self.held.pop(os.path.basename(path), None)
+        if token and self._owns(path, token):
+            os.unlink(path)
+
+    def complete(self, file_name, task_name):
+        """Mark a unit done and drop its lease."""
+        path = self.done_path(file_name, task_name)
+        tmp_path = f"{path}.{self.node}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'node': self.node, 'file_name': file_name, 'task': task_name, 'finished_at': time.time()}, f)
+        os.replace(tmp_path, path)
+        self.release(file_name, task_name)
+
+    def status(self, units):
+        """Counts of done, leased, expired and open units, and units done per node."""
+        now = self.now()
+        counts = {'done': 0, 'leased': 0, 'expired': 0, 'open': 0}
+        by_node = {}
+        for file_name, task_name in units:
+            if self.is_done(file_name, task_name):
+                counts['done'] += 1
+                with open(self.done_path(file_name, task_name), 'r') as f:
+                    node = json.load(f)['node']
+                by_node[node] = by_node.get(node, 0) + 1
+                continue
+            try:
+                fresh = os.stat(self.lease_path(file_name, task_name)).st_mtime + self.lease_seconds > now
+            except FileNotFoundError:
+                counts['open'] += 1
+                continue
+            counts['leased' if fresh else 'expired'] += 1
+        return counts, by_node
+
+class Heartbeat:
+    """Renews a LeaseStore's leases from a background thread."""
+
+    def __init__(self, leases, interval=None):
+        self.leases = leases
+        self.interval = interval or HEARTBEAT_SECONDS
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.leases.renew()
+            except OSError as e:
+                # A hiccup of the shared filesystem; the next beat tries again
+                print(f"Lease renewal failed: {e}")
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+def list_files(pdf_dir, limit=None, dedup=True):
+    """PDF paths to shard and their duplicate groups (None without dedup).
+
+    Every node computes the same list, since grouping depends only on content.
+    """
+    pdf_files = sorted(f for f in os.listdir(pdf_dir) if f.endswith('.pdf'))[:limit]
+    file_paths = [os.path.join(pdf_dir, f) for f in pdf_files]
+    if not dedup:
+        return file_paths, None
+    return find_duplicates(file_paths)
+
+class ShardNode:
+    """One node: claims units, runs them through its engine and logs to its own result logs."""
+
+    def __init__(self, task_names, node=None, shard_dir=None, structured=False, select_pages=False):
+        self.node = node or default_node_id()
+        self.shard_dir = shard_dir or SHARD_DIR
+        self.task_names = list(task_names)
+        self.leases = LeaseStore(self.shard_dir, self.node)
+        # Resuming the node's own logs lets a restarted node with the same id reuse its answers
+        self.engine = Engine(
+            task_names, resume=True, structured=structured, select_pages=select_pages,
+            log_paths={name: node_log_path(self.shard_dir, name, self.node) for name in task_names}
+        )
+        self.heartbeat = Heartbeat(self.leases)
+        self.units_done = 0
+        # Units that raised here; left for other nodes rather than retried in a loop
+        self.failed = set()
+
+    def remaining(self, plan):
+        """{path: [tasks]} of the planned units no node has finished yet."""
+        remaining = {}
+        for path, names in plan.items():
+            file_name = os.path.basename(path)
+            names = [
+                name for name in names
+                if (file_name, name) not in self.failed and not self.leases.is_done(file_name, name)
+            ]
+            if names:
+                remaining[path] = names
+        return remaining
+
+    async def process(self, path, task_names, groups):
+        file_name = os.path.basename(path)
+        try:
+            text = await asyncio.get_running_loop().run_in_executor(None, extract_text_from_pdf, path)
+            results = await self.engine.run_file(path, text, task_names)
+            self.engine.record(results, groups)
+        except Exception as e:
+            print(f"{self.node}: {file_name} failed, releasing its leases: {e}")
+            for name in task_names:
+                self.failed.add((file_name, name))
+                self.leases.release(file_name, name)
+            return
+        # Failed model calls are in the result for --backfill, so the unit is still done
+        for name in task_names:
+            self.leases.complete(file_name, name)
+        self.units_done += len(task_names)
+
+    async def run(self, file_paths, groups=None, max_files_in_flight=None):
+        """Claim and run units until every unit is done by some node (or failed on this one)."""
+        slots = asyncio.Semaphore(max_files_in_flight or MAX_FILES_IN_FLIGHT)
+        pending = set()
+        plan = self.engine.plan(file_paths)
+        while True:
+            remaining = self.remaining(plan)
+            if not remaining and not pending:
+                return
+            claimed_any = False
+            now = self.leases.now()
+            for path, names in remaining.items():
+                await slots.acquire()
+                file_name = os.path.basename(path)
+                claimed = [name for name in names if self.leases.claim(file_name, name, now)]
+                if not claimed:
+                    slots.release()
+                    continue
+                claimed_any = True
+                task = asyncio.create_task(self.process(path, claimed, groups))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+                task.add_done_callback(lambda _: slots.release())
+                now = self.leases.now()
+            if pending:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            elif not claimed_any:
+                # The rest is leased by other nodes: wait for them to finish or their leases to expire
+                await asyncio.sleep(IDLE_POLL_SECONDS)
+
+    def close(self):
+        self.engine.close()
+
+def merge(task_names, shard_dir=None):
+    """Combine every node's result log into each task's usual log and outputs.
+
+    When nodes answered the same file (a lease taken over from a node that
+    was slow rather than dead), the result with fewer failed calls wins.
+    """
+    shard_dir = shard_dir or SHARD_DIR
+    for name in task_names:
+        best = {}
+        for path in sorted(glob.glob(os.path.join(shard_dir, 'logs', f"{name}.*.jsonl"))):
+            for result in latest_results(path):
+                current = best.get(result['file_name'])
+                if current is None or len(result.get('backfill', [])) < len(current.get('backfill', [])):
+                    best[result['file_name']] = result
+        log_path = tasks.get_task(name)['log_path']
+        # Files already merged are only replaced by a result with fewer failed calls
+        merged = {result['file_name']: len(result.get('backfill', [])) for result in latest_results(log_path)}
+        log = ResultLog(log_path, resume=True)
+        added = 0
+        try:
+            for file_name, result in best.items():
+                if file_name not in merged or len(result.get('backfill', [])) < merged[file_name]:
+                    log.add_result(result)
+                    added += 1
+        finally:
+            log.close()
+        print(f"{name}: merged {len(best)} files from node logs ({added} new or improved)")
+        write_outputs(name)
+
+def all_units(file_paths, task_names):
+    """Every (file, task) unit; duplicates are not units, they get their representative's result."""
+    return [(os.path.basename(path), name) for path in file_paths for name in task_names]
+
+def run_node(args, task_names):
+    node = ShardNode(task_names, args.node, args.shard_dir, args.structured, args.select_pages)
+    file_paths, groups = list_files(args.dir, args.limit, not args.no_dedup)
+    print(f"Node {node.node}: {len(file_paths)} files x {len(task_names)} tasks, leases in {node.shard_dir}")
+    node.heartbeat.start()
+    try:
+        asyncio.run(node.run(file_paths, groups))
+    finally:
+        node.heartbeat.stop()
+        node.close()
+    failed = f", {len(node.failed)} failed here" if node.failed else ""
+    print(f"Node {node.node}: finished {node.units_done} units{failed}; no units left")
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+
+def simulate(args, task_names):
+    """Run several nodes as local processes, optionally killing one mid-run, then merge.
+
+    The killed node never releases its leases, so the run only completes if
+    the other nodes take its units over once the leases expire.
+    """
+    env = dict(os.environ, SHARD_LEASE_SECONDS=str(args.lease_seconds),
+               SHARD_HEARTBEAT_SECONDS=str(args.lease_seconds / 4), SHARD_IDLE_POLL_SECONDS='1')
+    command = [sys.executable, os.path.abspath(__file__), 'run', '--dir', args.dir, '--shard-dir', args.shard_dir,
+               '--tasks', *task_names]
+    if args.limit:
+        command += ['--limit', str(args.limit)]
+    if args.no_dedup:
+        command.append('--no-dedup')
+    started = time.time()
+    nodes = [
+        subprocess.Popen(command + ['--node', f"sim-{i}"], env=env)
+        for i in range(args.nodes)
+    ]
+    if args.kill_after is not None:
+        time.sleep(args.kill_after)
+        if nodes[0].poll() is None:
+            nodes[0].kill()
+            print(f"Killed node sim-0 after {args.kill_after}s; its leases expire in {args.lease_seconds}s")
+    codes = [node.wait() for node in nodes]
+    print(f"Nodes exited with {codes} after {time.time() - started:.1f}s")
+    file_paths, groups = list_files(args.dir, args.limit, not args.no_dedup)
+    counts, by_node = LeaseStore(args.shard_dir, 'simulate').status(all_units(file_paths, task_names))
+    print(f"Units: {counts}; done per node: {by_node}")
+    merge(task_names, args.shard_dir)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Share a run across hosts through leases on a shared filesystem")
+    parser.add_argument('command', choices=['run', 'status', 'merge', 'simulate'])
+    parser.add_argument('--dir', default='files', help="Shared folder of PDFs (default: %(default)s)")
+    parser.add_argument('--tasks', nargs='+', metavar='TASK',
+                        help="Tasks to run (default: every task whose prompt exists)")
+    parser.add_argument('--limit', type=int, help="Use at most this many PDFs")
+    parser.add_argument('--shard-dir', default=SHARD_DIR,
+                        help="Shared lease and node log directory (default: %(default)s)")
+    parser.add_argument('--node', help="Node id (default: <hostname>-<pid>); reuse it to resume a node's log")
+    parser.add_argument('--no-dedup', action='store_true',
+                        help="Send every file to the models even when it duplicates another")
+    parser.add_argument('--select-pages', action='store_true',
+                        help="Send only the pages relevant to each task")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of tagged answers")
+    parser.add_argument('--nodes', type=int, default=3, help="simulate: local nodes to start (default: %(default)s)")
+    parser.add_argument('--kill-after', type=float,
+                        help="simulate: kill the first node after this many seconds")
+    parser.add_argument('--lease-seconds', type=float, default=10,
+                        help="simulate: lease length for the nodes (default: %(default)s)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    task_names = args.tasks or tasks.available_tasks()
+    for name in task_names:
+        tasks.prompt_of(name)
+    if args.command == 'run':
+        run_node(args, task_names)
+    elif args.command == 'status':
+        file_paths, groups = list_files(args.dir, args.limit, not args.no_dedup)
+        counts, by_node = LeaseStore(args.shard_dir, args.node or 'status').status(
+            all_units(file_paths, task_names)
+        )
+        print(f"Units: {counts}; done per node: {by_node}")
+    elif args.command == 'merge':
+        merge(task_names, args.shard_dir)
+    else:
+        simulate(args, task_names)
+
+if __name__ == "__main__":
+    main()
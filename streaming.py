@@ -0,0 +1,148 @@
+import time
+import threading
+import telemetry
+from rate_limit import CHARS_PER_TOKEN
+
+# Closing tags after which the scripts' parsers need nothing more
+EXTRACTION_STOP = ('</extraction>',)
+ANSWER_STOP = ('</answer>', '</answers>')
+
+class StopScanner:
+    """Accumulates streamed text and reports when a closing tag has arrived."""
+
+    def __init__(self, stop_tags):
+        self.stop_tags = tuple(stop_tags)
+        self.longest = max(len(tag) for tag in self.stop_tags)
+        self.parts = []
+        self.length = 0
+        self.tail = ""
+        self.stopped = False
+        self.cut = None
+
+    def feed(self, chunk):
+        """Add a chunk; return True once any stop tag has been seen."""
+        if not chunk or self.stopped:
+            return self.stopped
+        self.parts.append(chunk)
+        self.length += len(chunk)
+        # Only the new chunk plus a tag-sized overlap can contain a new match
+        window = self.tail + chunk
+        for tag in self.stop_tags:
+            index = window.find(tag)
+            if index != -1:
+                self.stopped = True
+                self.cut = self.length - len(window) + index + len(tag)
+                break
+        self.tail = window[-self.longest:]
+        return self.stopped
+
+    @property
+    def text(self):
+        text = "".join(self.parts)
+        return text[:self.cut] if self.stopped else text
+
+class StreamStats:
+    """Time to result and output size of streamed calls."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.stopped_early = 0
+        self.first_token_seconds = []
+        self.result_seconds = []
+        self.output_chars = 0
+
+    def record(self, first_token, result, chars, stopped):
+        with self.lock:
+            self.calls += 1
+            self.stopped_early += stopped
+            if first_token is not None:
+                self.first_token_seconds.append(first_token)
+            self.result_seconds.append(result)
+            self.output_chars += chars
+
+    def summary(self):
+        with self.lock:
+            def mean(values):
+                return round(sum(values) / len(values), 3) if values else None
+            return {
+                'calls': self.calls,
+                'stopped_early': self.stopped_early,
+                'mean_time_to_first_token': mean(self.first_token_seconds),
+                'mean_time_to_result': mean(self.result_seconds),
+                'output_tokens_received': self.output_chars // CHARS_PER_TOKEN
+            }
+
+stats = StreamStats()
+
+_local = threading.local()
+
+class StreamCancelled(Exception):
+    """Raised when a stream is closed because its answer is no longer needed."""
+
+def set_cancel(event):
+    """Close streams read on this thread once event (a threading.Event) is set (None to stop)."""
+    _local.cancel = event
+    _local.cancelled = False
+
+def was_cancelled():
+    """Whether a stream on this thread was closed by its cancel event since set_cancel."""
+    return getattr(_local, 'cancelled', False)
+
+def consume(chunks, stop_tags, close=None):
+    """Read text chunks until a stop tag arrives, then close the stream.
+
+    Returns the text up to and including the stop tag (or everything, if no
+    tag arrived). Closing the connection early ends generation, so the output
+    tokens after the tag are never produced or billed. If this thread's
+    cancel event is set (see set_cancel) the stream is closed the same way
+    and StreamCancelled is raised, so the partial answer is never cached.
+    """
+    scanner = StopScanner(stop_tags)
+    cancel = getattr(_local, 'cancel', None)
+    start = time.perf_counter()
+    first_token = None
+    try:
+        for chunk in chunks:
+            if cancel is not None and cancel.is_set():
+                _local.cancelled = True
+                raise StreamCancelled("answer no longer needed")
+            if chunk and first_token is None:
+                first_token = time.perf_counter() - start
+            if scanner.feed(chunk):
+                break
+    finally:
+        if close is not None:
+            close()
+    stats.record(first_token, time.perf_counter() - start, len(scanner.text), scanner.stopped)
+    return scanner.text
+
+def stream_anthropic(client, kwargs, stop_tags):
+    """Stream a Messages API call and return the text up to the stop tag."""
+    with client.messages.stream(**kwargs) as stream:
+        text = consume(stream.text_stream, stop_tags)
+        # Input usage arrives with the first event; output usage only at the end,
+        # so for streams closed early it is left to be estimated
+        usage = stream.current_message_snapshot.usage
+        cached = getattr(usage, 'cache_read_input_tokens', None) or 0
+        written = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        telemetry.add_usage(input_tokens=usage.input_tokens + cached + written, cached_input_tokens=cached)
+        return text
+
+def stream_openai(client, kwargs, stop_tags):
+    """Stream a Chat Completions call and return the text up to the stop tag."""
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    chunks = (
+        chunk.choices[0].delta.content or ""
+        for chunk in stream if chunk.choices
+    )
+    return consume(chunks, stop_tags, close=stream.close)
+
+def stream_gemini(model, prompt, stop_tags):
+    """Stream a Gemini generate_content call and return the text up to the stop tag."""
+    response = model.generate_content(prompt, stream=True)
+    chunks = (chunk.text for chunk in response)
+    # The underlying gRPC/REST iterator is cancelled where the transport supports it
+    iterator = getattr(response, '_iterator', None)
+    close = getattr(iterator, 'cancel', None) or getattr(iterator, 'close', None)
+    return consume(chunks, stop_tags, close=close)
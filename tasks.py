@@ -0,0 +1,157 @@
+import clients
+import llm
+import prompts
+from parsers import (
+    parse_property_info_response,
+    parse_document_costs_response,
+    parse_financial_status_response,
+    parse_timeline_approval_response,
+    parse_answer_response,
+    parse_doc_costs_response,
+    parse_hoa_names_response
+)
+from schemas import FAMILY_FIELDS, SINGLE_ANSWER_FAMILIES, parse_structured
+from repair import parse_with_repair
+from streaming import EXTRACTION_STOP, ANSWER_STOP
+
+SYSTEM_PROMPT = "You are a helpful assistant that extracts information from PDF documents."
+
+# Model sets a task can use: result key -> provider, model id and per-model call options
+EXTRACTION_MODELS = {
+    'claude_haiku': {'provider': 'anthropic', 'model': 'claude-3-haiku-20240307', 'max_tokens': 4000, 'temperature': 0},
+    'gpt4o_mini': {'provider': 'openai', 'model': 'gpt-4o-mini', 'temperature': 0},
+    'gemini_flash': {'provider': 'gemini', 'model': 'gemini-1.5-flash'}
+}
+
+# The short-answer prompts were tuned on these models (see backtest_multi.py)
+ANSWER_MODELS = {
+    'claude_haiku': {'provider': 'anthropic', 'model': 'claude-3-5-haiku-20241022', 'max_tokens': 1000},
+    'gpt4o_mini': {'provider': 'openai', 'model': 'gpt-4o-mini-2024-07-18', 'max_tokens': 500, 'temperature': 0.3},
+    'gemini_flash': {'provider': 'gemini', 'model': 'gemini-2.0-flash'}
+}
+
+# combined_extraction.py answers every family in one call, which needs Claude 3.5
+# Haiku's 8192-token output; the split calls it is compared with use the same models
+COMBINED_MODELS = {
+    'claude_haiku': {'provider': 'anthropic', 'model': 'claude-3-5-haiku-20241022', 'max_tokens': 8192, 'temperature': 0},
+    'gpt4o_mini': EXTRACTION_MODELS['gpt4o_mini'],
+    'gemini_flash': EXTRACTION_MODELS['gemini_flash']
+}
+
+# Task name (the prompt family) -> declaration; see register_task
+TASKS = {}
+
+def register_task(name, prompt, parser, models, stop_at=EXTRACTION_STOP, system=None, cache_prefix=False,
+                  log_path=None):
+    """Declare a prompt family the engine can run.
+
+    prompt is the name of the template constant in prompts.py, so a task can
+    be declared before its prompt is written. Output fields come from
+    schemas.FAMILY_FIELDS (None for families answered with a bare string).
+    The default log is apart from the per-family scripts' logs
+    (e.g. process_invoices.py's document_costs_results.jsonl), so neither
+    moves the other's results aside.
+    """
+    TASKS[name] = {
+        'name': name,
+        'prompt': prompt,
+        'parser': parser,
+        'fields': None if name in SINGLE_ANSWER_FAMILIES else [field for field, _ in FAMILY_FIELDS[name]],
+        'models': models,
+        'stop_at': stop_at,
+        'system': system,
+        'cache_prefix': cache_prefix,
+        'log_path': log_path or f"{name}_engine_results.jsonl"
+    }
+
+register_task('property_info', 'PROPERTY_INFO_PROMPT', parse_property_info_response, EXTRACTION_MODELS,
+              system=SYSTEM_PROMPT)
+register_task('document_costs', 'DOCUMENT_COSTS_PROMPT', parse_document_costs_response, EXTRACTION_MODELS,
+              system=SYSTEM_PROMPT)
+register_task('financial_status', 'FINANCIAL_STATUS_PROMPT', parse_financial_status_response, EXTRACTION_MODELS,
+              system=SYSTEM_PROMPT)
+register_task('timeline_approval', 'TIMELINE_APPROVAL_PROMPT', parse_timeline_approval_response, EXTRACTION_MODELS,
+              system=SYSTEM_PROMPT)
+# backtest_multi families: the document goes first so every prompt shares a cached prefix
+register_task('attachments', 'ATTACHMENTS_PROMPT', parse_answer_response, ANSWER_MODELS,
+              stop_at=ANSWER_STOP, cache_prefix=True)
+register_task('extra_associations', 'EXTRA_ASSOCIATIONS_PROMPT', parse_answer_response, ANSWER_MODELS,
+              stop_at=ANSWER_STOP, cache_prefix=True)
+register_task('doc_costs', 'DOC_COSTS_PROMPT', parse_doc_costs_response, ANSWER_MODELS,
+              stop_at=ANSWER_STOP, cache_prefix=True)
+register_task('hoa_names', 'HOA_NAMES_PROMPT', parse_hoa_names_response, ANSWER_MODELS,
+              stop_at=ANSWER_STOP, cache_prefix=True)
+register_task('buyer_approval', 'BUYER_APPROVAL_PROMPT', parse_answer_response, ANSWER_MODELS,
+              stop_at=ANSWER_STOP, cache_prefix=True)
+
+def get_task(name):
+    if name not in TASKS:
+        raise KeyError(f"Unknown task {name!r} (known: {', '.join(TASKS)})")
+    return TASKS[name]
+
+def prompt_of(name):
+    """Return a task's prompt template, or raise if prompts.py does not define it."""
+    task = get_task(name)
+    template = getattr(prompts, task['prompt'], None)
+    if template is None:
+        raise KeyError(f"Task {name!r} needs {task['prompt']}, which prompts.py does not define")
+    return template
+
+def available_tasks():
+    """Names of the registered tasks whose prompts exist."""
+    return [name for name, task in TASKS.items() if hasattr(prompts, task['prompt'])]
+
+def call_template(spec, template, text, system=None, cache_prefix=False, stop_at=None, structured=None):
+    """Send any template and text to the model a spec describes and return the raw response.
+
+    Errors are raised; call_model turns them into "Error ..." strings.
+    """
+    if spec['provider'] == 'anthropic':
+        return llm.call_anthropic(
+            clients.get_client('anthropic'), spec['model'], template, text,
+            max_tokens=spec.get('max_tokens', 4000), temperature=spec.get('temperature'),
+            system=system, cache_prefix=cache_prefix, stop_at=stop_at, structured=structured
+        )
+    if spec['provider'] == 'openai':
+        return llm.call_openai(
+            clients.get_client('openai'), spec['model'], template, text,
+            max_tokens=spec.get('max_tokens'), temperature=spec.get('temperature'),
+            system=system, cache_prefix=cache_prefix, stop_at=stop_at, structured=structured
+        )
+    return llm.call_gemini(
+        spec['model'], template, text, cache_prefix=cache_prefix, stop_at=stop_at, structured=structured
+    )
+
+def call_model(name, model_key, text, structured=False, **options):
+    """Run one task's prompt on one of its models and return the raw response.
+
+    options override the task's stop_at and cache_prefix. Errors are returned
+    as "Error ..." strings, which mark the call for backfill.
+    """
+    task = get_task(name)
+    spec = task['models'][model_key]
+    template = prompt_of(name)
+    try:
+        return call_template(
+            spec, template, text, system=task['system'],
+            cache_prefix=options.get('cache_prefix', task['cache_prefix']),
+            stop_at=options.get('stop_at', task['stop_at']),
+            structured=name if structured else None
+        )
+    except Exception as e:
+        return f"Error calling {spec['model']}: {e}"
+
+def model_ids(name):
+    """{model_key: (provider, model id)} for a task's models."""
+    return {model_key: (spec['provider'], spec['model']) for model_key, spec in get_task(name)['models'].items()}
+
+def parse_response(name, response, structured=False):
+    """Parse a task's raw response; returns (parsed, repair_attempts).
+
+    Malformed answer blocks get a cheap reformatting call (see repair.py).
+    """
+    if structured:
+        return parse_structured(name, response), 0
+    task = get_task(name)
+    template = getattr(prompts, task['prompt'], None)
+    return parse_with_repair(name, response, task['parser'], template)
@@ -0,0 +1,358 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import pandas as pd
+import prompts
+from rate_limit import CHARS_PER_TOKEN
+from response_cache import sha256_text
+
+# JSONL trace with one line per model call (LLM_TRACE_PATH= to turn tracing off)
+TRACE_PATH = os.getenv('LLM_TRACE_PATH', '.llm_trace.jsonl')
+
+# Identifies this run in the trace; defaults to the start time and process id
+RUN_ID = os.getenv('LLM_RUN_ID') or f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+# USD per million tokens: (input, output, cached input). Matched on the longest
+# model-id prefix; batch API calls are billed at half price.
+PRICES = {
+    'claude-3-haiku': (0.25, 1.25, 0.03),
+    'claude-3-5-haiku': (0.80, 4.00, 0.08),
+    'claude-3-5-sonnet': (3.00, 15.00, 0.30),
+    'claude-3-7-sonnet': (3.00, 15.00, 0.30),
+    'gpt-4o-mini': (0.15, 0.60, 0.075),
+    'gpt-4o': (2.50, 10.00, 1.25),
+    'gemini-1.5-flash': (0.075, 0.30, 0.01875),
+    'gemini-2.0-flash': (0.10, 0.40, 0.025),
+    'gemini-2.5-pro': (1.25, 10.00, 0.31)
+}
+BATCH_DISCOUNT = 0.5
+
+# Templates that are not module-level prompts (e.g. repair prompts) -> family name
+_families = {}
+# Document text hash -> file name
+_documents = {}
+_prompts_loaded = False
+_registry_lock = threading.Lock()
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_trace_file = None
+
+def _prompt_families():
+    # Every *_PROMPT constant in prompts.py, named after the constant
+    families = {}
+    for name, value in vars(prompts).items():
+        if name.endswith('_PROMPT') and isinstance(value, str):
+            families[sha256_text(value)] = name[:-len('_PROMPT')].lower()
+    return families
+
+def register_family(family, template):
+    """Name the prompt family of a template that is not a constant in prompts.py."""
+    with _registry_lock:
+        _families[sha256_text(template)] = family
+
+def register_document(file_name, text):
+    """Remember which file a document text came from, for per-file totals."""
+    with _registry_lock:
+        _documents[sha256_text(text)] = file_name
+
+def family_of(prompt_hash):
+    global _prompts_loaded
+    with _registry_lock:
+        if not _prompts_loaded:
+            for key, family in _prompt_families().items():
+                _families.setdefault(key, family)
+            _prompts_loaded = True
+        return _families.get(prompt_hash)
+
+def document_name(document_hash):
+    with _registry_lock:
+        return _documents.get(document_hash)
+
+def write(record):
+    """Append one record to the trace file."""
+    global _trace_file
+    if not TRACE_PATH:
+        return
+    line = json.dumps(record)
+    with _write_lock:
+        if _trace_file is None:
+            _trace_file = open(TRACE_PATH, 'a', buffering=1)
+        _trace_file.write(line + "\n")
+
+class Span:
+    """Telemetry of one model call: usage, latency, retries and whether the cache answered.
+
+    latency_seconds is the whole call; provider_seconds is the time spent
+    inside provider requests (every attempt) and queue_seconds the rest:
+    cache lookup, rate limiter waits, retry backoff and breaker waits.
+    """
+
+    def __init__(self, provider, model, template, text):
+        self.provider = provider
+        self.model = model
+        self.template = template
+        self.text = text
+        self.cache_hit = True
+        self.retries = 0
+        self.input_tokens = None
+        self.output_tokens = None
+        self.cached_input_tokens = 0
+        self.provider_seconds = None
+        self.start = time.perf_counter()
+
+    def sent(self):
+        """Mark the call as answered by the provider rather than the response cache."""
+        self.cache_hit = False
+
+    def retry(self):
+        self.retries += 1
+
+    def provider_time(self, seconds):
+        """Add the duration of one provider request attempt."""
+        self.provider_seconds = (self.provider_seconds or 0.0) + seconds
+
+    def usage(self, input_tokens=None, output_tokens=None, cached_input_tokens=None):
+        """Record usage reported by the provider (fields left as None are estimated)."""
+        if input_tokens is not None:
+            self.input_tokens = input_tokens
+        if output_tokens is not None:
+            self.output_tokens = output_tokens
+        if cached_input_tokens is not None:
+            self.cached_input_tokens = cached_input_tokens
+
+    def finish(self, response, error=None):
+        prompt_hash = sha256_text(self.template)
+        document_hash = sha256_text(self.text)
+        latency = time.perf_counter() - self.start
+        provider = self.provider_seconds
+        record = {
+            'ts': round(time.time(), 3),
+            'run_id': RUN_ID,
+            'provider': self.provider,
+            'model': self.model,
+            'family': family_of(prompt_hash),
+            'file': document_name(document_hash),
+            'prompt_hash': prompt_hash,
+            'document_hash': document_hash,
+            'cache_hit': self.cache_hit,
+            'latency_seconds': round(latency, 3),
+            'provider_seconds': None if provider is None else round(provider, 3),
+            'queue_seconds': None if provider is None else round(max(0.0, latency - provider), 3),
+            'retries': self.retries,
+            'error': error
+        }
+        if not self.cache_hit and error is not None and self.input_tokens is None:
+            # Failed and circuit-rejected calls are not billed
+            self.input_tokens = self.output_tokens = 0
+        if not self.cache_hit:
+            # Streams closed early report no output usage; estimate from characters
+            estimated = self.input_tokens is None or self.output_tokens is None
+            if self.input_tokens is None:
+                self.input_tokens = len(self.template + self.text) // CHARS_PER_TOKEN
+            if self.output_tokens is None:
+                self.output_tokens = len(response or "") // CHARS_PER_TOKEN
+            record.update({
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'cached_input_tokens': self.cached_input_tokens,
+                'usage_estimated': estimated
+            })
+        _local.last_record = record
+        write(record)
+
+def current():
+    """Return the span of the call running on this thread, if any."""
+    return getattr(_local, 'span', None)
+
+def last_record():
+    """Trace record of the last call finished on this thread, or None.
+
+    Provider-answered calls carry input_tokens/output_tokens, with
+    usage_estimated set when the provider reported none.
+    """
+    return getattr(_local, 'last_record', None)
+
+def traced_call(provider, model, template, text, fn):
+    """Run fn() (a cached model call) inside a span and write its trace record.
+
+    Calls that only record a batch request (fn() returns None) are not traced;
+    their results are traced when the batch is merged.
+    """
+    span = Span(provider, model, template, text)
+    _local.span = span
+    _local.last_record = None
+    try:
+        response = fn()
+    except Exception as e:
+        span.finish(None, error=f"{type(e).__name__}: {e}"[:500])
+        raise
+    finally:
+        _local.span = None
+    if response is not None:
+        span.finish(response)
+    return response
+
+def add_usage(input_tokens=None, output_tokens=None, cached_input_tokens=None):
+    """Attach provider-reported usage to the current call, if it is traced."""
+    span = current()
+    if span is not None:
+        span.usage(input_tokens, output_tokens, cached_input_tokens)
+
+def note_sent():
+    span = current()
+    if span is not None:
+        span.sent()
+
+def note_retry():
+    span = current()
+    if span is not None:
+        span.retry()
+
+def add_provider_time(seconds):
+    """Attach the duration of one provider request attempt to the current call."""
+    span = current()
+    if span is not None:
+        span.provider_time(seconds)
+
+def record_batch_result(fields, input_tokens, output_tokens, cached_input_tokens=0):
+    """Write the trace record of one response merged from a batch job."""
+    write({
+        'ts': round(time.time(), 3),
+        'run_id': RUN_ID,
+        'provider': fields['provider'],
+        'model': fields['model'],
+        'family': family_of(fields['prompt_hash']),
+        'file': document_name(fields['document_hash']),
+        'prompt_hash': fields['prompt_hash'],
+        'document_hash': fields['document_hash'],
+        'cache_hit': False,
+        'batch': True,
+        'latency_seconds': None,
+        'provider_seconds': None,
+        'queue_seconds': None,
+        'retries': 0,
+        'error': None,
+        'input_tokens': input_tokens,
+        'output_tokens': output_tokens,
+        'cached_input_tokens': cached_input_tokens or 0,
+        'usage_estimated': False
+    })
+
+def price(model):
+    """Return (input, output, cached input) USD per million tokens, or None if unknown."""
+    matches = [prefix for prefix in PRICES if model.startswith(prefix)]
+    return PRICES[max(matches, key=len)] if matches else None
+
+def call_cost(record):
+    """Dollar cost of one traced call (0 for cache hits, None for unknown models)."""
+    if record.get('cache_hit'):
+        return 0.0
+    prices = price(record['model'])
+    if prices is None:
+        return None
+    input_price, output_price, cached_price = prices
+    cached = record.get('cached_input_tokens') or 0
+    cost = (
+        max(0, (record.get('input_tokens') or 0) - cached) * input_price
+        + cached * cached_price
+        + (record.get('output_tokens') or 0) * output_price
+    ) / 1e6
+    return cost * BATCH_DISCOUNT if record.get('batch') else cost
+
+def load_trace(path=None, run_id=None):
+    """Load a trace as a DataFrame; run_id 'latest' keeps only the last run, None keeps all."""
+    with open(path or TRACE_PATH, 'r') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df
+    if run_id == 'latest':
+        run_id = df['run_id'].iloc[-1]
+    if run_id is not None:
+        df = df[df['run_id'] == run_id]
+    df = df.copy()
+    for column in ('input_tokens', 'output_tokens', 'cached_input_tokens'):
+        if column not in df:
+            df[column] = 0
+        df[column] = df[column].fillna(0)
+    # Traces written before provider time was recorded have no latency split
+    for column in ('provider_seconds', 'queue_seconds'):
+        if column not in df:
+            df[column] = float('nan')
+    df['cost_usd'] = [call_cost(record) for record in df.to_dict('records')]
+    df['family'] = df['family'].fillna('unknown')
+    df['file'] = df['file'].fillna('unknown')
+    return df
+
+def summarize(df, by):
+    """Aggregate calls by the given columns: counts, tokens, latency percentiles and cost.
+
+    Latency percentiles are of provider time (provider_seconds) for calls
+    that reached the provider; time spent queueing for the rate limiter or
+    backing off is reported separately as mean_queue_seconds.
+    """
+    summary = df.groupby(by).agg(
+        calls=('provider', 'size'),
+        cache_hits=('cache_hit', 'sum'),
+        errors=('error', lambda errors: errors.notna().sum()),
+        retries=('retries', 'sum'),
+        input_tokens=('input_tokens', 'sum'),
+        output_tokens=('output_tokens', 'sum'),
+        cached_input_tokens=('cached_input_tokens', 'sum'),
+        mean_queue_seconds=('queue_seconds', 'mean'),
+        cost_usd=('cost_usd', lambda costs: costs.sum(min_count=1))
+    )
+    quantiles = {0.5: 'p50_seconds', 0.95: 'p95_seconds', 0.99: 'p99_seconds'}
+    sent = df[~df['cache_hit'] & df['provider_seconds'].notna()]
+    if sent.empty:
+        # All cache hits or batch results: there is no latency to report
+        for column in quantiles.values():
+            summary[column] = float('nan')
+    else:
+        latency = sent.groupby(by)['provider_seconds'].quantile(list(quantiles)).unstack()
+        summary = summary.join(latency.reindex(columns=list(quantiles)).rename(columns=quantiles))
+    summary = summary.round({
+        'mean_queue_seconds': 3, 'p50_seconds': 3, 'p95_seconds': 3, 'p99_seconds': 3, 'cost_usd': 4
+    })
+    return summary.sort_values('cost_usd', ascending=False)
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize the model-call trace: tokens, latency and cost')
+    parser.add_argument('--trace', default=TRACE_PATH, help='Trace file (default: %(default)s)')
+    parser.add_argument('--run', default='latest', help="Run id to summarize, 'latest' (default) or 'all'")
+    parser.add_argument('--top-files', type=int, default=20, help='Most expensive files to list')
+    parser.add_argument('--output', help='Also write the per-file summary to this CSV')
+    args = parser.parse_args()
+
+    df = load_trace(args.trace, None if args.run == 'all' else args.run)
+    if df.empty:
+        print("No calls in the trace")
+        sys.exit(1)
+
+    pd.set_option('display.width', 200)
+    pd.set_option('display.max_columns', 20)
+    runs = df['run_id'].unique()
+    print(f"Run: {runs[0] if len(runs) == 1 else f'{len(runs)} runs'}")
+    print(f"Calls: {len(df)}, cache hits: {int(df['cache_hit'].sum())}, "
+          f"total cost: ${df['cost_usd'].sum():.4f}")
+    unknown = sorted(df[df['cost_usd'].isna()]['model'].unique())
+    if unknown:
+        print(f"No prices for: {', '.join(unknown)}")
+
+    print("\nBy provider/model:")
+    print(summarize(df, ['provider', 'model']).to_string())
+    print("\nBy prompt family:")
+    print(summarize(df, ['family']).to_string())
+    by_file = summarize(df, ['file'])
+    print(f"\nBy file (top {args.top_files} by cost):")
+    print(by_file.head(args.top_files).to_string())
+    if args.output:
+        by_file.to_csv(args.output)
+        print(f"\nPer-file summary saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# Long-running daemon that watches a folder and pushes new or changed PDFs
+# through the engine (engine.py) as soon as they have finished landing,
+# appending their results to the per-task result logs.
+#
+# The folder is polled with os.scandir, which costs one stat per entry, so a
+# short interval is cheap. A file is picked up once its size and mtime have
+# stopped changing for WATCH_SETTLE_SECONDS and it ends with the PDF %%EOF
+# marker (a copy still in progress has neither).
+import os
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tasks
+import circuit_breaker
+from engine import Engine, write_outputs
+from pdf_text import extract_text_from_pdf, sha256_bytes
+
+# Seconds between scans of the folder
+POLL_SECONDS = float(os.getenv('WATCH_POLL_SECONDS', '1'))
+
+# Seconds a file's size and mtime must stay unchanged before it is processed
+SETTLE_SECONDS = float(os.getenv('WATCH_SETTLE_SECONDS', '2'))
+
+# A settled file without %%EOF is processed anyway after this long (it may just be unusual)
+MAX_SETTLE_SECONDS = float(os.getenv('WATCH_MAX_SETTLE_SECONDS', '60'))
+
+# Files processed at once; their model calls share the engine's global cap
+MAX_FILES_IN_FLIGHT = int(os.getenv('WATCH_FILES_IN_FLIGHT', '8'))
+
+# Signature and content hash of every processed file, so restarts skip them
+STATE_PATH = '.watch_state.json'
+
+def load_state(state_path):
+    """Load the processed-file state, or an empty state."""
+    if os.path.exists(state_path):
+        with open(state_path, 'r') as f:
+            return json.load(f)
+    return {'files': {}}
+
+def save_state(state, state_path):
+    """Atomically persist the processed-file state."""
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+def scan(folder):
+    """Return {file name: [size, mtime_ns]} for the PDFs in a folder."""
+    found = {}
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.name.lower().endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.is_file():
+                found[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return found
+
+def has_eof_marker(path):
+    """True when the last KB of a file holds the %%EOF marker every complete PDF ends with."""
+    try:
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 1024))
+            return b'%%EOF' in f.read()
+    except OSError:
+        return False
+
+class FolderWatcher:
+    """Reports files that are new or changed since processed and have stopped changing."""
+
+    def __init__(self, folder, processed, settle_seconds=None, max_settle_seconds=None):
+        self.folder = folder
+        self.processed = processed
+        self.settle_seconds = SETTLE_SECONDS if settle_seconds is None else settle_seconds
+        self.max_settle_seconds = MAX_SETTLE_SECONDS if max_settle_seconds is None else max_settle_seconds
+        # File name -> (signature, time it was first seen with that signature)
+        self.settling = {}
+
+    def poll(self, busy=()):
+        """Return [(file name, signature)] ready to process; files in busy are left for later."""
+        now = time.monotonic()
+        found = scan(self.folder)
+        for name in list(self.settling):
+            if name not in found:
+                del self.settling[name]
+        ready = []
+        for name, signature in found.items():
+            if name in busy or self.processed.get(name, {}).get('signature') == signature:
+                continue
+            seen = self.settling.get(name)
+            if seen is None or seen[0] != signature:
+                # New or still being written: (re)start its settle timer
+                self.settling[name] = (signature, now)
+                continue
+            waited = now - seen[1]
+            if waited < self.settle_seconds:
+                continue
+            if waited < self.max_settle_seconds and not has_eof_marker(os.path.join(self.folder, name)):
+                continue
+            del self.settling[name]
+            ready.append((name, signature))
+        return ready
+
+class WatchDaemon:
+    """Processes every ready file through the engine and records it in the state."""
+
+    def __init__(self, folder, task_names, state_path=None, structured=False, select_pages=False):
+        self.folder = folder
+        self.state_path = state_path or STATE_PATH
+        self.state = load_state(self.state_path)
+        # Appends to the existing result logs; files logged before are not redone
+        self.engine = Engine(task_names, resume=True, structured=structured, select_pages=select_pages)
+        self.watcher = FolderWatcher(folder, self.state['files'])
+        self.in_flight = set()
+        self.slots = asyncio.Semaphore(MAX_FILES_IN_FLIGHT)
+        self.processed = 0
+
+    def adopt_logged_files(self):
+        """Mark files every task has already logged (e.g. by a batch run) as processed."""
+        adopted = 0
+        for name, signature in scan(self.folder).items():
+            if name in self.state['files']:
+                continue
+            if all(log.is_done(name) for log in self.engine.logs.values()):
+                self.state['files'][name] = {'signature': signature, 'sha256': None}
+                adopted += 1
+        if adopted:
+            save_state(self.state, self.state_path)
+            print(f"{adopted} files already in the result logs will not be reprocessed")
+
+    def mark_processed(self, name, signature, digest, error=None):
+        entry = {'signature': signature, 'sha256': digest}
+        if error:
+            # Retried only once the file changes again
+            entry['error'] = error
+        self.state['files'][name] = entry
+        save_state(self.state, self.state_path)
+
+    async def process(self, name, signature):
+        path = os.path.join(self.folder, name)
+        try:
+            async with self.slots:
+                with open(path, 'rb') as f:
+                    digest = sha256_bytes(f.read())
+                previous = self.state['files'].get(name)
+                if previous and previous.get('sha256') == digest and not previous.get('error'):
+                    # Touched or copied over with the same bytes: nothing to redo
+                    self.mark_processed(name, signature, digest)
+                    return
+                for log in self.engine.logs.values():
+                    # Answers logged for an earlier version of the file no longer apply
+                    log.discard_units(name)
+                text = await asyncio.get_running_loop().run_in_executor(None, extract_text_from_pdf, path)
+                results = await self.engine.run_file(path, text, self.engine.task_names)
+                self.engine.record(results)
+        except FileNotFoundError:
+            print(f"{name}: removed before it could be processed")
+            return
+        except Exception as e:
+            print(f"{name}: failed: {e}")
+            self.mark_processed(name, signature, None, error=str(e))
+            return
+        finally:
+            self.in_flight.discard(name)
+        self.mark_processed(name, signature, digest)
+        self.processed += 1
+        failed = [task for task, result in results.items() if result.get('backfill') or result.get('error')]
+        status = f", failed calls in {', '.join(failed)}" if failed else ""
+        print(f"{name}: {len(results)} tasks done {time.time() - signature[1] / 1e9:.1f}s after landing{status}")
+
+    async def run(self, once=False):
+        """Poll until stopped (SIGINT/SIGTERM), or with once until the folder has been drained."""
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        pending = set()
+        print(f"Watching {self.folder} for PDFs ({', '.join(self.engine.task_names)}); Ctrl-C to stop")
+        while not stop.is_set():
+            for name, signature in self.watcher.poll(busy=self.in_flight):
+                self.in_flight.add(name)
+                task = asyncio.create_task(self.process(name, signature))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if once and not pending and not self.watcher.settling:
+                break
+            try:
+                await asyncio.wait_for(stop.wait(), POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+        if pending:
+            print(f"Stopping: finishing {len(pending)} files in flight")
+            await asyncio.gather(*pending)
+
+    def close(self):
+        self.engine.close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Watch a folder and process new or changed PDFs as they land")
+    parser.add_argument('--dir', default='invoices', help="Folder to watch (default: %(default)s)")
+    parser.add_argument('--tasks', nargs='+', metavar='TASK',
+                        help="Tasks to run on each file (default: every task whose prompt exists)")
+    parser.add_argument('--state', default=STATE_PATH, help="Processed-file state (default: %(default)s)")
+    parser.add_argument('--select-pages', action='store_true',
+                        help="Send only the pages relevant to each task")
+    parser.add_argument('--structured', action='store_true',
+                        help="Ask for schema-constrained JSON instead of tagged answers")
+    parser.add_argument('--once', action='store_true',
+                        help="Process what is in the folder now, then exit")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    task_names = args.tasks or tasks.available_tasks()
+    daemon = WatchDaemon(args.dir, task_names, args.state, args.structured, args.select_pages)
+    try:
+        daemon.adopt_logged_files()
+        asyncio.run(daemon.run(once=args.once))
+    finally:
+        daemon.close()
+    print(f"Processed {daemon.processed} files")
+    for name in task_names:
+        write_outputs(name)
+    print(f"Circuit breakers: {circuit_breaker.summary()}")
+
+if __name__ == "__main__":
+    main()